@@ -3,23 +3,50 @@ Quick script to add a student to the face recognition dataset.
 
 Usage:
     python add_student_to_dataset.py <student_name> <image_path>
+    python add_student_to_dataset.py --enroll <student_name> <image_path> [image_path2] ...
+    python add_student_to_dataset.py --enroll-existing <student_name>
+    python add_student_to_dataset.py --unenroll <student_name>
     
 Example:
     python add_student_to_dataset.py "John" "path/to/john.jpg"
     python add_student_to_dataset.py "Jane" "path/to/jane1.jpg" "path/to/jane2.jpg"
+    python add_student_to_dataset.py --enroll "Jane" "path/to/jane1.jpg"
+
+With --enroll the images are copied and then embedded into the running
+deepface_scan.py service via /enroll, so no restart or /reload is needed.
+--enroll-existing embeds the images already in the student's dataset folder
+(nothing is copied; images the service has already indexed are skipped).
+--unenroll removes the student's vectors from the running service.
+The service URL defaults to http://127.0.0.1:5000 (override with DF_SERVICE_URL).
 """
 
+import json
 import os
 import sys
 import shutil
+import urllib.error
+import urllib.request
 from pathlib import Path
 
 # Get the script directory
 SCRIPT_DIR = Path(__file__).parent
 DATASET_DIR = SCRIPT_DIR / "dataset"
+SERVICE_URL = os.getenv("DF_SERVICE_URL", "http://127.0.0.1:5000")
+# Same extensions the service reads from the dataset folder
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def next_free_number(student_dir):
+    """Return the first unused numeric filename stem so existing photos are never overwritten."""
+    taken = {int(p.stem) for p in student_dir.iterdir() if p.stem.isdigit()}
+    number = 1
+    while number in taken:
+        number += 1
+    return number
 
-def add_student_images(student_name, image_paths):
-    """Add images for a student to the dataset."""
+
+def add_student_images(student_name, image_paths, enroll=False):
+    """Add images for a student to the dataset. Returns the list of copied paths."""
     
     # Create student directory if it doesn't exist
     student_dir = DATASET_DIR / student_name
@@ -28,8 +55,8 @@ def add_student_images(student_name, image_paths):
     print(f"📁 Student directory: {student_dir}")
     
     # Copy each image to the student directory
-    copied = 0
-    for idx, img_path in enumerate(image_paths, start=1):
+    copied = []
+    for img_path in image_paths:
         img_file = Path(img_path)
         
         if not img_file.exists():
@@ -40,40 +67,132 @@ def add_student_images(student_name, image_paths):
         ext = img_file.suffix or '.jpg'
         
         # Copy to student directory with numbered filename
-        dest_path = student_dir / f"{idx}{ext}"
+        dest_path = student_dir / f"{next_free_number(student_dir)}{ext}"
         shutil.copy2(img_file, dest_path)
         
         print(f"✅ Copied: {img_file.name} → {dest_path.name}")
-        copied += 1
+        copied.append(dest_path)
     
-    if copied > 0:
-        print(f"\n✅ Successfully added {copied} image(s) for {student_name}")
+    if copied:
+        print(f"\n✅ Successfully added {len(copied)} image(s) for {student_name}")
         print(f"📍 Location: {student_dir}")
-        print("\n⚠️  IMPORTANT: Restart the deepface_scan.py server to rebuild the face database!")
-        print("   Run: python deepface_scan.py")
+        if not enroll:
+            print("\n⚠️  IMPORTANT: Enroll the new images so the running server can match them:")
+            print(f'   Run: python add_student_to_dataset.py --enroll-existing "{student_name}"')
+            print("   (or restart deepface_scan.py / POST /reload to rebuild the face database)")
     else:
         print(f"\n❌ No images were added for {student_name}")
     
-    return copied > 0
+    return copied
+
+
+def existing_student_images(student_name):
+    """Images already in the student's dataset folder."""
+    student_dir = DATASET_DIR / student_name
+    if not student_dir.is_dir():
+        return []
+    return sorted(p for p in student_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+
+
+def post_to_service(endpoint, payload):
+    """POST JSON to the recognition service and return the decoded response."""
+    req = urllib.request.Request(
+        f"{SERVICE_URL.rstrip('/')}{endpoint}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        try:
+            return json.loads(e.read().decode("utf-8"))
+        except ValueError:
+            return {"success": False, "error": f"HTTP {e.code}"}
+    except urllib.error.URLError as e:
+        return {"success": False, "error": f"Service unreachable at {SERVICE_URL}: {e.reason}"}
+
+
+def enroll_student(student_name, image_paths):
+    """Embed dataset images of a student (already on disk) into the running service's index."""
+    print(f"\n🔄 Enrolling {student_name} into {SERVICE_URL} ...")
+    result = post_to_service("/enroll", {
+        "name": student_name,
+        "paths": [str(p.resolve()) for p in image_paths],
+        "db_path": str(DATASET_DIR.resolve()),
+    })
+    if result.get("success"):
+        print(
+            f"✅ Enrolled {result.get('added')} image(s), skipped {result.get('skipped')}, "
+            f"already enrolled {result.get('already_enrolled', 0)} (index size: {result.get('index_size')})"
+        )
+        return True
+    print(f"❌ Enrollment failed: {result.get('error') or result}")
+    print("   The images are in the dataset; POST /reload or restart deepface_scan.py to pick them up.")
+    return False
+
+
+def unenroll_student(student_name):
+    """Remove a student's vectors from the running service's index."""
+    result = post_to_service("/unenroll", {
+        "name": student_name,
+        "db_path": str(DATASET_DIR.resolve()),
+    })
+    if result.get("success"):
+        print(f"✅ Removed {result.get('removed')} vector(s) for {student_name} (index size: {result.get('index_size')})")
+        return True
+    print(f"❌ Unenroll failed: {result.get('error') or result}")
+    return False
+
+
+def print_usage():
+    print("\nUsage:")
+    print("  python add_student_to_dataset.py [--enroll] <student_name> <image_path1> [image_path2] ...")
+    print("  python add_student_to_dataset.py --enroll-existing <student_name>")
+    print("  python add_student_to_dataset.py --unenroll <student_name>")
+    print("\nExample:")
+    print('  python add_student_to_dataset.py "NewStudent" "photo1.jpg" "photo2.jpg"')
+    print('  python add_student_to_dataset.py --enroll "NewStudent" "photo1.jpg"')
 
 
 def main():
-    if len(sys.argv) < 3:
+    args = sys.argv[1:]
+    
+    if args and args[0] in ("--unenroll", "--enroll-existing"):
+        if len(args) != 2:
+            print(f"❌ Error: {args[0]} takes exactly one student name")
+            print_usage()
+            sys.exit(1)
+        if args[0] == "--unenroll":
+            sys.exit(0 if unenroll_student(args[1]) else 1)
+        images = existing_student_images(args[1])
+        if not images:
+            print(f"❌ No images found in {DATASET_DIR / args[1]}")
+            sys.exit(1)
+        sys.exit(0 if enroll_student(args[1], images) else 1)
+    
+    enroll = bool(args) and args[0] == "--enroll"
+    if enroll:
+        args = args[1:]
+    
+    if len(args) < 2:
         print("❌ Error: Not enough arguments")
-        print("\nUsage:")
-        print("  python add_student_to_dataset.py <student_name> <image_path1> [image_path2] ...")
-        print("\nExample:")
-        print('  python add_student_to_dataset.py "NewStudent" "photo1.jpg" "photo2.jpg"')
+        print_usage()
         sys.exit(1)
     
-    student_name = sys.argv[1]
-    image_paths = sys.argv[2:]
+    student_name = args[0]
+    image_paths = args[1:]
     
     print(f"\n🎓 Adding student: {student_name}")
     print(f"📸 Images to add: {len(image_paths)}")
     print("-" * 50)
     
-    success = add_student_images(student_name, image_paths)
+    copied = add_student_images(student_name, image_paths, enroll=enroll)
+    success = bool(copied)
+    
+    if success and enroll:
+        success = enroll_student(student_name, copied)
     
     if success:
         sys.exit(0)
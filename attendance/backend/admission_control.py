@@ -0,0 +1,131 @@
+"""
+Deadline-aware admission control for the recognition stage.
+
+Every request carries a deadline. At most ``concurrency`` requests run
+recognition at once and at most ``max_queue`` wait for a slot, in arrival
+order. A request that would have to queue is shed immediately when the queue
+is full or when the estimated wait plus one service time overruns its
+deadline, and a queued request gives up as soon as it could no longer finish
+in time. Answering "retry later" at once beats answering after the student
+has walked away.
+
+Service time is an exponentially weighted moving average of how long admitted
+requests held their slot; it drives both the wait estimate and the
+Retry-After hint given to shed clients. A request that finds a free slot and
+an empty queue is always admitted, so a stale estimate can never shut out an
+idle service.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+from recognition_metrics import LATENCY_MS_BUCKETS, Counter, Histogram
+
+# Shed reasons
+QUEUE_FULL = 'queue_full'
+DEADLINE = 'deadline'
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; ``retry_after`` is the estimated seconds until a slot frees up."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request shed ({reason}); retry in ~{retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded FIFO of requests waiting for one of ``concurrency`` recognition slots."""
+
+    def __init__(self, concurrency: int, max_queue: int, initial_service_ms: float = 500.0, smoothing: float = 0.2):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.smoothing = smoothing
+        self.service_sec = max(0.0, initial_service_ms) / 1000.0
+        self._cond = threading.Condition()
+        self._queue: Deque[object] = deque()
+        self._running = 0
+        self.admitted = 0
+        self.queue_wait_ms = Histogram('df_admission_wait_ms', 'Time a request queued for a recognition slot (ms)', LATENCY_MS_BUCKETS)
+        self.shed = Counter('df_shed_total', 'Requests shed by admission control', 'reason')
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def estimated_wait(self) -> float:
+        """Seconds until a newly queued request would get a slot (caller holds the lock)."""
+        ahead = self._running + len(self._queue) - self.concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return math.ceil(ahead / self.concurrency) * self.service_sec
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.shed.inc(reason)
+        raise AdmissionRejected(reason, retry_after)
+
+    @contextmanager
+    def admit(self, deadline: float) -> Iterator[None]:
+        """
+        Hold a recognition slot for the duration of the ``with`` block.
+
+        ``deadline`` is a ``time.monotonic()`` timestamp. Raises AdmissionRejected
+        instead of queueing a request that cannot finish by then.
+        """
+        arrived = time.monotonic()
+        with self._cond:
+            if self._running >= self.concurrency or self._queue:
+                if len(self._queue) >= self.max_queue:
+                    self._reject(QUEUE_FULL, self.estimated_wait())
+                wait = self.estimated_wait()
+                if arrived + wait + self.service_sec > deadline:
+                    self._reject(DEADLINE, wait)
+                ticket = object()
+                self._queue.append(ticket)
+                try:
+                    while self._running >= self.concurrency or self._queue[0] is not ticket:
+                        # Latest start that still leaves one service time before the deadline
+                        remaining = deadline - self.service_sec - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(DEADLINE, self.estimated_wait())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            self._running += 1
+            self.admitted += 1
+
+        started = time.monotonic()
+        self.queue_wait_ms.observe((started - arrived) * 1000)
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._running -= 1
+                self.service_sec += self.smoothing * (elapsed - self.service_sec)
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'concurrency': self.concurrency,
+                'max_queue': self.max_queue,
+                'running': self._running,
+                'queued': len(self._queue),
+                'service_ms': round(self.service_sec * 1000, 1),
+                'estimated_wait_ms': round(self.estimated_wait() * 1000, 1),
+                'admitted': self.admitted,
+                'shed': self.shed.snapshot(),
+                'queue_wait_ms': self.queue_wait_ms.snapshot()
+            }
@@ -16,17 +16,41 @@ import base64
 import os
 import logging
 import gc
-from typing import Optional, Tuple, Dict, Any
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import json
+import math
+import pickle
+import queue
+import shutil
+import tempfile
+import time
+import zlib
+from typing import Optional, Tuple, Dict, Any, List, Callable, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import threading
 
-# MongoDB Atlas connection
-from mongo_connect import get_mongo_db
-
 import cv2  # type: ignore
 import numpy as np
-from flask import Flask, jsonify, request
-from deepface import DeepFace  # type: ignore
+from flask import Flask, Request, Response, jsonify, request
+
+import embedding_store
+from admission_control import AdmissionController, AdmissionRejected
+from face_tracking import TrackRegistry, appearance_signature, combine_track_stats
+from frame_preprocessing import PreprocessEngine, parse_stages
+from face_index import (
+    PROTOTYPE_MODES, STORAGE_MODES, FaceIndex, IVFSearcher, PrototypeSearcher, QuantizedSearcher,
+    l2_normalize, measure_recall, sample_index
+)
+from index_registry import GalleryKey, IndexRegistry
+from recognition_metrics import (
+    BATCH_SIZE_BUCKETS, DISTANCE_BUCKETS, LATENCY_MS_BUCKETS,
+    Counter, Gauge, Histogram, process_memory_bytes, render_prometheus
+)
+from recognition_stream import RecognitionStreamServer
+from result_cache import ResultCache
 
 # ============================================================================
 # LOGGING SETUP
@@ -42,12 +66,15 @@ logger = logging.getLogger(__name__)
 # CONFIGURATION
 # ============================================================================
 
-# Initialize MongoDB connection (optional: use in endpoints as needed)
-mongo_db = get_mongo_db()
+# MongoDB handle, connected on first use (see get_mongo)
+_mongo_db = None
 
-# Thread pool for async processing
-executor = ThreadPoolExecutor(max_workers=4)
+# Serializes the ArcFace forward pass (a shared TensorFlow model is not thread-safe).
+# Decoding, preprocessing and matching run outside of it.
 processing_lock = threading.Lock()
+# Serializes the face detector (OpenCV cascades / RetinaFace keep mutable state)
+detection_lock = threading.Lock()
+model_init_lock = threading.Lock()
 
 # Paths and directories
 # Use module-relative dataset path by default to avoid cwd issues
@@ -62,39 +89,189 @@ DETECTOR_BACKEND = os.getenv("DF_DETECTOR", "opencv")  # opencv is much faster t
 DISTANCE_METRIC = os.getenv("DF_DISTANCE", "cosine")
 # Threshold for face matching
 COSINE_THRESHOLD = float(os.getenv("DF_COSINE_THRESHOLD", "0.68"))
+# Number of nearest gallery rows inspected per detected face
+INDEX_TOP_K = int(os.getenv("DF_INDEX_TOP_K", "5"))
+# Matching backend: "exact" (flat scan) or "ivf" (approximate, for campus-scale galleries)
+INDEX_BACKEND = os.getenv("DF_INDEX_BACKEND", "exact").lower()
+IVF_LISTS = int(os.getenv("DF_IVF_LISTS", "0"))  # 0 = 4 * sqrt(gallery size)
+IVF_PROBE = int(os.getenv("DF_IVF_PROBE", "8"))
+# Smaller galleries always use the exact scan
+IVF_MIN_SIZE = int(os.getenv("DF_IVF_MIN_SIZE", "10000"))
+# Gallery rows sampled as queries to estimate IVF/quantized recall after each build
+IVF_RECALL_SAMPLE = int(os.getenv("DF_IVF_RECALL_SAMPLE", "256"))
+# Copy scanned by the exact backend: "float32" (the store itself) or "int8"; the best DF_RERANK
+# rows per face are then re-scored against the float32 store. int8 is not faster than float32
+# and only saves memory once the store's pages read to build it have been evicted.
+INDEX_STORAGE = os.getenv("DF_INDEX_STORAGE", "float32").lower()
+if INDEX_STORAGE != "float32" and INDEX_STORAGE not in STORAGE_MODES:
+    logger.warning(f"DF_INDEX_STORAGE={INDEX_STORAGE} is not supported (use float32 or int8); using float32")
+    INDEX_STORAGE = "float32"
+RERANK = int(os.getenv("DF_RERANK", "32"))
+# Gallery rows copied into memory to estimate int8 recall (instead of an exact scan of the whole store)
+QUANTIZED_RECALL_ROWS = int(os.getenv("DF_QUANTIZED_RECALL_ROWS", "4096"))
+# Per-student prototypes for full-gallery search: "off", "mean", or "auto" (up to DF_PROTOTYPE_MAX
+# centroids, added while a student's photos spread wider than DF_PROTOTYPE_SPREAD). Photos farther
+# than DF_OUTLIER_DISTANCE from their student's mean are dropped; the DF_PROTOTYPE_EXPAND closest
+# students are then searched photo by photo. Takes precedence over IVF and DF_INDEX_STORAGE.
+PROTOTYPE_MODE = os.getenv("DF_PROTOTYPES", "off").lower()
+PROTOTYPE_MAX = int(os.getenv("DF_PROTOTYPE_MAX", "3"))
+PROTOTYPE_SPREAD = float(os.getenv("DF_PROTOTYPE_SPREAD", "0.2"))
+PROTOTYPE_EXPAND = int(os.getenv("DF_PROTOTYPE_EXPAND", "5"))
+OUTLIER_DISTANCE = float(os.getenv("DF_OUTLIER_DISTANCE", "0.4"))
 
 # Processing parameters
 FRAME_WIDTH = 320
 FRAME_HEIGHT = 240
-TIMEOUT_SEC = 8
+# Default deadline for a recognition request when the client sends none (X-Deadline-Ms header)
+TIMEOUT_SEC = float(os.getenv("DF_TIMEOUT_SEC", "8"))
+# Preprocessing before detection: "adaptive" picks a path per frame from its luminance/contrast;
+# otherwise a fixed stage list ("equalize,clahe"; "none" passes frames through in color)
+PREPROCESS_MODE = os.getenv("DF_PREPROCESS", "adaptive").strip().lower()
+PREPROCESS_STAGES = parse_stages("equalize,clahe" if PREPROCESS_MODE == "adaptive" else PREPROCESS_MODE)
+# Adaptive thresholds on a 64x48 grayscale thumbnail (0-255)
+LOW_LIGHT_MEAN = float(os.getenv("DF_LOW_LIGHT_MEAN", "70"))
+LOW_CONTRAST_STD = float(os.getenv("DF_LOW_CONTRAST_STD", "35"))
+# Recognition worker processes (0 = recognize inside the waitress threads)
+RECOGNITION_WORKERS = int(os.getenv("DF_WORKERS", "0"))
+# Requests allowed in flight (running + queued) before /match answers 503
+RECOGNITION_QUEUE_DEPTH = int(os.getenv("DF_QUEUE_DEPTH", str(max(4, 2 * RECOGNITION_WORKERS))))
+# Embedding micro-batching: concurrent requests arriving within the window share one forward pass
+BATCH_MAX_SIZE = int(os.getenv("DF_BATCH_MAX_SIZE", "16"))
+BATCH_WINDOW_MS = float(os.getenv("DF_BATCH_WINDOW_MS", "5"))
+BATCH_QUEUE_DEPTH = int(os.getenv("DF_BATCH_QUEUE_DEPTH", "256"))
+
+# Admission control in front of recognition: requests running at once. In-process, enough
+# requests must run together to fill an embedding batch; with workers, one per worker
+ADMIT_CONCURRENCY = int(os.getenv("DF_ADMIT_CONCURRENCY", str(RECOGNITION_WORKERS or max(2, BATCH_MAX_SIZE))))
+# Requests waiting for a slot. Shedding is decided by each request's deadline against the
+# estimated wait (see admission_control.py); this only caps the threads parked in the queue
+ADMIT_QUEUE = int(os.getenv("DF_ADMIT_QUEUE", str(max(64, 4 * ADMIT_CONCURRENCY))))
+# Service-time estimate used until the first request has been measured
+ADMIT_INITIAL_SERVICE_MS = float(os.getenv("DF_ADMIT_INITIAL_SERVICE_MS", "500"))
+
+# Classroom photos keep more resolution so small faces stay detectable
+GROUP_MAX_SIDE = int(os.getenv("DF_GROUP_MAX_SIDE", "1920"))
+# Candidates per face considered for one-to-one assignment in /match-group
+GROUP_TOP_K = int(os.getenv("DF_GROUP_TOP_K", "10"))
+
+# Streaming (WebSocket) recognition for kiosks; DF_STREAM_PORT=0 disables it
+STREAM_PORT = int(os.getenv("DF_STREAM_PORT", "5001"))
+STREAM_MAX_CLIENTS = int(os.getenv("DF_STREAM_MAX_CLIENTS", "16"))
+
+# Per-device face tracking: reuse a track's identity instead of re-embedding every frame
+TRACK_IOU = float(os.getenv("DF_TRACK_IOU", "0.5"))
+# Largest mean thumbnail difference (0-1) at which a face still counts as the tracked face
+TRACK_MAX_APPEARANCE_DIFF = float(os.getenv("DF_TRACK_MAX_APPEARANCE_DIFF", "0.08"))
+TRACK_MAX_AGE_SEC = float(os.getenv("DF_TRACK_MAX_AGE_SEC", "2.0"))  # re-embed at least this often
+TRACK_DECAY = float(os.getenv("DF_TRACK_DECAY", "0.9"))  # confidence multiplier per reused frame
+TRACK_MIN_CONFIDENCE = float(os.getenv("DF_TRACK_MIN_CONFIDENCE", "0.35"))
+TRACK_MAX_DEVICES = int(os.getenv("DF_TRACK_MAX_DEVICES", "256"))
+TRACK_DEVICE_TTL_SEC = float(os.getenv("DF_TRACK_DEVICE_TTL_SEC", "300"))
+
+# Quality gate run before embedding (DF_QUALITY_GATE=0 disables it)
+QUALITY_GATE = os.getenv("DF_QUALITY_GATE", "1") == "1"
+GATE_MIN_BRIGHTNESS = float(os.getenv("DF_GATE_MIN_BRIGHTNESS", "40"))  # mean gray level, 0-255
+GATE_MAX_BRIGHTNESS = float(os.getenv("DF_GATE_MAX_BRIGHTNESS", "220"))
+GATE_MIN_SHARPNESS = float(os.getenv("DF_GATE_MIN_SHARPNESS", "30"))  # Laplacian variance of the face region
+GATE_MIN_FACE_PX = int(os.getenv("DF_GATE_MIN_FACE_PX", "32"))  # shorter side of the face box, in resized-frame pixels
+
+# Dummy crops pushed through the model once at startup (see warm_up_models)
+WARMUP_BATCH = int(os.getenv("DF_WARMUP_BATCH", "4"))
+# Retry-After (seconds) suggested to clients while startup (or a worker pool restart) is still running
+STARTUP_RETRY_AFTER_SEC = int(os.getenv("DF_STARTUP_RETRY_AFTER_SEC", "5"))
+
+# Results of recent /match submissions, keyed by a hash of the uploaded bytes (DF_RESULT_CACHE_SIZE=0 disables)
+RESULT_CACHE_SIZE = int(os.getenv("DF_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_SEC = float(os.getenv("DF_RESULT_CACHE_TTL_SEC", "30"))
+
+# Resident galleries (one index per dataset folder): memory budget shared by all of them, and how
+# often (seconds) a gallery's folder and embedding store are re-checked for changes
+GALLERY_MEMORY_MB = float(os.getenv("DF_GALLERY_MEMORY_MB", "2048"))
+GALLERY_CHECK_SEC = float(os.getenv("DF_GALLERY_CHECK_SEC", "2"))
+
+# Serializes index writers (enroll, unenroll, the persist+publish step of a rebuild, publish);
+# readers never take it
+index_lock = threading.Lock()
+
+# Approximate searchers, keyed by absolute dataset path: (index they were built for, searcher)
+_searchers: Dict[str, Tuple[FaceIndex, IVFSearcher]] = {}
+_searcher_stats: Dict[str, Dict[str, Any]] = {}
+# Index each background searcher build is running for, keyed like _searchers
+_searcher_builds: Dict[str, FaceIndex] = {}
+searcher_lock = threading.Lock()
+
+# Section rosters ({section: [student ids]}), keyed by absolute dataset path
+_sections: Dict[str, Dict[str, List[str]]] = {}
+sections_lock = threading.Lock()
+search_ms = Histogram('df_index_search_ms', 'Nearest-neighbour search time per request (ms)', LATENCY_MS_BUCKETS)
+
+# Per-stage latency of the recognition pipeline (pool workers return theirs with each result, see _worker_telemetry)
+STAGES_TIMED = ('decode', 'preprocess', 'detect', 'embed', 'match', 'total')
+stage_ms = {
+    stage: Histogram(f'df_{stage}_ms', f'Time spent in the {stage} stage per request (ms)', LATENCY_MS_BUCKETS)
+    for stage in STAGES_TIMED
+}
+lock_wait_ms = Histogram('df_model_lock_wait_ms', 'Time waiting for processing_lock before a forward pass (ms)', LATENCY_MS_BUCKETS)
+best_distance = Histogram('df_best_distance', 'Best cosine distance per detected face, before thresholding', DISTANCE_BUCKETS)
+recognition_outcomes = Counter('df_recognitions_total', 'Recognition requests by outcome', 'outcome')
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SEC)
+
+# Bounded, deadline-aware queue in front of the recognition stage
+admission = AdmissionController(ADMIT_CONCURRENCY, ADMIT_QUEUE, initial_service_ms=ADMIT_INITIAL_SERVICE_MS)
+
+# Per-thread CLAHE instance and scratch buffers for preprocessing
+preprocess_engine = PreprocessEngine(
+    PREPROCESS_STAGES,
+    adaptive=PREPROCESS_MODE == "adaptive",
+    low_light_mean=LOW_LIGHT_MEAN,
+    low_contrast_std=LOW_CONTRAST_STD
+)
+
+face_tracks = TrackRegistry(
+    iou_threshold=TRACK_IOU,
+    max_appearance_diff=TRACK_MAX_APPEARANCE_DIFF,
+    max_age=TRACK_MAX_AGE_SEC,
+    decay=TRACK_DECAY,
+    min_confidence=TRACK_MIN_CONFIDENCE,
+    max_devices=TRACK_MAX_DEVICES,
+    device_ttl=TRACK_DEVICE_TTL_SEC
+)
+
+# Recognition model built once per process (see build_models)
+_recognition_model = None
+
+
+def get_mongo():
+    """MongoDB database handle, connecting on first use (recognition itself never needs it)."""
+    global _mongo_db
+    if _mongo_db is None:
+        from mongo_connect import get_mongo_db
+        _mongo_db = get_mongo_db()
+    return _mongo_db
+
+# ============================================================================
 # PREPROCESSING FUNCTIONS
 # ============================================================================
 
 def preprocess_frame_for_recognition(frame_bgr: np.ndarray) -> np.ndarray:
     """
-    Preprocess frame for low-light conditions:
-    1. Convert BGR to grayscale
-    2. Apply histogram equalization
-    3. Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    4. Convert back to BGR for DeepFace compatibility
-    """
-    if frame_bgr is None or frame_bgr.size == 0:
-        return frame_bgr
-    
-    # Convert to grayscale
-    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
-    
-    # Apply histogram equalization
-    equalized = cv2.equalizeHist(gray)
+    Preprocess frame for low-light conditions.
     
-    # Apply CLAHE for better low-light enhancement
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced = clahe.apply(equalized)
+    In adaptive mode (DF_PREPROCESS=adaptive) the path depends on the frame:
+    - well lit: passed through in color
+    - low contrast: CLAHE on the L channel of LAB, keeping color
+    - dark: grayscale, histogram equalization, CLAHE, back to BGR
     
-    # Convert back to BGR
-    bgr_enhanced = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
-    
-    return bgr_enhanced
+    The result is written into this thread's reusable buffer, so it is only
+    valid until the thread's next call.
+    """
+    return preprocess_engine.enhance(frame_bgr)
+
+
+def preprocess_with_path(frame_bgr: np.ndarray) -> Tuple[np.ndarray, str]:
+    """``preprocess_frame_for_recognition`` that also returns the path taken."""
+    return preprocess_engine.enhance_with_path(frame_bgr)
 
 
 def resize_frame(frame: np.ndarray, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT) -> np.ndarray:
@@ -104,256 +281,1892 @@ def resize_frame(frame: np.ndarray, width: int = FRAME_WIDTH, height: int = FRAM
     return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
 
 
-def decode_base64_image(base64_str: str) -> Optional[np.ndarray]:
-    """Decode base64 string to OpenCV image (BGR)."""
+def resize_max_side(frame: np.ndarray, max_side: int = GROUP_MAX_SIDE) -> Tuple[np.ndarray, float]:
+    """Downscale so the longer side is at most ``max_side``; returns (frame, scale)."""
+    if frame is None or frame.size == 0:
+        return frame, 1.0
+    scale = max_side / float(max(frame.shape[:2]))
+    if scale >= 1.0:
+        return frame, 1.0
+    new_size = (int(frame.shape[1] * scale), int(frame.shape[0] * scale))
+    return cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA), scale
+
+
+def content_digest(buffers: Sequence[Any]) -> bytes:
+    """
+    128-bit BLAKE2b digest of the encoded uploads of one request.
+    
+    Only a byte-identical re-submission (a client retry) hashes the same;
+    another capture of the same scene, or of another student, never does.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for buffer in buffers:
+        data = buffer.encode('utf-8') if isinstance(buffer, str) else buffer
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.digest()
+
+
+def frame_exposure_issue(gray: np.ndarray) -> Optional[str]:
+    """Return "too_dark"/"too_bright" when the frame's mean luminance is unusable, else None."""
+    brightness = float(cv2.mean(cv2.resize(gray, (64, 48), interpolation=cv2.INTER_AREA))[0])
+    if brightness < GATE_MIN_BRIGHTNESS:
+        return 'too_dark'
+    if brightness > GATE_MAX_BRIGHTNESS:
+        return 'too_bright'
+    return None
+
+
+def face_quality_issue(gray: np.ndarray, facial_area: Dict[str, Any]) -> Optional[str]:
+    """Return "too_small"/"too_blurry" for a face that is not worth embedding, else None."""
+    x, y, w, h = (int(facial_area.get(key, 0)) for key in ('x', 'y', 'w', 'h'))
+    if min(w, h) < GATE_MIN_FACE_PX:
+        return 'too_small'
+    region = gray[max(0, y):y + h, max(0, x):x + w]
+    if region.size and cv2.Laplacian(region, cv2.CV_64F).var() < GATE_MIN_SHARPNESS:
+        return 'too_blurry'
+    return None
+
+
+def decode_image_buffer(buffer) -> Optional[np.ndarray]:
+    """Decode encoded image bytes (bytes, memoryview or bytearray) to an OpenCV image (BGR) without copying them."""
+    try:
+        # Zero-copy view over the request buffer
+        nparr = np.frombuffer(buffer, dtype=np.uint8)
+        
+        # Decode image
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        
+        if frame is None or frame.size == 0:
+            logger.warning("Failed to decode image: empty or invalid")
+            return None
+        
+        return frame
+    except Exception as e:
+        logger.error(f"Image decoding failed: {e}")
+        return None
+
+
+def decode_base64_image(base64_str: str) -> Optional[np.ndarray]:
+    """Decode base64 string to OpenCV image (BGR)."""
+    try:
+        # Handle data URI format
+        if base64_str.startswith('data:'):
+            base64_str = base64_str.split(',', 1)[1]
+        
+        # Decode base64
+        image_data = base64.b64decode(base64_str, validate=True)
+    except Exception as e:
+        logger.error(f"Base64 decoding failed: {e}")
+        return None
+    
+    return decode_image_buffer(image_data)
+
+
+# ============================================================================
+# EMBEDDING INDEX
+# ============================================================================
+
+def list_representation_files(db_path: str) -> list[str]:
+    try:
+        return [f for f in os.listdir(db_path) if f.lower().endswith('.pkl')]
+    except Exception:
+        return []
+
+
+def pick_representation_file(db_path: str) -> Optional[str]:
+    """Return the DeepFace pickle for the configured model, if one exists."""
+    files = sorted(list_representation_files(db_path))
+    if not files:
+        return None
+    model_key = MODEL_NAME.lower()
+    for name in files:
+        if model_key in name.lower():
+            return os.path.join(db_path, name)
+    return os.path.join(db_path, files[0])
+
+
+def load_representation_records(pkl_path: str) -> list:
+    """
+    Read (identity_path, embedding) pairs from a DeepFace representation pickle.
+
+    Handles both the legacy list-of-lists layout and the newer list-of-dicts layout.
+    """
+    with open(pkl_path, 'rb') as f:
+        representations = pickle.load(f)
+
+    records = []
+    for entry in representations or []:
+        if isinstance(entry, dict):
+            records.append((entry.get('identity'), entry.get('embedding')))
+        elif isinstance(entry, (list, tuple)) and len(entry) >= 2:
+            records.append((entry[0], entry[1]))
+    return records
+
+
+def store_dir_for(db_path: str) -> str:
+    """Embedding store for the configured model/detector (hidden, so it is not mistaken for a student)."""
+    return os.path.join(db_path, '.embeddings', f"{MODEL_NAME.lower()}_{DETECTOR_BACKEND.lower()}")
+
+
+def open_stored_index(db_path: str) -> Optional[FaceIndex]:
+    """Map the current store version read-only; None if no store exists yet."""
+    stored = embedding_store.open_store(store_dir_for(db_path))
+    if stored is None:
+        return None
+    if stored.header.get('model') != MODEL_NAME or stored.header.get('detector') != DETECTOR_BACKEND:
+        logger.warning(f"Ignoring embedding store built for {stored.header.get('model')}/{stored.header.get('detector')}")
+        return None
+    return FaceIndex(
+        stored.vectors,
+        stored.identities,
+        stored.paths,
+        model_name=MODEL_NAME,
+        version=stored.version,
+        normalized=True,
+    )
+
+
+def persist_index(index: FaceIndex, db_path: str, fingerprint: str = "") -> FaceIndex:
+    """
+    Write ``index`` as a new store version and return it re-opened from disk.
+    
+    The returned index is memory-mapped, so its matrix lives in the shared page
+    cache rather than on this process's heap. ``fingerprint`` is the
+    dataset_fingerprint the index was built from; it walks every image, so only
+    full rebuilds compute it (enroll/unenroll record "" for "not known").
+    """
+    embedding_store.write_store(
+        store_dir_for(db_path),
+        np.asarray(index.vectors, dtype=np.float32),
+        list(index.identities),
+        list(index.paths),
+        model=MODEL_NAME,
+        detector=DETECTOR_BACKEND,
+        fingerprint=fingerprint,
+    )
+    return open_stored_index(db_path) or index
+
+
+def store_matches_dataset(db_path: str) -> Optional[bool]:
+    """
+    Whether the store was built from the dataset as it is now, or None when
+    unknown (no store, or last written by enroll/unenroll). Walks and stats
+    every image, so it is never called on the request path.
+    """
+    recorded = (embedding_store.store_summary(store_dir_for(db_path)) or {}).get('fingerprint')
+    if not recorded:
+        return None
+    return recorded == embedding_store.dataset_fingerprint(db_path)
+
+
+def gallery_key(db_path: str) -> GalleryKey:
+    return (os.path.abspath(db_path), MODEL_NAME, DETECTOR_BACKEND)
+
+
+def gallery_stamp(key: GalleryKey) -> Tuple[int, int]:
+    """
+    What a resident gallery was loaded from: the dataset folder's mtime (students
+    added or removed) and the store's version pointer (a new store version written,
+    e.g. by tools/ingest_dataset.py or another process).
+    """
+    stamps = []
+    for path in (key[0], os.path.join(store_dir_for(key[0]), embedding_store.CURRENT_FILE)):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(0)
+    return stamps[0], stamps[1]
+
+
+def _drop_searcher(key: GalleryKey) -> None:
+    with searcher_lock:
+        _searchers.pop(key[0], None)
+        _searcher_stats.pop(key[0], None)
+    logger.info(f"Evicted gallery {key[0]} from memory")
+
+
+galleries = IndexRegistry(
+    gallery_stamp,
+    int(GALLERY_MEMORY_MB * 1024 * 1024),
+    check_interval=GALLERY_CHECK_SEC,
+    pinned=[gallery_key(DB_PATH)],
+    on_evict=_drop_searcher
+)
+
+
+def resident_index_size(db_path: str) -> int:
+    """Vectors in ``db_path``'s gallery if it is resident (never loads it)."""
+    return len(galleries.peek(gallery_key(db_path)) or ())
+
+
+def publish_index(db_path: str, index: FaceIndex) -> FaceIndex:
+    """
+    Make ``index`` the live index for ``db_path``.
+    
+    Callers must hold ``index_lock``. Requests already matching keep their
+    snapshot; new requests see the new index.
+    """
+    galleries.publish(gallery_key(db_path), index)
+    # Cached results are keyed on the index version; drop the stale ones now
+    result_cache.clear()
+    return index
+
+
+def list_dataset_images(db_path: str) -> List[Tuple[str, str]]:
+    """Return (person_name, image_path) for every image in ``<db_path>/<person>/``."""
+    images = []
+    for person in sorted(os.listdir(db_path)) if os.path.isdir(db_path) else []:
+        person_dir = os.path.join(db_path, person)
+        if person.startswith('.') or not os.path.isdir(person_dir):
+            continue
+        for filename in sorted(os.listdir(person_dir)):
+            if os.path.splitext(filename)[1].lower() in embedding_store.IMAGE_EXTS:
+                images.append((person, os.path.join(person_dir, filename)))
+    return images
+
+
+def build_index_from_dataset(db_path: str, batch_size: int = 32) -> FaceIndex:
+    """Embed every dataset image with the recognition pipeline (batched) into a new FaceIndex."""
+    images = list_dataset_images(db_path)
+    index = FaceIndex.from_records([], model_name=MODEL_NAME)
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        vectors, positions = embed_enrollment_images([cv2.imread(path) for _, path in chunk])
+        if positions:
+            index = index.add(vectors, [chunk[p][0] for p in positions], [chunk[p][1] for p in positions])
+        logger.info(f"Embedded {min(start + batch_size, len(images))}/{len(images)} dataset image(s)")
+    return index
+
+
+def reapply_index_changes(rebuilt: FaceIndex, snapshot: FaceIndex, current: FaceIndex) -> FaceIndex:
+    """
+    Carry enroll/unenroll changes made to the live index (``snapshot`` -> ``current``)
+    while a rebuild was embedding into ``rebuilt``: students removed meanwhile are
+    dropped, and rows added meanwhile are appended unless the rebuild already
+    embedded the same image.
+    """
+    for name in set(snapshot.identities) - set(current.identities):
+        rebuilt = rebuilt.remove_identity(name)
+    before = {os.path.abspath(str(path)) for path in snapshot.paths}
+    have = {os.path.abspath(str(path)) for path in rebuilt.paths}
+    added = [
+        row for row, path in enumerate(current.paths)
+        if os.path.abspath(str(path)) not in before and os.path.abspath(str(path)) not in have
+    ]
+    if added:
+        rebuilt = rebuilt.add(
+            np.asarray(current.vectors[added], dtype=np.float32),
+            [str(current.identities[row]) for row in added],
+            [str(current.paths[row]) for row in added]
+        )
+    return rebuilt
+
+
+def rebuild_representations(db_path: str) -> Dict[str, Any]:
+    """Re-embed the whole dataset and replace the embedding store and live index."""
+    try:
+        logger.info(f"Rebuilding embedding store for: {db_path}")
+        start = time.perf_counter()
+        # What enroll/unenroll changes during the (slow, unlocked) embedding are compared against
+        snapshot = galleries.peek(gallery_key(db_path))
+        # Taken before embedding, so images added meanwhile make the store read as stale
+        fingerprint = embedding_store.dataset_fingerprint(db_path)
+        rebuilt = build_index_from_dataset(db_path)
+        with index_lock:
+            current = galleries.peek(gallery_key(db_path))
+            if snapshot is not None and current is not None and current is not snapshot:
+                rebuilt = reapply_index_changes(rebuilt, snapshot, current)
+            index = persist_index(rebuilt, db_path, fingerprint)
+            publish_index(db_path, index)
+        summary = embedding_store.store_summary(store_dir_for(db_path))
+        logger.info(f"Embedding store rebuilt in {time.perf_counter() - start:.1f}s: {summary}")
+        return {"success": True, "store": summary, "index_size": len(index)}
+    except Exception as e:
+        logger.error(f"Failed to rebuild representations: {e}")
+        return {"success": False, "error": str(e)}
+
+
+def load_index(db_path: str, rebuild_if_missing: bool = True) -> FaceIndex:
+    """
+    Load the dataset's embeddings into a resident FaceIndex.
+
+    Order of preference: the memory-mapped embedding store, a legacy DeepFace
+    representation pickle (converted into a store once), then a full rebuild.
+    """
+    try:
+        index = open_stored_index(db_path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable embedding store for {db_path}: {e}")
+        index = None
+
+    if index is not None:
+        logger.info(f"Mapped embedding store for {db_path}: {len(index)} vectors, dim={index.dim}, version={index.version}")
+        with index_lock:
+            return publish_index(db_path, index)
+
+    pkl_path = pick_representation_file(db_path) if os.path.exists(db_path) else None
+    if pkl_path is not None:
+        index = FaceIndex.from_records(load_representation_records(pkl_path), model_name=MODEL_NAME)
+        logger.info(f"Converting DeepFace pickle {pkl_path} into an embedding store: {len(index)} vectors")
+        if len(index):
+            try:
+                index = persist_index(index, db_path)
+            except Exception as e:
+                logger.warning(f"Failed to write embedding store for {db_path}: {e}")
+    elif rebuild_if_missing and os.path.exists(db_path):
+        # A successful rebuild publishes the fresh index itself
+        rebuild_representations(db_path)
+        rebuilt = galleries.peek(gallery_key(db_path))
+        if rebuilt is not None:
+            return rebuilt
+        index = FaceIndex.from_records([], model_name=MODEL_NAME)
+    else:
+        logger.warning(f"No embeddings for {db_path}; index is empty")
+        index = FaceIndex.from_records([], model_name=MODEL_NAME)
+
+    with index_lock:
+        return publish_index(db_path, index)
+
+
+def get_index(db_path: str) -> FaceIndex:
+    """
+    Return the resident index for ``db_path``, loading it on first use only.
+    
+    A gallery whose folder or store changed since it was loaded is re-mapped
+    from its store (never re-embedded here; POST /reload does that).
+    """
+    key = gallery_key(db_path)
+    index = galleries.get(key)
+    if index is not None and not galleries.is_stale(key):
+        return index
+    with galleries.load_lock(key):
+        current = galleries.get(key)
+        if current is not None and current is not index:
+            # Another request loaded or refreshed it while we waited
+            return current
+        if index is not None:
+            logger.info(f"Gallery {db_path} changed on disk; re-mapping its embedding store")
+        return load_index(db_path, rebuild_if_missing=index is None)
+
+
+def get_searcher(db_path: str, index: FaceIndex) -> Optional[Any]:
+    """
+    Return the prototype, IVF or quantized searcher for ``index``, or None to use
+    the exact float32 scan.
+    
+    Searchers are built on a background thread, never on the request path: until
+    the one for the current index is ready (and swapped in atomically), queries
+    use the exact scan of the current index, which is slower but never stale.
+    Rebuilds start from the previous searcher: IVF centroids are reused (rows
+    are only reassigned) until the gallery doubles in size, and prototypes of
+    unchanged students are kept. Galleries too small for IVF fall back to
+    DF_INDEX_STORAGE.
+    """
+    use_prototypes = PROTOTYPE_MODE in PROTOTYPE_MODES
+    use_ivf = not use_prototypes and INDEX_BACKEND == 'ivf' and len(index) >= IVF_MIN_SIZE
+    if not len(index) or not (use_prototypes or use_ivf or INDEX_STORAGE in STORAGE_MODES):
+        return None
+    key = os.path.abspath(db_path)
+    cached = _searchers.get(key)
+    if cached is not None and cached[0] is index:
+        return cached[1]
+    
+    with searcher_lock:
+        cached = _searchers.get(key)
+        if cached is not None and cached[0] is index:
+            return cached[1]
+        if key not in _searcher_builds:
+            _searcher_builds[key] = index
+            threading.Thread(
+                target=_build_searcher, args=(db_path, index, use_prototypes, use_ivf),
+                name='searcher-build', daemon=True
+            ).start()
+    return None
+
+
+def _build_searcher(db_path: str, index: FaceIndex, use_prototypes: bool, use_ivf: bool) -> None:
+    """Build the searcher for ``index`` and swap it in, unless the gallery was evicted meanwhile."""
+    key = os.path.abspath(db_path)
+    try:
+        cached = _searchers.get(key)
+        previous = cached[1] if cached is not None else None
+        if use_prototypes:
+            searcher = PrototypeSearcher(
+                index,
+                PROTOTYPE_MODE,
+                max_prototypes=PROTOTYPE_MAX,
+                spread=PROTOTYPE_SPREAD,
+                expand=PROTOTYPE_EXPAND,
+                outlier_distance=OUTLIER_DISTANCE,
+                previous=previous if isinstance(previous, PrototypeSearcher) else None
+            )
+        elif use_ivf:
+            if not isinstance(previous, IVFSearcher) or previous.centroids.shape[1] != index.dim or len(index) > 2 * previous.trained_on:
+                previous = None
+            searcher = IVFSearcher(
+                index.vectors,
+                n_lists=IVF_LISTS,
+                n_probe=IVF_PROBE,
+                centroids=previous.centroids if previous is not None else None,
+                trained_on=previous.trained_on if previous is not None else 0
+            )
+        else:
+            searcher = QuantizedSearcher(index.vectors, INDEX_STORAGE, rerank=RERANK)
+        
+        if isinstance(searcher, QuantizedSearcher):
+            # Recall on a small in-memory sample: an exact scan of the whole store would
+            # page all of it back in right after building the int8 copy
+            measured = sample_index(index, QUANTIZED_RECALL_ROWS)
+            measured_searcher = QuantizedSearcher(measured.vectors, INDEX_STORAGE, rerank=RERANK)
+        else:
+            measured, measured_searcher = index, searcher
+        sample = np.random.default_rng(0).choice(len(measured), min(IVF_RECALL_SAMPLE, len(measured)), replace=False)
+        recall = measure_recall(measured, measured_searcher, np.asarray(measured.vectors[np.sort(sample)]), k=INDEX_TOP_K)
+        stats = {**searcher.stats(), 'index_version': index.version, f'recall_at_{INDEX_TOP_K}': round(recall, 4)}
+        with searcher_lock:
+            # An evicted gallery must not be resurrected by a build that was already running
+            if galleries.peek(gallery_key(db_path)) is not None:
+                _searcher_stats[key] = stats
+                _searchers[key] = (index, searcher)
+        logger.info(f"{type(searcher).__name__} built for {db_path}: {stats}")
+    except Exception as e:
+        logger.error(f"Searcher build failed for {db_path}: {e}")
+    finally:
+        with searcher_lock:
+            _searcher_builds.pop(key, None)
+
+
+def search_stats(db_path: str) -> Dict[str, Any]:
+    stats = {'backend': INDEX_BACKEND, 'storage': INDEX_STORAGE, 'prototypes': PROTOTYPE_MODE, 'query_ms': search_ms.snapshot()}
+    stats.update(_searcher_stats.get(os.path.abspath(db_path), {}))
+    stats['building'] = os.path.abspath(db_path) in _searcher_builds
+    return stats
+
+
+# ============================================================================
+# SECTION ROSTERS
+# ============================================================================
+
+def sections_file_for(db_path: str) -> str:
+    return os.path.join(db_path, '.embeddings', 'sections.json')
+
+
+def get_sections(db_path: str) -> Dict[str, List[str]]:
+    """Return the section rosters of a dataset, reading them from disk on first use."""
+    key = os.path.abspath(db_path)
+    sections = _sections.get(key)
+    if sections is None:
+        try:
+            with open(sections_file_for(db_path), 'r', encoding='utf-8') as f:
+                sections = {str(name): [str(s) for s in students] for name, students in json.load(f).items()}
+        except FileNotFoundError:
+            sections = {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable section rosters for {db_path}: {e}")
+            sections = {}
+        _sections[key] = sections
+    return sections
+
+
+def set_section(db_path: str, section: str, students: Sequence[str]) -> Dict[str, List[str]]:
+    """Replace one section's roster (an empty roster removes it) and persist every roster."""
+    with sections_lock:
+        sections = dict(get_sections(db_path))
+        if students:
+            sections[section] = sorted(set(students))
+        else:
+            sections.pop(section, None)
+        path = sections_file_for(db_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(sections, f, indent=2)
+        os.replace(tmp_path, path)
+        _sections[os.path.abspath(db_path)] = sections
+    return sections
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def resolve_candidates(db_path: str, options: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    """
+    Student IDs a request is restricted to, or None to search the whole gallery.
+    
+    Combines an explicit "candidates" list (a list, or a comma-separated string
+    from form fields and query strings) with the roster of a "section" key.
+    
+    Raises:
+        KeyError: the section has no registered roster
+    """
+    candidates = options.get('candidates')
+    if isinstance(candidates, str):
+        candidates = [c.strip() for c in candidates.split(',') if c.strip()]
+    section = options.get('section')
+    if not candidates and not section:
+        return None
+    
+    ids = {str(c) for c in candidates or []}
+    if section:
+        roster = get_sections(db_path).get(str(section))
+        if roster is None:
+            raise KeyError(str(section))
+        ids.update(roster)
+    return tuple(sorted(ids))
+
+
+# ============================================================================
+# RECOGNITION PIPELINE (detect -> embed -> match)
+# ============================================================================
+
+class RecognitionBusy(Exception):
+    """
+    Raised when a request is shed by admission control, a bounded recognition
+    queue (worker pool or embedding batcher) is full, or the service is still
+    starting; ``retry_after`` is a hint in seconds and ``reason`` a short code.
+    """
+    
+    def __init__(self, message: str, retry_after: float = 1.0, reason: str = 'busy'):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class QualityRejected(Exception):
+    """Raised when no frame passes the quality gate; ``reason`` is a code such as "no_face" or "too_dark"."""
+    
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def deepface_module():
+    """Import DeepFace (and with it TensorFlow) on first use; the import alone takes seconds."""
+    from deepface import DeepFace  # type: ignore
+    return DeepFace
+
+
+def build_models() -> None:
+    """Build the detector and recognition model once so requests only run inference."""
+    global _recognition_model
+    with model_init_lock:
+        if _recognition_model is not None:
+            return
+        start = time.perf_counter()
+        DeepFace = deepface_module()
+        _recognition_model = DeepFace.build_model(MODEL_NAME)
+        # A first detection call makes DeepFace cache the detector backend
+        dummy = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        with detection_lock:
+            DeepFace.extract_faces(
+                img_path=dummy,
+                detector_backend=DETECTOR_BACKEND,
+                enforce_detection=False
+            )
+        logger.info(f"Models ready: {MODEL_NAME} + {DETECTOR_BACKEND} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def get_recognition_model():
+    if _recognition_model is None:
+        build_models()
+    return _recognition_model
+
+
+def warm_up_models(batch_size: int = WARMUP_BATCH) -> None:
+    """Run one forward pass on a dummy batch so the first request does not pay for TensorFlow's first-call setup."""
+    model = get_recognition_model()
+    height, width = _model_input_size(model)
+    embed_faces([np.zeros((height, width, 3), dtype=np.float32)] * max(1, batch_size))
+
+
+def _model_input_size(model) -> Tuple[int, int]:
+    """Return (height, width) expected by the recognition model."""
+    shape = getattr(model, 'input_shape', None)
+    if shape is None:
+        shape = getattr(model, 'model', model).input_shape[1:3]
+    return int(shape[0]), int(shape[1])
+
+
+def _fit_to_input(face: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+    """Resize a face crop to the model input, keeping aspect ratio and zero-padding (as DeepFace does)."""
+    if face.dtype == np.uint8:
+        face = face.astype(np.float32) / 255.0
+    else:
+        face = face.astype(np.float32, copy=False)
+
+    target_h, target_w = target_size
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    new_w = max(1, int(face.shape[1] * factor))
+    new_h = max(1, int(face.shape[0] * factor))
+    resized = cv2.resize(face, (new_w, new_h))
+
+    fitted = np.zeros((target_h, target_w, 3), dtype=np.float32)
+    top = (target_h - new_h) // 2
+    left = (target_w - new_w) // 2
+    fitted[top:top + new_h, left:left + new_w] = resized
+    return fitted
+
+
+def detect_faces(frame_bgr: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Detect and align faces in a preprocessed BGR frame.
+
+    Returns:
+        List of {"face": RGB float crop in [0, 1], "facial_area": {x, y, w, h}, "confidence": float}
+    """
+    if frame_bgr is None or frame_bgr.size == 0:
+        return []
+    get_recognition_model()
+    with detection_lock:
+        faces = deepface_module().extract_faces(
+            img_path=frame_bgr,
+            detector_backend=DETECTOR_BACKEND,
+            enforce_detection=False,
+            align=True
+        )
+    return [f for f in faces or [] if f.get('face') is not None]
+
+
+def embed_faces(crops: List[np.ndarray]) -> np.ndarray:
+    """Embed face crops with a single batched forward pass; returns L2-normalized float32 rows."""
+    if not crops:
+        return np.zeros((0, 0), dtype=np.float32)
+    model = get_recognition_model()
+    target_size = _model_input_size(model)
+    batch = np.stack([_fit_to_input(crop, target_size) for crop in crops])
+
+    keras_model = getattr(model, 'model', model)
+    waiting = time.perf_counter()
+    with processing_lock:
+        lock_wait_ms.observe((time.perf_counter() - waiting) * 1000)
+        output = keras_model(batch, training=False)
+    output = output.numpy() if hasattr(output, 'numpy') else np.asarray(output)
+    return l2_normalize(output)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers into one forward pass.
+    
+    The first queued request opens a window of ``window_ms``; requests arriving
+    inside it are merged until ``max_batch_size`` crops are collected. The batch
+    runs once and every caller gets back exactly its own rows.
+    """
+    
+    def __init__(self, embed_fn: Callable, max_batch_size: int, window_ms: float, queue_depth: int):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window_sec = max(0.0, window_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[List[np.ndarray], Future, float]]" = queue.Queue(maxsize=queue_depth)
+        self.batch_sizes = Histogram('df_embed_batch_size', 'Face crops per embedding forward pass', BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram('df_embed_queue_wait_ms', 'Time a request waited for its embedding batch (ms)', LATENCY_MS_BUCKETS)
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+    
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+    
+    def embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Embed ``crops`` as part of the next batch; blocks until the batch has run."""
+        if not crops:
+            return embed_faces(crops)
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((crops, future, time.perf_counter()))
+        except queue.Full:
+            raise RecognitionBusy(f"Embedding queue full ({self._queue.maxsize} requests)")
+        return future.result()
+    
+    def _collect(self) -> List[Tuple[List[np.ndarray], Future, float]]:
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.perf_counter() + self.window_sec
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+    
+    def _run(self) -> None:
+        while True:
+            pending = self._collect()
+            started = time.perf_counter()
+            crops = []
+            for request_crops, _, enqueued in pending:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+                crops.extend(request_crops)
+            self.batch_sizes.observe(len(crops))
+            
+            try:
+                vectors = self.embed_fn(crops)
+            except Exception as e:
+                for _, future, _ in pending:
+                    future.set_exception(e)
+                continue
+            
+            offset = 0
+            for request_crops, future, _ in pending:
+                future.set_result(vectors[offset:offset + len(request_crops)])
+                offset += len(request_crops)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.window_sec * 1000,
+            'queue_size': self.queue_size,
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot()
+        }
+
+
+embedding_batcher: Optional[EmbeddingBatcher] = None
+
+
+def start_embedding_batcher() -> None:
+    """Start coalescing request embeddings (in-process recognition only; DF_BATCH_MAX_SIZE=1 disables)."""
+    global embedding_batcher
+    if embedding_batcher is not None or BATCH_MAX_SIZE <= 1:
+        return
+    embedding_batcher = EmbeddingBatcher(embed_faces, BATCH_MAX_SIZE, BATCH_WINDOW_MS, BATCH_QUEUE_DEPTH)
+    logger.info(f"Embedding batcher started: max batch {BATCH_MAX_SIZE}, window {BATCH_WINDOW_MS} ms, queue {BATCH_QUEUE_DEPTH}")
+
+
+def embed_request_faces(crops: List[np.ndarray]) -> np.ndarray:
+    """Embedding stage for request paths: goes through the batcher when it is running."""
+    if embedding_batcher is None:
+        return embed_faces(crops)
+    return embedding_batcher.embed(crops)
+
+
+def match_embeddings(
+    vectors: np.ndarray,
+    db_path: str,
+    cosine_threshold: float = COSINE_THRESHOLD,
+    k: int = INDEX_TOP_K,
+    candidates: Optional[Sequence[str]] = None,
+    fallback: bool = False
+) -> List[List[Tuple[str, float]]]:
+    """
+    Match embeddings against the resident index.
+    
+    With ``candidates`` only those students' rows are searched; ``fallback``
+    then re-searches the full gallery for faces that matched none of them.
+
+    Returns:
+        For each input vector, the (person_name, distance) candidates within the
+        threshold, sorted by ascending distance
+    """
+    index = get_index(db_path)
+    if len(index) == 0 or vectors is None or len(vectors) == 0:
+        return [[] for _ in range(0 if vectors is None else len(vectors))]
+
+    start = time.perf_counter()
+    if candidates is None:
+        searcher = get_searcher(db_path, index)
+        rows, distances = (searcher or index).search_batch(vectors, k=k)
+    else:
+        searcher = get_searcher(db_path, index)
+        if isinstance(searcher, QuantizedSearcher):
+            # Scored on the int8 copy too, so only the roster's shortlisted float32 rows are paged in
+            rows, distances = searcher.search_batch(vectors, k=k, rows=index.subset_rows(candidates))
+        else:
+            # Roster subsets are small; scanned exactly
+            rows, distances = index.search_batch(vectors, k=k, identities=candidates)
+    search_ms.observe((time.perf_counter() - start) * 1000)
+    for face_distances in distances:
+        if len(face_distances) and np.isfinite(face_distances[0]):
+            best_distance.observe(float(face_distances[0]))
+    matches = []
+    for face_rows, face_distances in zip(rows, distances):
+        keep = face_distances <= cosine_threshold
+        matches.append([
+            (str(index.identities[row]), float(distance))
+            for row, distance in zip(face_rows[keep], face_distances[keep])
+        ])
+    
+    if candidates is not None and fallback:
+        missing = [position for position, face_matches in enumerate(matches) if not face_matches]
+        if missing:
+            for position, face_matches in zip(missing, match_embeddings(vectors[missing], db_path, cosine_threshold, k)):
+                matches[position] = face_matches
+    return matches
+
+
+# ============================================================================
+# FACE RECOGNITION FUNCTIONS
+# ============================================================================
+
+def best_face_match(matches: List[List[Tuple[str, float]]]) -> Tuple[Optional[str], float]:
+    """Return the (person_name, distance) closest match across every detected face."""
+    best_name = None
+    best_distance = float('inf')
+    second_best_distance = float('inf')  # Track second-best for confidence gap
+    
+    # Find best and second-best matches across every detected face
+    for face_matches in matches:
+        for person_name, distance in face_matches:
+            if distance < best_distance:
+                second_best_distance = best_distance
+                best_distance = distance
+                best_name = person_name
+            elif distance < second_best_distance:
+                second_best_distance = distance
+    
+    return best_name, best_distance
+
+
+def distance_to_confidence(distance: float) -> float:
+    """Confidence in [0, 1] for a cosine distance (float32 dot products can land just outside [0, 2])."""
+    return min(1.0, max(0.0, 1.0 - float(distance)))
+
+
+def recognize_face_in_frame(
+    frame_bgr: np.ndarray,
+    db_path: str,
+    cosine_threshold: float = COSINE_THRESHOLD,
+    candidates: Optional[Sequence[str]] = None,
+    fallback: bool = False
+) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Recognize a face in a single frame (recognize_multiple_frames with one frame).
+    
+    Returns:
+        Tuple of (person_name, confidence_score in [0, 1]) or (None, None) if no match
+    """
+    return recognize_multiple_frames([frame_bgr], db_path, cosine_threshold, candidates, fallback)
+
+
+def recognize_multiple_frames(
+    frames_bgr: list,
+    db_path: str,
+    cosine_threshold: float = COSINE_THRESHOLD,
+    candidates: Optional[Sequence[str]] = None,
+    fallback: bool = False,
+    device_id: Optional[str] = None
+) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Recognize faces across multiple frames and return best match.
+    
+    Faces from every frame are embedded in one batched forward pass and matched
+    in one index query, so a burst costs close to a single frame. With a
+    ``device_id``, faces that continue one of the device's recent tracks reuse
+    its match and skip embedding.
+    """
+    frames = [f for f in frames_bgr or [] if f is not None and f.size > 0]
+    if not frames:
+        return None, None
+    
+    if len(get_index(db_path)) == 0:
+        logger.error(f"Embedding index is empty for: {db_path}")
+        return None, None
+    
+    try:
+        start = time.perf_counter()
+        crops = []
+        owners = []  # frame position of each detected face
+        boxes = []
+        rejections = []  # quality gate reason codes
+        paths = []  # preprocessing path per frame
+        preprocess_sec = 0.0
+        for position, frame in enumerate(frames):
+            gray = None
+            if QUALITY_GATE:
+                gray = preprocess_engine.buffer('gate_gray', frame.shape[:2])
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+            issue = frame_exposure_issue(gray) if QUALITY_GATE else None
+            if issue:
+                rejections.append(issue)
+                if device_id:
+                    face_tracks.forget(device_id)
+                continue
+            preprocess_start = time.perf_counter()
+            preprocessed, path = preprocess_with_path(frame)
+            preprocess_sec += time.perf_counter() - preprocess_start
+            paths.append(path)
+            faces = detect_faces(preprocessed)
+            if device_id and not any(f.get('confidence', 0) > 0 for f in faces):
+                # Nobody in front of the camera: the next face may be someone else
+                face_tracks.forget(device_id)
+            if QUALITY_GATE:
+                # Confidence 0 is DeepFace's whole-frame fallback when nothing was detected
+                faces = [f for f in faces if f.get('confidence', 0) > 0]
+                if not faces:
+                    rejections.append('no_face')
+                    continue
+            for face in faces:
+                issue = face_quality_issue(gray, face.get('facial_area', {})) if QUALITY_GATE else None
+                if issue:
+                    rejections.append(issue)
+                    continue
+                crops.append(face['face'])
+                owners.append(position)
+                boxes.append(face.get('facial_area', {}))
+        detected = time.perf_counter()
+        
+        if not crops and rejections:
+            # Report the most frequent reason across the burst
+            raise QualityRejected(max(set(rejections), key=rejections.count))
+        
+        # Cached matches are only valid for the same index, threshold and roster
+        context = (get_index(db_path).version, cosine_threshold, candidates, fallback)
+        signatures = [appearance_signature(crop) for crop in crops] if device_id else []
+        face_matches = face_tracks.lookup(device_id, boxes, signatures, context) if device_id else [None] * len(crops)
+        pending = [i for i, cached in enumerate(face_matches) if cached is None]
+        
+        vectors = embed_request_faces([crops[i] for i in pending])
+        embedded = time.perf_counter()
+        
+        fresh = match_embeddings(vectors, db_path, cosine_threshold, candidates=candidates, fallback=fallback)
+        for i, candidates_for_face in zip(pending, fresh):
+            face_matches[i] = candidates_for_face
+        if device_id:
+            face_tracks.record(device_id, [boxes[i] for i in pending], [signatures[i] for i in pending], fresh, context)
+        matched = time.perf_counter()
+        stage_ms['preprocess'].observe(preprocess_sec * 1000)
+        stage_ms['detect'].observe((detected - start - preprocess_sec) * 1000)
+        stage_ms['embed'].observe((embedded - detected) * 1000)
+        stage_ms['match'].observe((matched - embedded) * 1000)
+        logger.info(
+            f"Stages: detect={(detected - start) * 1000:.1f}ms embed={(embedded - detected) * 1000:.1f}ms "
+            f"match={(matched - embedded) * 1000:.1f}ms frames={len(frames)} faces={len(crops)} "
+            f"tracked={len(crops) - len(pending)} preprocess={','.join(paths)}"
+        )
+    except (RecognitionBusy, QualityRejected):
+        raise
+    except Exception as e:
+        # Raised rather than reported as "no match", so the failure is never cached
+        logger.error(f"Face recognition failed: {e}")
+        raise
+    
+    per_frame = [[] for _ in frames]
+    for position, candidates in zip(owners, face_matches):
+        per_frame[position].append(candidates)
+    
+    matches = []
+    for frame_matches in per_frame:
+        name, distance = best_face_match(frame_matches)
+        if name:
+            matches.append((name, distance_to_confidence(distance)))
+    
+    if not matches:
+        logger.info(f"No matching face found in {len(frames)} frame(s) (threshold: {cosine_threshold:.4f})")
+        return None, None
+    
+    # Group by person and average confidence
+    person_scores = {}
+    for name, confidence in matches:
+        if name not in person_scores:
+            person_scores[name] = []
+        person_scores[name].append(confidence)
+    
+    # Find person with highest average confidence
+    best_person = max(person_scores.items(), key=lambda x: np.mean(x[1]))
+    avg_confidence = float(np.mean(best_person[1]))
+    
+    logger.info(f"Best match: {best_person[0]} (avg confidence: {avg_confidence:.4f}, frames: {len(best_person[1])}/{len(frames)})")
+    return best_person[0], avg_confidence
+
+
+def assign_group_matches(matches: List[List[Tuple[str, float]]]) -> List[Optional[Tuple[str, float]]]:
+    """
+    One-to-one assignment of faces to people.
+    
+    Greedily takes the globally closest (face, person) pair first, so a student
+    can be claimed by at most one face and each face gets at most one student.
+    """
+    pairs = sorted(
+        (distance, face_idx, person_name)
+        for face_idx, face_matches in enumerate(matches)
+        for person_name, distance in face_matches
+    )
+    assigned: List[Optional[Tuple[str, float]]] = [None] * len(matches)
+    claimed = set()
+    for distance, face_idx, person_name in pairs:
+        if assigned[face_idx] is not None or person_name in claimed:
+            continue
+        assigned[face_idx] = (person_name, distance)
+        claimed.add(person_name)
+    return assigned
+
+
+def recognize_group(
+    frame_bgr: np.ndarray,
+    db_path: str,
+    cosine_threshold: float = COSINE_THRESHOLD,
+    candidates: Optional[Sequence[str]] = None,
+    fallback: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Recognize every face in a (classroom) photo in one pass.
+    
+    Returns:
+        One entry per detected face: {"student_id", "confidence", "bbox"}; student_id is
+        None for faces that match nobody. Boxes are in the coordinates of ``frame_bgr``.
+    """
+    if frame_bgr is None or frame_bgr.size == 0:
+        return []
+    
+    frame, scale = resize_max_side(frame_bgr)
+    start = time.perf_counter()
+    # Drop DeepFace's whole-frame fallback (confidence 0) when no face is found
+    preprocessed, path = preprocess_with_path(frame)
+    faces = [f for f in detect_faces(preprocessed) if f.get('confidence', 0) > 0]
+    detected = time.perf_counter()
+    
+    vectors = embed_request_faces([f['face'] for f in faces])
+    embedded = time.perf_counter()
+    
+    assignments = assign_group_matches(match_embeddings(
+        vectors, db_path, cosine_threshold, k=GROUP_TOP_K, candidates=candidates, fallback=fallback
+    ))
+    matched = time.perf_counter()
+    logger.info(
+        f"Group stages: detect={(detected - start) * 1000:.1f}ms embed={(embedded - detected) * 1000:.1f}ms "
+        f"match={(matched - embedded) * 1000:.1f}ms faces={len(faces)} preprocess={path}"
+    )
+    
+    results = []
+    for face, assignment in zip(faces, assignments):
+        area = face.get('facial_area', {})
+        bbox = {key: int(round(area.get(key, 0) / scale)) for key in ('x', 'y', 'w', 'h')}
+        if assignment is None:
+            results.append({'student_id': None, 'confidence': None, 'bbox': bbox})
+        else:
+            person_name, distance = assignment
+            results.append({'student_id': person_name, 'confidence': distance_to_confidence(distance), 'bbox': bbox})
+    return results
+
+
+# ============================================================================
+# ENROLLMENT
+# ============================================================================
+
+def is_valid_student_name(name: str) -> bool:
+    """Student names become dataset folder names, so they must be a single path component."""
+    return bool(name) and name not in ('.', '..') and os.path.basename(name) == name and not name.startswith('.')
+
+
+def next_image_path(person_dir: str, ext: str = '.jpg') -> str:
+    """Return the next free numbered image path (1.jpg, 2.jpg, ...) in a student's folder."""
+    taken = set()
+    for filename in os.listdir(person_dir) if os.path.isdir(person_dir) else []:
+        stem, _ = os.path.splitext(filename)
+        if stem.isdigit():
+            taken.add(int(stem))
+    number = 1
+    while number in taken:
+        number += 1
+    return os.path.join(person_dir, f"{number}{ext}")
+
+
+def embed_enrollment_images(images: List[np.ndarray]) -> Tuple[np.ndarray, List[int]]:
+    """
+    Embed the most confident face of each enrollment image in one batched pass.
+    
+    Images where the detector found nothing are skipped: DeepFace then returns
+    the whole frame with confidence 0, which must never become a gallery row.
+    
+    Returns:
+        Tuple of (vectors, positions) where positions are the input images that yielded a face
+    """
+    crops = []
+    positions = []
+    for position, image in enumerate(images):
+        if image is None or image.size == 0:
+            continue
+        faces = [f for f in detect_faces(image) if f.get('confidence', 0) > 0]
+        if not faces:
+            continue
+        best = max(faces, key=lambda f: f['confidence'])
+        crops.append(best['face'])
+        positions.append(position)
+    return embed_faces(crops), positions
+
+
+def enroll_student(
+    name: str,
+    db_path: str,
+    images: Optional[List[np.ndarray]] = None,
+    paths: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Add a student's images to the live index without re-embedding the dataset.
+    
+    ``images`` are written into ``<db_path>/<name>/`` only once they are known
+    to hold a face, and removed again if the index update fails; ``paths`` point
+    at files that are already on disk (e.g. copied by add_student_to_dataset.py).
+    Paths that are already in the index are skipped, so re-sending a student's
+    whole folder only embeds the new images.
+    """
+    person_dir = os.path.join(db_path, name)
+    items = [(None, image) for image in images or []]  # (identity_path, image); None until written
+    
+    indexed = {os.path.abspath(path) for path in get_index(db_path).paths if path} if paths else set()
+    already_enrolled = 0
+    for image_path in paths or []:
+        if os.path.abspath(image_path) in indexed:
+            already_enrolled += 1
+            continue
+        image = cv2.imread(image_path)
+        if image is None:
+            logger.warning(f"Failed to read enrollment image: {image_path}")
+            continue
+        items.append((os.path.abspath(image_path), image))
+    
+    if not items:
+        if already_enrolled:
+            return {
+                "success": True,
+                "name": name,
+                "added": 0,
+                "skipped": 0,
+                "already_enrolled": already_enrolled,
+                "index_size": len(get_index(db_path))
+            }
+        return {"success": False, "error": "No readable images provided"}
+    
+    vectors, positions = embed_enrollment_images([image for _, image in items])
+    if not positions:
+        return {"success": False, "error": "No face found in the provided images"}
+    
+    created_dir = not os.path.isdir(person_dir)
+    written = []
+    rows = []
+    identity_paths = []
+    for row, position in enumerate(positions):
+        image_path, image = items[position]
+        if image_path is None:
+            os.makedirs(person_dir, exist_ok=True)
+            image_path = next_image_path(person_dir)
+            if not cv2.imwrite(image_path, image):
+                logger.warning(f"Failed to write enrollment image: {image_path}")
+                continue
+            written.append(image_path)
+        rows.append(row)
+        identity_paths.append(image_path)
+    
+    if not rows:
+        _remove_enrollment_images(written, person_dir if created_dir else None)
+        return {"success": False, "error": "Failed to write enrollment images"}
+    
+    try:
+        current = get_index(db_path)  # make sure the index is resident before taking the lock
+        with index_lock:
+            current = galleries.peek(gallery_key(db_path)) or current
+            updated = persist_index(current.add(vectors[rows], [name] * len(rows), identity_paths), db_path)
+            publish_index(db_path, updated)
+    except Exception:
+        _remove_enrollment_images(written, person_dir if created_dir else None)
+        raise
+    
+    logger.info(f"Enrolled {name}: {len(rows)}/{len(items)} image(s), index size {len(updated)}")
+    return {
+        "success": True,
+        "name": name,
+        "added": len(rows),
+        "skipped": len(items) - len(rows),
+        "already_enrolled": already_enrolled,
+        "index_size": len(updated)
+    }
+
+
+def _remove_enrollment_images(image_paths: List[str], person_dir: Optional[str]) -> None:
+    """Undo the image writes of a failed enrollment (and the student's folder if it created it)."""
+    for image_path in image_paths:
+        try:
+            os.remove(image_path)
+        except OSError as e:
+            logger.warning(f"Failed to remove enrollment image {image_path}: {e}")
+    if person_dir is not None:
+        try:
+            os.rmdir(person_dir)
+        except OSError:
+            pass
+
+
+def unenroll_student(name: str, db_path: str, delete_images: bool = False) -> Dict[str, Any]:
+    """Remove a student's vectors from the live index (and optionally their dataset folder)."""
+    current = get_index(db_path)
+    with index_lock:
+        current = galleries.peek(gallery_key(db_path)) or current
+        removed = current.count_identity(name)
+        if removed:
+            updated = persist_index(current.remove_identity(name), db_path)
+            publish_index(db_path, updated)
+        else:
+            updated = current
+    
+    person_dir = os.path.join(db_path, name)
+    if delete_images and os.path.isdir(person_dir):
+        shutil.rmtree(person_dir, ignore_errors=True)
+    
+    logger.info(f"Unenrolled {name}: removed {removed} vector(s), index size {len(updated)}")
+    return {"success": True, "name": name, "removed": removed, "index_size": len(updated)}
+
+
+# ============================================================================
+# RECOGNITION WORKER POOL
+# ============================================================================
+
+class RecognitionPool:
+    """
+    Process pool for recognition.
+    
+    Each worker builds its own model once and maps the shared embedding store
+    read-only, so recognition scales with cores instead of serializing on one
+    model lock. Admission is bounded: when ``queue_depth`` requests are already
+    running or queued, new ones are refused immediately.
+    
+    Every worker is its own single-process executor so that requests can be
+    routed: a kiosk's frames (``route`` = its device_id) always go to the same
+    worker, whose TrackRegistry holds that device's tracks. Unrouted requests
+    go to the least busy worker.
+    
+    A worker that dies (OOM kill, segfault in a native library) breaks its
+    executor. The first request to notice replaces it with a fresh one, which is
+    warmed up again in the background; requests caught in the failure are
+    answered busy rather than failing every later request as well.
+    """
+    
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.executors = [self._new_executor() for _ in range(workers)]
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._in_flight = [0] * workers
+        self._count_lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        # (fn, args) of the last warm_up, replayed after a restart
+        self._warm_up_call: Optional[Tuple[Callable, tuple]] = None
+        # Workers being re-warmed, and those whose re-warm broke as well (the next request restarts them again)
+        self._warming: set = set()
+        self._broken: set = set()
+        # Latest stats each worker reported about itself (see report)
+        self.worker_stats: List[Optional[Dict[str, Any]]] = [None] * workers
+        self.restarts = 0
+        self.last_failure: Optional[str] = None
+    
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already holds TensorFlow state is unsafe
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    
+    @property
+    def in_flight(self) -> int:
+        return sum(self._in_flight)
+    
+    def worker_for(self, route: Optional[str] = None) -> int:
+        """The worker ``route`` is pinned to (stable for the pool's lifetime), else the least busy one."""
+        if route:
+            return zlib.crc32(str(route).encode('utf-8')) % self.workers
+        with self._count_lock:
+            return min(range(self.workers), key=self._in_flight.__getitem__)
+    
+    def run(self, worker: int, fn: Callable, *args):
+        """Run ``fn(*args)`` on ``worker`` and wait for the result; raises RecognitionBusy when full or restarting."""
+        if not self._slots.acquire(blocking=False):
+            raise RecognitionBusy(f"{self.queue_depth} recognition requests already in flight")
+        with self._count_lock:
+            self._in_flight[worker] += 1
+        executor = self.executors[worker]
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool as broken:
+            self._restart(worker, executor, broken)
+            raise RecognitionBusy(
+                "Recognition worker died; pool restarting", retry_after=STARTUP_RETRY_AFTER_SEC, reason='worker_restart'
+            )
+        finally:
+            with self._count_lock:
+                self._in_flight[worker] -= 1
+            self._slots.release()
+    
+    def report(self, worker: int, stats: Dict[str, Any]) -> None:
+        """Keep the stats ``worker`` returned with its latest result."""
+        self.worker_stats[worker] = stats
+    
+    def _restart(self, worker: int, broken: ProcessPoolExecutor, error: BaseException) -> None:
+        """Replace ``broken`` with a new executor (once, however many requests saw it fail)."""
+        with self._restart_lock:
+            if self.executors[worker] is not broken:
+                return
+            self.restarts += 1
+            self.last_failure = f"{type(error).__name__}: {error}"
+            logger.error(f"Recognition worker {worker} broken ({self.last_failure}); restarting, restart #{self.restarts}")
+            broken.shutdown(wait=False, cancel_futures=True)
+            executor = self.executors[worker] = self._new_executor()
+            # The new process starts with empty tracks and counters
+            self.worker_stats[worker] = None
+            self._broken.discard(worker)
+            if self._warm_up_call is not None:
+                self._warming.add(worker)
+                threading.Thread(
+                    target=self._rewarm, args=(worker, executor), name=f'pool-rewarm-{worker}', daemon=True
+                ).start()
+    
+    def _rewarm(self, worker: int, executor: ProcessPoolExecutor) -> None:
+        fn, args = self._warm_up_call
+        start = time.perf_counter()
+        try:
+            executor.submit(fn, *args).result()
+            logger.info(f"Recognition worker {worker} re-warmed in {(time.perf_counter() - start) * 1000:.0f} ms")
+        except BrokenProcessPool as e:
+            logger.error(f"Recognition worker {worker} re-warm failed: {e}")
+            if self.executors[worker] is executor:
+                self._broken.add(worker)
+                self.last_failure = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            logger.error(f"Recognition worker {worker} re-warm failed: {e}")
+        finally:
+            if self.executors[worker] is executor:
+                self._warming.discard(worker)
+    
+    def warm_up(self, fn: Callable, *args) -> list:
+        """Run ``fn(*args)`` on every worker (starting its process and model build) and wait for all of them."""
+        self._warm_up_call = (fn, args)
+        futures = [executor.submit(fn, *args) for executor in self.executors]
+        return [future.result() for future in futures]
+    
+    @property
+    def warming(self) -> bool:
+        return bool(self._warming)
+    
+    @property
+    def broken(self) -> bool:
+        return bool(self._broken)
+    
+    @property
+    def healthy(self) -> bool:
+        return not (self._warming or self._broken)
+    
+    def health(self) -> Dict[str, Any]:
+        return {
+            'status': 'broken' if self._broken else 'restarting' if self._warming else 'ok',
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'in_flight_per_worker': list(self._in_flight),
+            'queue_depth': self.queue_depth,
+            'restarts': self.restarts,
+            'last_failure': self.last_failure
+        }
+
+
+recognition_pool: Optional[RecognitionPool] = None
+# Store version each worker last loaded, keyed by absolute db_path (worker processes only)
+_worker_index_versions: Dict[str, int] = {}
+
+
+def _init_worker() -> None:
+    """Worker process start-up: build this process's own model once."""
+    build_models()
+
+
+def _ensure_worker_index(db_path: str, index_version: int) -> None:
+    """Re-map the embedding store when the parent has published a newer index."""
+    key = os.path.abspath(db_path)
+    if galleries.peek(gallery_key(db_path)) is not None and _worker_index_versions.get(key) == index_version:
+        return
+    load_index(db_path, rebuild_if_missing=False)
+    _worker_index_versions[key] = index_version
+
+
+def _worker_histograms() -> List[Histogram]:
+    """Histograms observed inside recognition (in a worker process when the pool is used)."""
+    return [stage_ms[stage] for stage in ('preprocess', 'detect', 'embed', 'match')] + [lock_wait_ms, best_distance, search_ms]
+
+
+def _worker_telemetry() -> Dict[str, Any]:
+    """What this worker observed since its last report, returned alongside each result."""
+    return {
+        'histograms': {histogram.name: histogram.drain() for histogram in _worker_histograms()},
+        'tracking': face_tracks.stats()
+    }
+
+
+def _merge_worker_telemetry(telemetry: Dict[str, Any]) -> None:
+    """Fold a worker's observations into this (the parent's) metrics, so /metrics covers pool mode."""
+    histograms = {histogram.name: histogram for histogram in _worker_histograms()}
+    for name, (counts, total) in telemetry.get('histograms', {}).items():
+        if name in histograms:
+            histograms[name].merge(counts, total)
+
+
+def _worker_warm_up(db_path: str, index_version: int) -> int:
+    _ensure_worker_index(db_path, index_version)
+    # Starts the approximate searcher's background build
+    get_searcher(db_path, get_index(db_path))
+    warm_up_models()
+    # Warm-up passes are not requests; keep them out of the stage histograms
+    _worker_telemetry()
+    return os.getpid()
+
+
+def _worker_recognize_frames(frames: list, db_path: str, threshold: float, index_version: int, *scope):
+    _ensure_worker_index(db_path, index_version)
+    return recognize_multiple_frames(frames, db_path, threshold, *scope), _worker_telemetry()
+
+
+def _worker_recognize_group(frame: np.ndarray, db_path: str, threshold: float, index_version: int, *scope):
+    _ensure_worker_index(db_path, index_version)
+    return recognize_group(frame, db_path, threshold, *scope), _worker_telemetry()
+
+
+def start_recognition_pool(workers: int = RECOGNITION_WORKERS, queue_depth: int = RECOGNITION_QUEUE_DEPTH) -> None:
+    global recognition_pool
+    if workers <= 0 or recognition_pool is not None:
+        return
+    recognition_pool = RecognitionPool(workers, queue_depth)
+    logger.info(f"Recognition pool started: {workers} worker process(es), queue depth {queue_depth}")
+
+
+def run_recognition(
+    worker_fn: Callable,
+    local_fn: Callable,
+    payload,
+    db_path: str,
+    threshold: float,
+    *scope,
+    deadline: Optional[float] = None
+):
+    """
+    Dispatch to the worker pool when it is running, otherwise recognize in this thread.
+    
+    ``scope`` is passed through as (candidates, fallback[, device_id]). The call
+    first waits for an admission slot and raises RecognitionBusy if it cannot
+    start in time for ``deadline`` (a ``time.monotonic()`` timestamp; defaults
+    to TIMEOUT_SEC from now).
+    """
+    require_ready()
+    if deadline is None:
+        deadline = time.monotonic() + TIMEOUT_SEC
+    try:
+        with admission.admit(deadline):
+            if recognition_pool is None:
+                return local_fn(payload, db_path, threshold, *scope)
+            index_version = get_index(db_path).version
+            # scope[2] is the device_id: its tracks live in one worker's registry
+            worker = recognition_pool.worker_for(scope[2] if len(scope) > 2 else None)
+            result, telemetry = recognition_pool.run(worker, worker_fn, payload, db_path, threshold, index_version, *scope)
+            _merge_worker_telemetry(telemetry)
+            recognition_pool.report(worker, telemetry['tracking'])
+            return result
+    except AdmissionRejected as shed:
+        raise RecognitionBusy(str(shed), retry_after=shed.retry_after, reason=shed.reason)
+
+
+def frames_cache_key(digest: Optional[bytes], db_path: str, threshold: float, *scope) -> Optional[tuple]:
+    """
+    ``result_cache`` key of a /match upload: its ``digest`` (see content_digest)
+    with the threshold, roster and index version it is recognized against.
+    None (nothing is cached) without a digest or when the cache is disabled.
+    """
+    require_ready()
+    if digest is None or not result_cache.enabled:
+        return None
+    candidates, fallback = (tuple(scope) + (None, False))[:2]
+    return (digest, os.path.abspath(db_path), get_index(db_path).version, threshold, candidates, fallback)
+
+
+def cached_frames_result(cache_key: Optional[tuple]) -> Optional[Tuple[Optional[str], Optional[float], int]]:
+    """
+    (name, confidence, frames recognized) stored for ``cache_key``, if any.
+    
+    Looked up from the digest of the encoded upload, so a repeat is answered
+    before its frames are decoded or resized, and without admission control.
+    """
+    if cache_key is None:
+        return None
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Result cache hit: {cached[0] or 'no match'}")
+    return cached
+
+
+def recognize_frames_cached(
+    frames: list,
+    db_path: str,
+    threshold: float,
+    *scope,
+    deadline: Optional[float] = None,
+    cache_key: Optional[tuple] = None
+) -> Tuple[Optional[str], Optional[float]]:
+    """
+    ``run_recognition`` for /match frames, storing the result in ``result_cache``
+    under ``cache_key`` (see frames_cache_key; callers check cached_frames_result
+    first). Without a key the result is not stored.
+    """
+    name, confidence = run_recognition(
+        _worker_recognize_frames, recognize_multiple_frames, frames, db_path, threshold, *scope, deadline=deadline
+    )
+    if cache_key is not None:
+        result_cache.put(cache_key, (name, confidence, len(frames)))
+    return name, confidence
+
+
+# ============================================================================
+# SERVICE STARTUP
+# ============================================================================
+
+# Background startup: status is "idle" until start_background_startup() runs, then
+# "starting" and finally "ready" (or "failed"); phases maps phase name -> ms
+startup_state: Dict[str, Any] = {'status': 'idle', 'phase': None, 'phases': {}, 'total_ms': None, 'error': None}
+startup_lock = threading.Lock()
+
+
+def require_ready() -> None:
+    """Raise RecognitionBusy while background startup is still loading models or the index."""
+    if startup_state['status'] == 'starting':
+        raise RecognitionBusy(f"Service is starting ({startup_state['phase']})", retry_after=STARTUP_RETRY_AFTER_SEC)
+
+
+def _run_startup_phase(name: str, fn: Callable) -> None:
+    startup_state['phase'] = name
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        startup_state['phases'][name] = round(elapsed_ms, 1)
+        logger.info(f"Startup phase {name}: {elapsed_ms:.0f} ms")
+
+
+def warm_up_recognition_pool() -> None:
+    """Spawn the worker processes and have each build, warm up and map the index."""
+    start_recognition_pool()
+    if recognition_pool is not None:
+        recognition_pool.warm_up(_worker_warm_up, DB_PATH, get_index(DB_PATH).version)
+
+
+def _startup() -> None:
+    start = time.perf_counter()
     try:
-        # Handle data URI format
-        if base64_str.startswith('data:'):
-            base64_str = base64_str.split(',', 1)[1]
-        
-        # Decode base64
-        image_data = base64.b64decode(base64_str, validate=True)
-        
-        # Convert to numpy array
-        nparr = np.frombuffer(image_data, dtype=np.uint8)
-        
-        # Decode image
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None or frame.size == 0:
-            logger.warning("Failed to decode image: empty or invalid")
-            return None
-        
-        return frame
+        if RECOGNITION_WORKERS > 0:
+            # Each worker builds its own model; this process only maps the index
+            _run_startup_phase('index', lambda: get_index(DB_PATH))
+            _run_startup_phase('workers', warm_up_recognition_pool)
+        else:
+            _run_startup_phase('import', deepface_module)
+            _run_startup_phase('models', build_models)
+            _run_startup_phase('warmup', warm_up_models)
+            # Also starts the approximate searcher's background build
+            _run_startup_phase('index', lambda: get_searcher(DB_PATH, get_index(DB_PATH)))
+            start_embedding_batcher()
+        startup_state['status'] = 'ready'
     except Exception as e:
-        logger.error(f"Base64 decoding failed: {e}")
-        return None
+        # Requests are no longer held back; whatever failed is retried lazily on first use
+        logger.warning(f"Failed to prepare recognition pipeline at startup: {e}")
+        startup_state['error'] = str(e)
+        startup_state['status'] = 'failed'
+    finally:
+        startup_state['phase'] = None
+        startup_state['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Startup {startup_state['status']} in {startup_state['total_ms']:.0f} ms: {startup_state['phases']}")
+
+
+def start_background_startup() -> None:
+    """Load models, warm up and map the index on a background thread (once); the HTTP server is already serving."""
+    with startup_lock:
+        if startup_state['status'] != 'idle':
+            return
+        startup_state['status'] = 'starting'
+    threading.Thread(target=_startup, name='service-startup', daemon=True).start()
+
+
+def startup_report() -> Dict[str, Any]:
+    return {**startup_state, 'phases': dict(startup_state['phases'])}
+
+
+def service_ready() -> bool:
+    """Startup has finished and the worker pool (if any) is not being restarted."""
+    return startup_state['status'] == 'ready' and (recognition_pool is None or recognition_pool.healthy)
 
 
 # ============================================================================
-# FACE RECOGNITION FUNCTIONS
+# STREAMING RECOGNITION
 # ============================================================================
 
-def recognize_face_in_frame(
-    frame_bgr: np.ndarray,
-    db_path: str,
-    cosine_threshold: float = COSINE_THRESHOLD
-) -> Tuple[Optional[str], Optional[float]]:
-    """
-    Recognize a face in a single frame using DeepFace + RetinaFace + ArcFace.
-    
-    Returns:
-        Tuple of (person_name, confidence_score) or (None, None) if no match
-    """
-    if frame_bgr is None or frame_bgr.size == 0:
-        return None, None
-    
+# /match response status -> df_recognitions_total outcome
+STATUS_OUTCOMES = {'success': 'match', 'no_match': 'no_match', 'busy': 'busy', 'rejected': 'rejected'}
+
+
+def recognize_stream_frame(frame_bytes: bytes, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Recognize one streamed frame; returns the same fields as a /match response."""
+    start = time.perf_counter()
+    result = _recognize_stream_frame(frame_bytes, options)
+    recognition_outcomes.inc(STATUS_OUTCOMES.get(result.get('status'), 'error'))
+    stage_ms['total'].observe((time.perf_counter() - start) * 1000)
+    return result
+
+
+def _recognize_stream_frame(frame_bytes: bytes, options: Dict[str, Any]) -> Dict[str, Any]:
+    received = time.monotonic()
+    db_path = options.get('db_path', DB_PATH)
     if not os.path.exists(db_path):
-        logger.error(f"Database path not found: {db_path}")
-        return None, None
+        db_path = DEFAULT_DB_PATH
+    threshold = float(options.get('threshold', COSINE_THRESHOLD))
+    try:
+        candidates = resolve_candidates(db_path, options)
+    except KeyError as unknown:
+        return {'success': False, 'status': 'error', 'message': f'Unknown section: {unknown.args[0]}'}
     
-    # Thread lock to prevent concurrent DeepFace calls (not thread-safe)
-    with processing_lock:
-        try:
-            # Preprocess for low-light conditions
-            preprocessed = preprocess_frame_for_recognition(frame_bgr)
-            
-            # Convert BGR to RGB for DeepFace
-            rgb_frame = cv2.cvtColor(preprocessed, cv2.COLOR_BGR2RGB)
-            
-            # Run face recognition with opencv + ArcFace
-            # Build face representations once to avoid TensorFlow graph issues
-            results = DeepFace.find(
-                img_path=rgb_frame,
-                db_path=db_path,
-                model_name=MODEL_NAME,
-                distance_metric=DISTANCE_METRIC,
-                detector_backend=DETECTOR_BACKEND,
-                enforce_detection=False,
-                silent=True,
-                refresh_database=False  # Don't rebuild representations on every call
+    scope = (candidates, _as_bool(options.get('fallback', False)), options.get('device_id'))
+    try:
+        cache_key = frames_cache_key(content_digest([frame_bytes]), db_path, threshold, *scope)
+        cached = cached_frames_result(cache_key)
+        if cached is not None:
+            name, confidence, _ = cached
+        else:
+            frames = decode_uploads([frame_bytes], decode_image_buffer)
+            if not frames:
+                return {'success': False, 'status': 'error', 'message': 'Failed to decode image'}
+            name, confidence = recognize_frames_cached(
+                [resize_frame(frames[0])], db_path, threshold, *scope,
+                deadline=request_deadline(options.get('deadline_ms'), received),
+                cache_key=cache_key
             )
-            
-            # Normalize results to list
-            results_list = results if isinstance(results, list) else [results]
-            
-            best_name = None
-            best_distance = float('inf')
-            second_best_distance = float('inf')  # Track second-best for confidence gap
-            
-            # Find best and second-best matches
-            for df in results_list:
-                if df is None or len(df) == 0:
-                    continue
-                
-                # Sort by distance (ascending)
-                df_sorted = df.sort_values(by=['distance'], ascending=True)
-                
-                for idx, (_, row) in enumerate(df_sorted.iterrows()):
-                    distance = float(row['distance'])
-                    
-                    # Check if below threshold
-                    if distance > cosine_threshold:
-                        continue
-                    
-                    # Extract person name from identity path
-                    identity_path = str(row['identity'])
-                    person_name = os.path.basename(os.path.dirname(identity_path))
-                    
-                    # Track best and second-best
-                    if distance < best_distance:
-                        second_best_distance = best_distance
-                        best_distance = distance
-                        best_name = person_name
-                    elif distance < second_best_distance:
-                        second_best_distance = distance
-            
-            if best_name and best_distance < float('inf'):
-                # Convert distance to confidence (0-1 scale)
-                confidence = max(0.0, 1.0 - best_distance)
-                logger.info(f"Match found: {best_name} (distance: {best_distance:.4f}, confidence: {confidence:.4f}, threshold: {cosine_threshold:.4f})")
-                return best_name, confidence
-            
-            logger.info(f"No matching face found (best distance would be {best_distance:.4f}, threshold: {cosine_threshold:.4f})")
-            return None, None
-            
-        except Exception as e:
-            logger.error(f"Face recognition failed: {e}")
-            return None, None
+    except RecognitionBusy as busy:
+        return {
+            'success': False,
+            'status': 'busy',
+            'reason': busy.reason,
+            'message': 'Recognition service busy, retry shortly',
+            'retry_after': round(busy.retry_after, 2)
+        }
+    except QualityRejected as rejected:
+        return {'success': False, 'status': 'rejected', 'reason': rejected.reason, 'message': f'Frame rejected: {rejected.reason}'}
+    except Exception as recog_err:
+        logger.error(f"Stream recognition error: {recog_err}")
+        return {'success': False, 'status': 'error', 'message': 'Recognition processing failed'}
+    
+    if name and confidence:
+        return {
+            'success': True,
+            'status': 'success',
+            'name': name,
+            'student_id': name,
+            'confidence': float(confidence),
+            'message': f'Match found: {name}'
+        }
+    return {'success': False, 'status': 'no_match', 'message': 'No match found'}
 
 
-def recognize_multiple_frames(
-    frames_bgr: list,
-    db_path: str
-) -> Tuple[Optional[str], Optional[float]]:
-    """
-    Recognize faces across multiple frames and return best match.
-    """
-    if not frames_bgr or all(f is None for f in frames_bgr):
-        return None, None
-    
-    matches = []
-    
-    for frame in frames_bgr:
-        if frame is None or frame.size == 0:
-            continue
-        
-        name, confidence = recognize_face_in_frame(frame, db_path)
-        if name and confidence:
-            matches.append((name, confidence))
-    
-    if not matches:
-        return None, None
-    
-    # Group by person and average confidence
-    person_scores = {}
-    for name, confidence in matches:
-        if name not in person_scores:
-            person_scores[name] = []
-        person_scores[name].append(confidence)
-    
-    # Find person with highest average confidence
-    best_person = max(person_scores.items(), key=lambda x: np.mean(x[1]))
-    avg_confidence = float(np.mean(best_person[1]))
-    
-    logger.info(f"Best match: {best_person[0]} (avg confidence: {avg_confidence:.4f})")
-    return best_person[0], avg_confidence
+stream_server: Optional[RecognitionStreamServer] = None
+
+
+def start_stream_server(host: str = '127.0.0.1', port: int = STREAM_PORT) -> None:
+    global stream_server
+    if port <= 0 or stream_server is not None:
+        return
+    server = RecognitionStreamServer(recognize_stream_frame, host, port, max_connections=STREAM_MAX_CLIENTS)
+    if server.start():
+        stream_server = server
 
 
 # ============================================================================
 # FLASK ENDPOINTS
 # ============================================================================
 
+class InMemoryUploadRequest(Request):
+    """
+    Request whose multipart file parts are buffered in BytesIO instead of
+    Werkzeug's default SpooledTemporaryFile (which has no getbuffer and rolls
+    over to disk past 500 KB), so _upload_buffer can hand them to cv2 without
+    a copy. MAX_CONTENT_LENGTH bounds the memory this takes.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
 
+# Bodies that are a single encoded frame (options go in the query string)
+RAW_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/bmp', 'application/octet-stream'}
 
-def list_representation_files(db_path: str) -> list[str]:
-    try:
-        return [f for f in os.listdir(db_path) if f.lower().endswith('.pkl')]
-    except Exception:
-        return []
 
+def _upload_buffer(upload) -> Any:
+    """Bytes of a multipart upload; in-memory parts (see InMemoryUploadRequest) are exposed without a copy."""
+    getbuffer = getattr(upload.stream, 'getbuffer', None)
+    if getbuffer is not None:
+        return getbuffer()
+    return upload.stream.read()
 
-def rebuild_representations(db_path: str) -> Dict[str, Any]:
-    """Force DeepFace to rebuild representation cache for the dataset."""
+
+def request_deadline(budget_ms: Any, received: float) -> float:
+    """
+    ``time.monotonic()`` deadline of a request: a client budget in milliseconds
+    (X-Deadline-Ms header or "deadline_ms" option) counted from ``received``,
+    else TIMEOUT_SEC. The budget is relative, so client and server clocks need not agree.
+    """
     try:
-        logger.info(f"Rebuilding DeepFace representations for: {db_path}")
-        # Use a tiny black image to trigger index building
-        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
-        DeepFace.find(
-            img_path=dummy,
-            db_path=db_path,
-            model_name=MODEL_NAME,
-            distance_metric=DISTANCE_METRIC,
-            detector_backend=DETECTOR_BACKEND,
-            enforce_detection=False,
-            silent=True,
-            refresh_database=True
-        )
-        files = list_representation_files(db_path)
-        logger.info(f"Representation files present: {files}")
-        return {"success": True, "files": files}
-    except Exception as e:
-        logger.error(f"Failed to rebuild representations: {e}")
-        return {"success": False, "error": str(e)}
+        budget = float(budget_ms) / 1000.0 if budget_ms is not None else TIMEOUT_SEC
+    except (TypeError, ValueError):
+        budget = TIMEOUT_SEC
+    return received + max(0.0, budget)
+
+
+def busy_response(busy: RecognitionBusy):
+    """503 for a shed or refused request, with a Retry-After estimate (whole seconds, at least 1)."""
+    return jsonify({
+        'success': False,
+        'message': 'Recognition service busy, retry shortly',
+        'status': 'busy',
+        'reason': busy.reason,
+        'retry_after': round(busy.retry_after, 2)
+    }), 503, {'Retry-After': str(max(1, math.ceil(busy.retry_after)))}
+
+
+def read_uploads_request() -> Tuple[Dict[str, Any], List[Any], int, Callable[[Any], Optional[np.ndarray]]]:
+    """
+    Read the encoded frames and options of a recognition request, without decoding them.
+    
+    Accepts a JSON body with base64 "images" (or "image"), multipart/form-data
+    with "images"/"image" file parts plus form fields, or a raw image body
+    (image/jpeg, image/png, ...) with options in the query string. Binary
+    uploads are kept as views of the request buffer.
+    
+    Returns:
+        Tuple of (options, encoded_uploads, submitted_count, decoder for one upload)
+    """
+    mimetype = (request.mimetype or '').lower()
+    if mimetype == 'multipart/form-data':
+        options: Dict[str, Any] = request.form.to_dict()
+        uploads = request.files.getlist('images') + request.files.getlist('image')
+        return options, [_upload_buffer(upload) for upload in uploads], len(uploads), decode_image_buffer
+    if mimetype in RAW_IMAGE_TYPES:
+        body = request.get_data(cache=False)
+        return request.args.to_dict(), [body] if body else [], 1 if body else 0, decode_image_buffer
+    options = request.get_json(silent=True) or {}
+    images_b64 = options.get('images') or ([options['image']] if options.get('image') else [])
+    return options, [image_b64 for image_b64 in images_b64 if image_b64], len(images_b64), decode_base64_image
+
+
+def decode_uploads(buffers: Sequence[Any], decoder: Callable[[Any], Optional[np.ndarray]]) -> List[np.ndarray]:
+    """Decode encoded uploads (see read_uploads_request), dropping those that fail."""
+    start = time.perf_counter()
+    frames = [decoder(buffer) for buffer in buffers]
+    stage_ms['decode'].observe((time.perf_counter() - start) * 1000)
+    return [frame for frame in frames if frame is not None]
+
+
+def read_frames_request() -> Tuple[Dict[str, Any], List[np.ndarray], int]:
+    """read_uploads_request with the uploads decoded: (options, decoded_frames, submitted_count)."""
+    options, buffers, submitted, decoder = read_uploads_request()
+    return options, decode_uploads(buffers, decoder), submitted
 
 
 @app.route('/match', methods=['POST'])
 def match_faces():
     """
-    Match faces from base64 encoded images against the dataset.
+    Match faces from one or more frames against the dataset.
     
     Request JSON:
     {
         "images": ["base64_string_1", "base64_string_2", ...],
         "db_path": "/path/to/dataset",  # optional
-        "threshold": 0.55  # optional (lower = stricter matching)
+        "threshold": 0.55,  # optional (lower = stricter matching)
+        "section": "CSE-A",  # optional: only match this section's roster (see /sections)
+        "candidates": ["student_id", ...],  # optional: only match these students
+        "fallback": false,  # optional: search the full gallery when the roster has no match
+        "device_id": "kiosk-1",  # optional (or X-Device-Id header): reuse identities across this camera's frames
+        "deadline_ms": 5000  # optional (or X-Deadline-Ms header); default DF_TIMEOUT_SEC
     }
+    
+    A request that cannot start recognition in time for its deadline is shed
+    with 503, status "busy", a "reason" and a Retry-After estimate.
+    
+    Binary alternatives (no base64): multipart/form-data with one "images" file
+    part per frame and db_path/threshold as form fields, or a raw image/jpeg
+    body with db_path/threshold in the query string.
     """
+    start = time.perf_counter()
+    received = time.monotonic()
+    outcome = 'error'
     try:
-        data = request.get_json() or {}
-        images_b64 = data.get('images', [])
+        data, buffers, submitted, decoder = read_uploads_request()
         db_path = data.get('db_path', DB_PATH)
         # Fallback to module-relative dataset if provided path does not exist
         if not os.path.exists(db_path):
             logger.warning(f"Provided db_path does not exist: {db_path}. Falling back to default: {DEFAULT_DB_PATH}")
             db_path = DEFAULT_DB_PATH
         threshold = float(data.get('threshold', COSINE_THRESHOLD))
-        logger.info(f"/match db_path={db_path}, detector={DETECTOR_BACKEND}, model={MODEL_NAME}, threshold={threshold:.4f}")
-        logger.info(f"Existing representation files: {list_representation_files(db_path)}")
-        
-        if not images_b64:
-            return jsonify({
-                'success': False,
-                'message': 'No images provided',
-                'status': 'error'
-            }), 400
-        
-        # Use only the first frame to speed up processing
-        # Multiple frames cause timeouts and don't significantly improve accuracy
-        first_frame_b64 = images_b64[0] if images_b64 else None
-        if not first_frame_b64:
+        try:
+            candidates = resolve_candidates(db_path, data)
+        except KeyError as unknown:
             return jsonify({
                 'success': False,
-                'message': 'No valid images provided',
+                'message': f'Unknown section: {unknown.args[0]}',
                 'status': 'error'
             }), 400
+        fallback = _as_bool(data.get('fallback', False))
+        device_id = data.get('device_id') or request.headers.get('X-Device-Id')
+        logger.info(
+            f"/match db_path={db_path}, detector={DETECTOR_BACKEND}, model={MODEL_NAME}, threshold={threshold:.4f}, "
+            f"candidates={'all' if candidates is None else len(candidates)}"
+        )
+        # Only report what is resident; loading is left to startup or the recognition path
+        logger.info(f"Embedding index size: {resident_index_size(db_path)}")
         
-        frame = decode_base64_image(first_frame_b64)
-        if frame is None:
+        if not submitted:
             return jsonify({
                 'success': False,
-                'message': 'Failed to decode image',
+                'message': 'No images provided',
                 'status': 'error'
             }), 400
         
-        # Resize for faster processing
-        frame = resize_frame(frame)
-        
         # Recognize face with error recovery
         try:
-            name, confidence = recognize_face_in_frame(frame, db_path, threshold)
+            # A byte-identical re-submission is answered before anything is decoded
+            cache_key = frames_cache_key(content_digest(buffers), db_path, threshold, candidates, fallback, device_id)
+            cached = cached_frames_result(cache_key)
+            if cached is not None:
+                name, confidence, frame_count = cached
+            else:
+                frames = decode_uploads(buffers, decoder)
+                # Every frame of the burst is recognized in one batched pass; resize for faster processing
+                # straight into this thread's contiguous batch buffer (valid until its next request)
+                frames = list(preprocess_engine.resize_batch(frames, FRAME_WIDTH, FRAME_HEIGHT))
+                if not frames:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Failed to decode image',
+                        'status': 'error'
+                    }), 400
+                frame_count = len(frames)
+                name, confidence = recognize_frames_cached(
+                    frames, db_path, threshold, candidates, fallback, device_id,
+                    deadline=request_deadline(request.headers.get('X-Deadline-Ms') or data.get('deadline_ms'), received),
+                    cache_key=cache_key
+                )
+        except RecognitionBusy as busy:
+            logger.warning(f"/match rejected: {busy}")
+            outcome = 'busy'
+            return busy_response(busy)
+        except QualityRejected as rejected:
+            logger.info(f"/match rejected by quality gate: {rejected.reason}")
+            outcome = 'rejected'
+            return jsonify({
+                'success': False,
+                'message': f'Frame rejected: {rejected.reason}',
+                'reason': rejected.reason,
+                'status': 'rejected'
+            }), 200
         except Exception as recog_err:
             logger.error(f"Recognition error: {recog_err}")
             return jsonify({
@@ -363,15 +2176,18 @@ def match_faces():
             }), 200
         
         if name and confidence:
+            outcome = 'match'
             return jsonify({
                 'success': True,
                 'status': 'success',
                 'name': name,
                 'student_id': name,
                 'confidence': float(confidence),
+                'frames': frame_count,
                 'message': f'Match found: {name}'
             }), 200
         else:
+            outcome = 'no_match'
             return jsonify({
                 'success': False,
                 'message': 'No match found',
@@ -386,10 +2202,188 @@ def match_faces():
             'status': 'error'
         }), 500
     finally:
+        recognition_outcomes.inc(outcome)
+        stage_ms['total'].observe((time.perf_counter() - start) * 1000)
         # Force garbage collection to free memory
         gc.collect()
 
 
+@app.route('/match-group', methods=['POST'])
+def match_group():
+    """
+    Recognize every face in one classroom photo.
+    
+    Request JSON:
+    {
+        "image": "base64_string",       # or "images": [...] (first entry is used)
+        "db_path": "/path/to/dataset",  # optional
+        "threshold": 0.55,              # optional
+        "section": "CSE-A"              # optional, as in /match (also "candidates", "fallback")
+    }
+    
+    Also accepts multipart/form-data or a raw image body, as /match does.
+    """
+    received = time.monotonic()
+    try:
+        data, frames, submitted = read_frames_request()
+        db_path = data.get('db_path', DB_PATH)
+        if not os.path.exists(db_path):
+            logger.warning(f"Provided db_path does not exist: {db_path}. Falling back to default: {DEFAULT_DB_PATH}")
+            db_path = DEFAULT_DB_PATH
+        threshold = float(data.get('threshold', COSINE_THRESHOLD))
+        try:
+            candidates = resolve_candidates(db_path, data)
+        except KeyError as unknown:
+            return jsonify({
+                'success': False,
+                'message': f'Unknown section: {unknown.args[0]}',
+                'status': 'error'
+            }), 400
+        fallback = _as_bool(data.get('fallback', False))
+        
+        if not submitted:
+            return jsonify({
+                'success': False,
+                'message': 'No image provided',
+                'status': 'error'
+            }), 400
+        
+        if not frames:
+            return jsonify({
+                'success': False,
+                'message': 'Failed to decode image',
+                'status': 'error'
+            }), 400
+        frame = frames[0]
+        
+        try:
+            faces = run_recognition(
+                _worker_recognize_group, recognize_group, frame, db_path, threshold, candidates, fallback,
+                deadline=request_deadline(request.headers.get('X-Deadline-Ms') or data.get('deadline_ms'), received)
+            )
+        except RecognitionBusy as busy:
+            logger.warning(f"/match-group rejected: {busy}")
+            return busy_response(busy)
+        recognized = [f for f in faces if f['student_id']]
+        return jsonify({
+            'success': bool(recognized),
+            'status': 'success' if recognized else 'no_match',
+            'faces': faces,
+            'recognized': len(recognized),
+            'unrecognized': len(faces) - len(recognized),
+            'message': f'Recognized {len(recognized)} of {len(faces)} face(s)'
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error in /match-group endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'status': 'error'
+        }), 500
+    finally:
+        gc.collect()
+
+
+@app.route('/enroll', methods=['POST'])
+def enroll_endpoint():
+    """
+    Add a student to the live index, embedding only the new images.
+    
+    Request JSON:
+    {
+        "name": "student_id",
+        "images": ["base64_string", ...],   # saved into <db_path>/<name>/
+        "paths": ["/path/to/image.jpg"],    # or images already on disk
+        "db_path": "/path/to/dataset"       # optional
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        name = str(data.get('name') or data.get('student_id') or '').strip()
+        db_path = data.get('db_path', DB_PATH)
+        if not is_valid_student_name(name):
+            return jsonify({'success': False, 'error': 'A valid student name is required'}), 400
+        if not os.path.isdir(db_path):
+            return jsonify({'success': False, 'error': f'Database path not found: {db_path}'}), 400
+        
+        images = []
+        for image_b64 in data.get('images') or []:
+            image = decode_base64_image(image_b64)
+            if image is not None:
+                images.append(image)
+        paths = [str(p) for p in data.get('paths') or []]
+        if not images and not paths:
+            return jsonify({'success': False, 'error': 'No images provided'}), 400
+        
+        result = enroll_student(name, db_path, images=images, paths=paths)
+        return jsonify(result), 200 if result.get('success') else 400
+    except Exception as e:
+        logger.error(f"Error in /enroll endpoint: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/unenroll', methods=['POST'])
+def unenroll_endpoint():
+    """
+    Remove a student's vectors from the live index.
+    
+    Request JSON:
+    {
+        "name": "student_id",
+        "delete_images": false,          # optional: also delete <db_path>/<name>/
+        "db_path": "/path/to/dataset"    # optional
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        name = str(data.get('name') or data.get('student_id') or '').strip()
+        db_path = data.get('db_path', DB_PATH)
+        if not is_valid_student_name(name):
+            return jsonify({'success': False, 'error': 'A valid student name is required'}), 400
+        
+        result = unenroll_student(name, db_path, delete_images=bool(data.get('delete_images', False)))
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"Error in /unenroll endpoint: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/sections', methods=['GET', 'POST'])
+def sections_endpoint():
+    """
+    List or set the section rosters used to scope /match.
+    
+    GET ?db_path=... returns every roster. POST sets one roster (an empty
+    "students" list removes it):
+    {
+        "section": "CSE-A",
+        "students": ["student_id", ...],
+        "db_path": "/path/to/dataset"   # optional
+    }
+    """
+    try:
+        if request.method == 'GET':
+            db_path = request.args.get('db_path', DB_PATH)
+            return jsonify({'success': True, 'sections': get_sections(db_path)}), 200
+        
+        data = request.get_json() or {}
+        section = str(data.get('section') or '').strip()
+        db_path = data.get('db_path', DB_PATH)
+        if not section:
+            return jsonify({'success': False, 'error': 'A section key is required'}), 400
+        if not os.path.isdir(db_path):
+            return jsonify({'success': False, 'error': f'Database path not found: {db_path}'}), 400
+        
+        students = [str(s).strip() for s in data.get('students') or [] if str(s).strip()]
+        sections = set_section(db_path, section, students)
+        logger.info(f"Section {section}: {len(sections.get(section, []))} student(s)")
+        return jsonify({'success': True, 'section': section, 'students': sections.get(section, [])}), 200
+    except Exception as e:
+        logger.error(f"Error in /sections endpoint: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/scan-face', methods=['POST'])
 def scan_face_endpoint():
     """Scan and recognize a face from webcam."""
@@ -416,21 +2410,119 @@ def scan_face_endpoint():
         }), 500
 
 
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """
+    Readiness probe: 200 once models are built and warmed up and the index is
+    mapped, 503 while startup is running (or failed) or while a broken worker
+    pool is being restarted. Unlike /health, which answers as soon as the HTTP
+    server is up. Begins startup if nothing has yet (e.g. when the app is
+    served by an external WSGI server).
+    """
+    start_background_startup()
+    ready = service_ready()
+    return jsonify({
+        'ready': ready,
+        **startup_report(),
+        'pool': recognition_pool.health() if recognition_pool else None
+    }), 200 if ready else 503
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
+    """
+    Health check endpoint. With ?fingerprint=1 it also reports whether the
+    store still matches the dataset folder (walks every image, so opt-in).
+    """
     return jsonify({
         'status': 'ok',
+        'startup': startup_report(),
         'db_path': DB_PATH,
         'db_exists': os.path.exists(DB_PATH),
-        'representations': list_representation_files(DB_PATH)
+        'store': embedding_store.store_summary(store_dir_for(DB_PATH)),
+        'dataset_in_sync': store_matches_dataset(DB_PATH) if _as_bool(request.args.get('fingerprint', False)) else None,
+        'index_size': resident_index_size(DB_PATH),
+        'galleries': galleries.stats(),
+        'search': search_stats(DB_PATH),
+        'tracking': tracking_stats(),
+        'result_cache': result_cache.stats(),
+        'preprocess': preprocess_engine.stats(),
+        'workers': RECOGNITION_WORKERS,
+        'in_flight': recognition_pool.in_flight if recognition_pool else 0,
+        'queue_depth': RECOGNITION_QUEUE_DEPTH,
+        'pool': recognition_pool.health() if recognition_pool else None,
+        'admission': admission.stats(),
+        'batching': embedding_batcher.stats() if embedding_batcher else None,
+        'stream': stream_server.stats() if stream_server else None
     }), 200
 
 
+def tracking_stats() -> Dict[str, Any]:
+    """Face-track stats of whichever processes run recognition (summed over the pool's workers)."""
+    if recognition_pool is None:
+        return face_tracks.stats()
+    return combine_track_stats([stats for stats in recognition_pool.worker_stats if stats is not None])
+
+
+def exported_metrics() -> List[Any]:
+    """Every metric served by /metrics."""
+    metrics: List[Any] = list(stage_ms.values()) + [
+        lock_wait_ms,
+        search_ms,
+        best_distance,
+        recognition_outcomes,
+        admission.queue_wait_ms,
+        admission.shed,
+        Gauge('df_ready', 'Whether the service is ready (1): startup finished and the worker pool healthy',
+              lambda: 1 if service_ready() else 0),
+        Gauge('df_startup_ms', 'Duration of the last background startup (ms)', lambda: startup_state['total_ms']),
+        Gauge('df_cosine_threshold', 'Default cosine distance threshold', lambda: COSINE_THRESHOLD),
+        Gauge('df_index_size', 'Vectors in the default embedding index', lambda: resident_index_size(DB_PATH)),
+        Gauge('df_galleries_resident', 'Galleries (dataset folders) held in memory', lambda: galleries.stats()['resident']),
+        Gauge('df_gallery_bytes', 'Embedding bytes held by resident galleries', lambda: galleries.stats()['bytes']),
+        Gauge('df_in_flight', 'Recognition requests running or queued in the worker pool',
+              lambda: recognition_pool.in_flight if recognition_pool else 0),
+        Gauge('df_pool_restarts', 'Times a broken recognition worker pool was replaced',
+              lambda: recognition_pool.restarts if recognition_pool else 0),
+        Gauge('df_admission_queued', 'Requests waiting for a recognition slot', lambda: admission.queued),
+        Gauge('df_admission_service_ms', 'Estimated recognition service time used for shedding (ms)',
+              lambda: admission.service_sec * 1000),
+        Gauge('df_embed_queue_depth', 'Requests waiting for an embedding batch',
+              lambda: embedding_batcher.queue_size if embedding_batcher else 0),
+        Gauge('df_process_resident_bytes', 'Resident memory of this process', process_memory_bytes),
+    ]
+    if embedding_batcher is not None:
+        metrics += [embedding_batcher.batch_sizes, embedding_batcher.queue_wait_ms]
+    if stream_server is not None:
+        metrics.append(stream_server.latency_ms)
+    return metrics
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return Response(render_prometheus(exported_metrics()), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/reload', methods=['POST'])
 def reload_endpoint():
-    data = request.get_json() or {}
+    """
+    Re-embed the dataset, or with {"remap": true} just map the current store
+    version (e.g. after tools/ingest_dataset.py wrote it).
+    """
+    data = request.get_json(silent=True) or {}
     db_path = data.get('db_path', DB_PATH)
+    if _as_bool(data.get('remap', False)):
+        index = load_index(db_path, rebuild_if_missing=False)
+        in_sync = store_matches_dataset(db_path)
+        if in_sync is False:
+            logger.warning(f"Dataset {db_path} changed since the embedding store was built; POST /reload to re-embed it")
+        return jsonify({
+            'success': True,
+            'store': embedding_store.store_summary(store_dir_for(db_path)),
+            'dataset_in_sync': in_sync,
+            'index_size': len(index)
+        }), 200
     result = rebuild_representations(db_path)
     status_code = 200 if result.get('success') else 500
     return jsonify(result), status_code
@@ -458,6 +2550,10 @@ if __name__ == '__main__':
     logger.info(f"Database path: {DB_PATH}")
     logger.info(f"Model: {MODEL_NAME}, Detector: {DETECTOR_BACKEND}, Threshold: {COSINE_THRESHOLD}")
     logger.info(f"Listening on http://127.0.0.1:5000")
+    # Build models, warm them up and load the embedding index in the background so the
+    # server answers right away; /ready turns 200 (and /match stops answering 503) once done.
+    start_background_startup()
+    start_stream_server()
     # Don't kick off background rebuild - it causes threading issues
     # try:
     #     threading.Thread(target=rebuild_representations, args=(DB_PATH,), daemon=True).start()
@@ -467,7 +2563,9 @@ if __name__ == '__main__':
     # Use waitress for production (better handling of long requests)
     try:
         from waitress import serve
-        serve(app, host='127.0.0.1', port=5000, threads=4, channel_timeout=120)
+        # Enough threads for every admitted and queued request plus probes, so overload is shed
+        # by admission control with a Retry-After instead of waiting unseen in waitress's queue
+        serve(app, host='127.0.0.1', port=5000, threads=max(4, ADMIT_CONCURRENCY + ADMIT_QUEUE + 2), channel_timeout=120)
     except ImportError:
         logger.warning("Waitress not available, falling back to Flask development server")
         # Fallback to Flask development server
@@ -0,0 +1,307 @@
+"""
+Versioned, memory-mapped on-disk embedding store.
+
+Replaces DeepFace's representation pickle as the persisted form of the face
+index. Each version is one immutable file that is opened with ``np.memmap``,
+so every worker process shares a single page-cached copy of the matrix
+instead of unpickling its own heap copy.
+
+Layout of a store directory::
+
+    CURRENT          name of the live version file (replaced atomically)
+    v000007.fidx     immutable version files
+
+Layout of a version file::
+
+    8 bytes   magic b"FIDX0001"
+    8 bytes   little-endian uint64 header length
+    N bytes   UTF-8 JSON header, padded so the matrix starts 64-byte aligned:
+              model, detector, dim, count, dataset fingerprint, identity/offset
+              table (rows are grouped by identity) and per-row image paths
+    count * dim little-endian float32 matrix of L2-normalized embeddings
+
+Writers build the new version under a temporary name and rename it into
+place, then swap ``CURRENT`` the same way, so readers never see a
+half-written file. A version number is claimed by creating its file with
+``O_EXCL`` first, so concurrent writers (threads or processes) never share
+one, and ``CURRENT`` only ever moves forward. Old versions are kept briefly because another process may
+still have them mapped (Windows cannot delete a mapped file).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b"FIDX0001"
+ALIGNMENT = 64
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v"
+VERSION_SUFFIX = ".fidx"
+# Older versions kept on disk for readers that still have them mapped
+KEEP_VERSIONS = 3
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+# Serializes writers within this process (O_EXCL reservation covers other processes)
+_write_lock = threading.Lock()
+
+
+def dataset_fingerprint(db_path: str) -> str:
+    """Hash (relative path, size, mtime) of every image under ``db_path``; hidden entries are skipped."""
+    entries = []
+    for root, dirs, files in os.walk(db_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or os.path.splitext(name)[1].lower() not in IMAGE_EXTS:
+                continue
+            full = os.path.join(root, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append(f"{os.path.relpath(full, db_path)}|{st.st_size}|{st.st_mtime_ns}")
+    return hashlib.sha1("\n".join(entries).encode("utf-8")).hexdigest()
+
+
+class StoredEmbeddings:
+    """One opened store version: a read-only memmap plus its identity table."""
+
+    def __init__(self, path: str, header: Dict[str, Any], vectors: np.ndarray):
+        self.path = path
+        self.header = header
+        self.vectors = vectors
+        offsets = np.asarray(header["offsets"], dtype=np.int64)
+        # Per-row identity, expanded from the offset table
+        self.identities = np.repeat(
+            np.asarray(list(header["identities"]), dtype=object), np.diff(offsets)
+        ) if len(offsets) > 1 else np.empty(0, dtype=object)
+        self.paths: List[str] = list(header.get("paths") or [""] * len(self.identities))
+
+    @property
+    def version(self) -> int:
+        return int(self.header["version"])
+
+    def summary(self) -> Dict[str, Any]:
+        return summarize_header(self.path, self.header)
+
+
+def summarize_header(path: str, header: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "file": os.path.basename(path),
+        "version": header.get("version"),
+        "model": header.get("model"),
+        "detector": header.get("detector"),
+        "count": header.get("count"),
+        "dim": header.get("dim"),
+        "identities": len(header.get("identities") or []),
+        "fingerprint": header.get("fingerprint"),
+        "created": header.get("created"),
+    }
+
+
+def _version_name(version: int) -> str:
+    return f"{VERSION_PREFIX}{version:06d}{VERSION_SUFFIX}"
+
+
+def _list_versions(store_dir: str) -> List[int]:
+    versions = []
+    for name in os.listdir(store_dir) if os.path.isdir(store_dir) else []:
+        if name.startswith(VERSION_PREFIX) and name.endswith(VERSION_SUFFIX):
+            number = name[len(VERSION_PREFIX):-len(VERSION_SUFFIX)]
+            if number.isdigit():
+                versions.append(int(number))
+    return sorted(versions)
+
+
+def _reserve_version(store_dir: str) -> int:
+    """Claim the next free version number by creating an empty placeholder file exclusively."""
+    while True:
+        existing = _list_versions(store_dir)
+        version = (existing[-1] + 1) if existing else 1
+        try:
+            os.close(os.open(os.path.join(store_dir, _version_name(version)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return version
+        except FileExistsError:
+            continue
+
+
+def _current_version(store_dir: str) -> Optional[int]:
+    version_path = current_version_path(store_dir)
+    if version_path is None:
+        return None
+    number = os.path.basename(version_path)[len(VERSION_PREFIX):-len(VERSION_SUFFIX)]
+    return int(number) if number.isdigit() else None
+
+
+def _atomic_write(path: str, payload_writer) -> None:
+    """Write via a temp file in the same directory, fsync, then rename over ``path``."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            payload_writer(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not an embedding store file: {path}")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+def write_store(
+    store_dir: str,
+    vectors: np.ndarray,
+    identities: Sequence[str],
+    paths: Sequence[str],
+    model: str,
+    detector: str,
+    fingerprint: str = "",
+) -> str:
+    """
+    Write a new store version and make it current.
+
+    ``vectors`` must already be L2-normalized. Returns the path of the new version file.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    vectors = np.asarray(vectors, dtype="<f4")
+    identities = [str(i) for i in identities]
+    paths = [str(p) for p in paths]
+    if vectors.ndim != 2 or len(vectors) != len(identities):
+        raise ValueError("vectors must be (count, dim) with one identity per row")
+
+    # Group rows by identity so each identity is one contiguous row range
+    order = sorted(range(len(identities)), key=lambda row: identities[row])
+    names: List[str] = []
+    offsets = [0]
+    for position, row in enumerate(order):
+        if not names or identities[row] != names[-1]:
+            if names:
+                offsets.append(position)
+            names.append(identities[row])
+    offsets.append(len(order))
+    if not names:
+        offsets = [0]
+
+    with _write_lock:
+        version = _reserve_version(store_dir)
+        try:
+            return _write_version(store_dir, version, vectors, order, names, offsets, paths, model, detector, fingerprint)
+        except Exception:
+            try:
+                os.remove(os.path.join(store_dir, _version_name(version)))
+            except OSError:
+                pass
+            raise
+
+
+def _write_version(
+    store_dir: str,
+    version: int,
+    vectors: np.ndarray,
+    order: List[int],
+    names: List[str],
+    offsets: List[int],
+    paths: List[str],
+    model: str,
+    detector: str,
+    fingerprint: str,
+) -> str:
+    header = {
+        "version": version,
+        "model": model,
+        "detector": detector,
+        "dim": int(vectors.shape[1]),
+        "count": int(vectors.shape[0]),
+        "dtype": "float32",
+        "fingerprint": fingerprint,
+        "created": time.time(),
+        "identities": names,
+        "offsets": offsets,
+        "paths": [paths[row] for row in order],
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_offset = len(MAGIC) + 8 + len(header_bytes)
+    padding = (-data_offset) % ALIGNMENT
+    matrix = np.ascontiguousarray(vectors[order]) if len(order) else vectors
+
+    def write(f):
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes) + padding))
+        f.write(header_bytes)
+        f.write(b" " * padding)
+        f.write(matrix.tobytes())
+
+    version_path = os.path.join(store_dir, _version_name(version))
+    _atomic_write(version_path, write)
+    current = _current_version(store_dir)
+    # Another process may already have published a newer version
+    if current is None or current < version:
+        _atomic_write(os.path.join(store_dir, CURRENT_FILE), lambda f: f.write(_version_name(version).encode("ascii")))
+    _prune_versions(store_dir, keep_from=version - KEEP_VERSIONS + 1)
+    return version_path
+
+
+def _prune_versions(store_dir: str, keep_from: int) -> None:
+    for version in _list_versions(store_dir):
+        if version >= keep_from:
+            break
+        try:
+            os.remove(os.path.join(store_dir, _version_name(version)))
+        except OSError:
+            # Still mapped by another process (Windows); retried on the next write
+            pass
+
+
+def current_version_path(store_dir: str) -> Optional[str]:
+    current = os.path.join(store_dir, CURRENT_FILE)
+    if not os.path.exists(current):
+        return None
+    with open(current, "r", encoding="ascii") as f:
+        return os.path.join(store_dir, f.read().strip())
+
+
+def store_summary(store_dir: str) -> Optional[Dict[str, Any]]:
+    """Header summary of the current version without mapping the matrix."""
+    version_path = current_version_path(store_dir)
+    if version_path is None:
+        return None
+    return summarize_header(version_path, read_header(version_path))
+
+
+def open_store(store_dir: str) -> Optional[StoredEmbeddings]:
+    """Open the current version read-only via ``np.memmap``; None if the store does not exist."""
+    version_path = current_version_path(store_dir)
+    if version_path is None:
+        return None
+
+    header = read_header(version_path)
+    count, dim = int(header["count"]), int(header["dim"])
+    data_offset = len(MAGIC) + 8 + _header_length(version_path)
+    if count == 0:
+        vectors = np.zeros((0, dim), dtype=np.float32)
+    else:
+        vectors = np.memmap(version_path, dtype="<f4", mode="r", offset=data_offset, shape=(count, dim))
+    return StoredEmbeddings(version_path, header, vectors)
+
+
+def _header_length(path: str) -> int:
+    with open(path, "rb") as f:
+        f.seek(len(MAGIC))
+        return struct.unpack("<Q", f.read(8))[0]
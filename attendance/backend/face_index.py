@@ -0,0 +1,642 @@
+"""
+Resident embedding index for face matching.
+
+Holds every enrolled face embedding as one contiguous float32 matrix of
+L2-normalized vectors plus a parallel identity array, so a query is a single
+matrix-vector product followed by top-k selection instead of a pandas scan
+over DeepFace's representation pickle.
+
+Cosine distance is ``1 - dot(a, b)`` for unit vectors, which is exactly what
+DeepFace reports with ``distance_metric="cosine"``; thresholds such as
+``COSINE_THRESHOLD`` keep their meaning.
+
+For campus-scale galleries an ``IVFSearcher`` can sit in front of the matrix:
+rows are clustered around k-means centroids and a query only scores the rows
+of its ``n_probe`` closest clusters. Candidates are still scored with exact
+cosine distance, so thresholds mean the same thing; only recall can drop,
+and ``measure_recall`` compares it against the exact scan.
+
+A ``QuantizedSearcher`` instead scans an int8 copy of the matrix and re-ranks
+a shortlist exactly against the full-precision rows; ``compare_storage``
+reports what that trades (memory, speed, top-1 changes). It is not faster
+than the float32 scan, and it only saves memory once the float32 pages read
+to build it are no longer resident.
+
+A ``PrototypeSearcher`` compacts each student's photos into one to a few
+prototype vectors, so the first stage scales with students rather than photos.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 rows scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def identity_from_path(identity_path: str) -> str:
+    """Map ``dataset/<person>/<image>`` to ``<person>`` (DeepFace identity convention)."""
+    return os.path.basename(os.path.dirname(str(identity_path)))
+
+
+# Roster subsets cached per index (oldest evicted first)
+MAX_CACHED_SUBSETS = 64
+
+
+class FaceIndex:
+    """Exact cosine-similarity index over L2-normalized embeddings."""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        identities: Sequence[str],
+        paths: Optional[Sequence[str]] = None,
+        model_name: str = "",
+        version: int = 0,
+        normalized: bool = False,
+    ):
+        if not normalized:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.size == 0:
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(0, vectors.shape[-1] if vectors.ndim == 2 else 0)
+        # Pre-normalized vectors (e.g. a read-only np.memmap of the embedding store) are used as-is
+        self.vectors = vectors if normalized or not len(vectors) else l2_normalize(vectors)
+        self.identities = np.asarray(list(identities), dtype=object)
+        self.paths = np.asarray(list(paths) if paths is not None else [""] * len(self.identities), dtype=object)
+        self.model_name = model_name
+        # Bumped on every add/remove so caches keyed on the index can tell it changed
+        self.version = version
+        # frozenset(identities) -> (rows, contiguous copy of their vectors)
+        self._subsets: Dict[frozenset, Tuple[np.ndarray, np.ndarray]] = {}
+        # frozenset(identities) -> rows, for searchers that score rows without the copy
+        self._subset_rows: Dict[frozenset, np.ndarray] = {}
+
+        if len(self.vectors) != len(self.identities):
+            raise ValueError(
+                f"Index has {len(self.vectors)} vectors but {len(self.identities)} identities"
+            )
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Sequence[float]]], model_name: str = "") -> "FaceIndex":
+        """Build an index from ``(identity_path, embedding)`` pairs."""
+        paths: List[str] = []
+        vectors: List[Sequence[float]] = []
+        for identity_path, embedding in records:
+            if embedding is None:
+                continue
+            paths.append(str(identity_path))
+            vectors.append(embedding)
+        if not vectors:
+            return cls(np.zeros((0, 0), dtype=np.float32), [], [], model_name=model_name)
+        identities = [identity_from_path(p) for p in paths]
+        return cls(np.asarray(vectors, dtype=np.float32), identities, paths, model_name=model_name)
+
+    def add(self, vectors: np.ndarray, identities: Sequence[str], paths: Optional[Sequence[str]] = None) -> "FaceIndex":
+        """Return a new index with ``vectors`` appended; the current index is left untouched."""
+        vectors = l2_normalize(vectors)
+        identities = list(identities)
+        paths = list(paths) if paths is not None else [""] * len(identities)
+        if len(self) == 0:
+            merged = vectors
+        else:
+            merged = np.concatenate([self.vectors, vectors], axis=0)
+        return FaceIndex(
+            merged,
+            list(self.identities) + identities,
+            list(self.paths) + paths,
+            model_name=self.model_name,
+            version=self.version + 1,
+        )
+
+    def remove_identity(self, identity: str) -> "FaceIndex":
+        """Return a new index without any rows belonging to ``identity``."""
+        keep = self.identities != identity
+        return FaceIndex(
+            self.vectors[keep],
+            self.identities[keep],
+            self.paths[keep],
+            model_name=self.model_name,
+            version=self.version + 1,
+        )
+
+    def count_identity(self, identity: str) -> int:
+        return int(np.count_nonzero(self.identities == identity))
+
+    def subset_rows(self, identities: Iterable[str]) -> np.ndarray:
+        """Rows belonging to ``identities`` (cached per roster like ``subset``, without reading any vectors)."""
+        key = frozenset(identities)
+        rows = self._subset_rows.get(key)
+        if rows is None:
+            rows = np.flatnonzero(np.isin(self.identities, list(key)))
+            if len(self._subset_rows) >= MAX_CACHED_SUBSETS:
+                self._subset_rows.pop(next(iter(self._subset_rows)))
+            self._subset_rows[key] = rows
+        return rows
+
+    def subset(self, identities: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows belonging to ``identities`` and a contiguous copy of their vectors.
+
+        Computed once per roster and cached on the index, so a section-scoped
+        query is a small matrix product over just that roster.
+        """
+        key = frozenset(identities)
+        cached = self._subsets.get(key)
+        if cached is None:
+            rows = self.subset_rows(key)
+            cached = (rows, np.ascontiguousarray(self.vectors[rows], dtype=np.float32))
+            if len(self._subsets) >= MAX_CACHED_SUBSETS:
+                self._subsets.pop(next(iter(self._subsets)))
+            self._subsets[key] = cached
+        return cached
+
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the ``k`` nearest rows to ``query``.
+
+        Returns:
+            Tuple of (row_indices, cosine_distances), both sorted by ascending distance
+        """
+        rows, distances = self.search_batch(query, k)
+        return rows[0], distances[0]
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        k: int = 5,
+        identities: Optional[Iterable[str]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the ``k`` nearest rows for every query row in one matrix product.
+
+        When ``identities`` is given only their rows are searched (see ``subset``).
+
+        Returns:
+            Tuple of (row_indices, cosine_distances) with shape (n_queries, k),
+            each row sorted by ascending distance
+        """
+        queries = l2_normalize(queries)
+        if identities is None:
+            rows, matrix = None, self.vectors
+        else:
+            rows, matrix = self.subset(identities)
+        if len(matrix) == 0:
+            empty = (len(queries), 0)
+            return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+
+        sims = queries @ matrix.T
+        k = max(1, min(int(k), sims.shape[1]))
+        if k < sims.shape[1]:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(sims.shape[1]), sims.shape).copy()
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return top, (1.0 - top_sims).astype(np.float32)
+
+
+class IVFSearcher:
+    """
+    Inverted-file approximate search over an index matrix (NumPy only).
+
+    ``search_batch`` has the same contract as ``FaceIndex.search_batch``; rows
+    that could not be filled (fewer than ``k`` candidates in the probed lists)
+    are -1 with an infinite distance.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        n_lists: int = 0,
+        n_probe: int = 8,
+        iterations: int = 10,
+        centroids: Optional[np.ndarray] = None,
+        trained_on: int = 0,
+        seed: int = 0,
+    ):
+        start = time.perf_counter()
+        self.vectors = vectors
+        count = int(vectors.shape[0])
+        if centroids is None:
+            n_lists = n_lists or max(1, int(4 * np.sqrt(count)))
+            centroids = self._train(vectors, min(n_lists, max(1, count)), iterations, seed)
+            trained_on = count
+        self.centroids = centroids
+        # Gallery size the centroids were trained on (reused centroids only reassign rows)
+        self.trained_on = trained_on or count
+        self.n_probe = max(1, min(int(n_probe), len(self.centroids)))
+
+        assignment = self._assign(vectors)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def _train(vectors: np.ndarray, n_lists: int, iterations: int, seed: int) -> np.ndarray:
+        """Spherical k-means on a sample of at most 64 rows per list."""
+        rng = np.random.default_rng(seed)
+        count = int(vectors.shape[0])
+        sample_size = min(count, 64 * n_lists)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = ~sums.any(axis=1)
+            # Re-seed empty lists from random sample rows
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = l2_normalize(sums)
+        return centroids
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        assignment = np.empty(int(vectors.shape[0]), dtype=np.int64)
+        for start in range(0, len(assignment), chunk):
+            block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+            assignment[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignment
+
+    def search_batch(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        queries = l2_normalize(queries)
+        k = max(1, int(k))
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        probes = np.argpartition(-(queries @ self.centroids.T), self.n_probe - 1, axis=1)[:, :self.n_probe]
+        for position, (query, probe) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.lists[list_id] for list_id in probe])
+            if not len(candidates):
+                continue
+            # Sorted rows keep the gather sequential (the matrix may be memory-mapped)
+            candidates = np.sort(candidates)
+            sims = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            take = min(k, len(candidates))
+            top = np.argpartition(-sims, take - 1)[:take] if take < len(candidates) else np.arange(len(candidates))
+            top = top[np.argsort(-sims[top], kind="stable")]
+            rows[position, :take] = candidates[top]
+            distances[position, :take] = 1.0 - sims[top]
+        return rows, distances
+
+    def stats(self) -> dict:
+        return {"n_lists": self.n_lists, "n_probe": self.n_probe, "trained_on": self.trained_on, "build_ms": round(self.build_ms, 1)}
+
+
+def measure_recall(index: FaceIndex, searcher, queries: np.ndarray, k: int = 5) -> float:
+    """
+    Fraction of the exact top-``k`` rows that ``searcher`` also returns (recall@k).
+
+    The exact side scans all of ``index``; for a memory-mapped gallery pass a
+    small in-memory ``sample_index`` and a searcher over it instead.
+    """
+    if len(index) == 0 or len(queries) == 0:
+        return 1.0
+    exact_rows, _ = index.search_batch(queries, k)
+    approx_rows, _ = searcher.search_batch(queries, k)
+    found = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_rows, approx_rows))
+    return found / float(exact_rows.size)
+
+
+# Compact storage modes for QuantizedSearcher. float16 is not offered: NumPy
+# widens it to float32 slowly, so it was both slower and larger than int8.
+STORAGE_MODES = ("int8",)
+
+
+def sample_index(index: FaceIndex, rows: int, seed: int = 0) -> FaceIndex:
+    """In-memory copy of up to ``rows`` random rows of ``index`` (reads only those rows)."""
+    picked = np.sort(np.random.default_rng(seed).choice(len(index), min(rows, len(index)), replace=False))
+    return FaceIndex(
+        np.asarray(index.vectors[picked], dtype=np.float32),
+        index.identities[picked],
+        index.paths[picked],
+        model_name=index.model_name,
+        normalized=True,
+    )
+
+
+class QuantizedSearcher:
+    """
+    Search over an int8 copy of an index matrix, re-ranked exactly.
+
+    Every row is scored on an ``int8`` copy with one scale per row (4x smaller
+    than float32). The best ``rerank`` rows per query are then scored again
+    against the full-precision ``vectors``; those are normally the
+    memory-mapped embedding store, so once built, searches only page in
+    shortlisted rows. Building reads every float32 row, so the smaller
+    footprint only shows once the kernel has evicted those pages. Scoring
+    widens each block back to float32, so it is not faster than the exact
+    scan. Returned distances are exact, so thresholds keep their meaning; a
+    result only changes when the true neighbour misses the shortlist. Same
+    contract as ``FaceIndex.search_batch``, plus ``rows`` to search a subset
+    (a roster) without touching the other rows.
+    """
+
+    def __init__(self, vectors: np.ndarray, mode: str = "int8", rerank: int = 32, chunk_rows: int = 1024):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode: {mode}; expected one of {', '.join(STORAGE_MODES)}")
+        start = time.perf_counter()
+        self.vectors = vectors
+        self.mode = mode
+        self.rerank = max(1, int(rerank))
+        self.chunk_rows = max(1, int(chunk_rows))
+        count = int(vectors.shape[0])
+        dim = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+        self.codes = np.empty((count, dim), dtype=np.int8)
+        self.scales = np.empty(count, dtype=np.float32)
+        for offset in range(0, count, self.chunk_rows):
+            block = np.asarray(vectors[offset:offset + self.chunk_rows], dtype=np.float32)
+            scale = np.abs(block).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.codes[offset:offset + len(block)] = np.rint(block / scale[:, np.newaxis])
+            self.scales[offset:offset + len(block)] = scale
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def approximate_similarities(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity of every (normalized) query to every row (or to ``rows``), from the int8 copy."""
+        count = len(self.codes) if rows is None else len(rows)
+        sims = np.empty((len(queries), count), dtype=np.float32)
+        for offset in range(0, count, self.chunk_rows):
+            part = slice(offset, offset + self.chunk_rows) if rows is None else rows[offset:offset + self.chunk_rows]
+            # Widen one cache-sized block at a time; BLAS has no int8 product
+            block = self.codes[part].astype(np.float32)
+            sims[:, offset:offset + len(block)] = queries @ block.T
+            sims[:, offset:offset + len(block)] *= self.scales[part]
+        return sims
+
+    def search_batch(
+        self, queries: np.ndarray, k: int = 5, rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        queries = l2_normalize(queries)
+        count = len(self.codes) if rows is None else len(rows)
+        if count == 0:
+            empty = (len(queries), 0)
+            return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+        k = max(1, min(int(k), count))
+        shortlist = min(count, max(k, self.rerank))
+        sims = self.approximate_similarities(queries, rows)
+        if shortlist < count:
+            candidates = np.argpartition(-sims, shortlist - 1, axis=1)[:, :shortlist]
+        else:
+            candidates = np.broadcast_to(np.arange(count), sims.shape)
+        if rows is not None:
+            candidates = rows[candidates]
+
+        rows = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        for position, (query, shortlisted) in enumerate(zip(queries, candidates)):
+            # Sorted rows keep the gather sequential (the matrix may be memory-mapped)
+            shortlisted = np.sort(shortlisted)
+            exact = np.asarray(self.vectors[shortlisted], dtype=np.float32) @ query
+            top = np.argpartition(-exact, k - 1)[:k] if k < len(shortlisted) else np.arange(len(shortlisted))
+            top = top[np.argsort(-exact[top], kind="stable")]
+            rows[position] = shortlisted[top]
+            distances[position] = 1.0 - exact[top]
+        return rows, distances
+
+    def stats(self) -> dict:
+        full_bytes = int(self.codes.size) * 4
+        return {
+            "storage": self.mode,
+            "rerank": self.rerank,
+            "bytes": self.nbytes,
+            "float32_bytes": full_bytes,
+            "memory_ratio": round(full_bytes / self.nbytes, 2) if self.nbytes else None,
+            "build_ms": round(self.build_ms, 1),
+        }
+
+
+def _accepted_top1(index: FaceIndex, rows: np.ndarray, distances: np.ndarray, threshold: float) -> List[Optional[str]]:
+    return [
+        str(index.identities[r[0]]) if len(r) and r[0] >= 0 and d[0] <= threshold else None
+        for r, d in zip(rows, distances)
+    ]
+
+
+def compare_storage(
+    index: FaceIndex,
+    queries: np.ndarray,
+    threshold: float,
+    k: int = 5,
+    modes: Sequence[str] = STORAGE_MODES,
+    rerank: int = 32,
+    repeats: int = 3,
+) -> Dict[str, dict]:
+    """
+    Compare compact storage modes against the exact float32 scan on ``queries``.
+
+    For each mode: memory of the scanned copy, best-of-``repeats`` batch search
+    time and speedup (below 1: the int8 scan is slower than float32), recall@k, and how many queries' accepted top-1 identity
+    (nearest row within ``threshold``, else no match) differs from exact search.
+    """
+    def timed(search) -> Tuple[float, Tuple[np.ndarray, np.ndarray]]:
+        best, result = float("inf"), None
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            result = search(queries, k)
+            best = min(best, (time.perf_counter() - start) * 1000)
+        return best, result
+
+    exact_ms, (exact_rows, exact_distances) = timed(index.search_batch)
+    exact_top1 = _accepted_top1(index, exact_rows, exact_distances, threshold)
+    report: Dict[str, dict] = {
+        "float32": {"bytes": int(len(index)) * index.dim * 4, "search_ms": round(exact_ms, 3)},
+    }
+    for mode in modes:
+        searcher = QuantizedSearcher(index.vectors, mode, rerank=rerank)
+        search_ms, (rows, distances) = timed(searcher.search_batch)
+        changed = sum(a != b for a, b in zip(exact_top1, _accepted_top1(index, rows, distances, threshold)))
+        found = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_rows, rows))
+        report[mode] = {
+            **searcher.stats(),
+            "search_ms": round(search_ms, 3),
+            "speedup": round(exact_ms / search_ms, 2) if search_ms > 0 else None,
+            f"recall_at_{k}": round(found / float(exact_rows.size), 4) if exact_rows.size else 1.0,
+            "top1_changed": int(changed),
+            "top1_changed_rate": round(changed / len(queries), 4) if len(queries) else 0.0,
+        }
+    return report
+
+
+# Prototype compaction: the normalized mean only, or up to N centroids chosen by spread
+PROTOTYPE_MODES = ("mean", "auto")
+
+
+class PrototypeSearcher:
+    """
+    Two-stage search over per-student prototypes.
+
+    Each student's rows are compacted into prototypes: the normalized mean, or
+    (``auto``) the fewest spherical k-means centroids, up to ``max_prototypes``,
+    that bring the mean distance of their photos to the nearest centroid under
+    ``spread``. Photos far from the student's mean (beyond ``outlier_distance``
+    and ``outlier_mads`` median absolute deviations) are dropped first.
+
+    A query scans the prototypes, keeps the ``expand`` closest students and
+    scores their remaining per-image rows exactly, so a student with twenty
+    photos costs the same as one with two until they are shortlisted. Same
+    contract as ``IVFSearcher.search_batch`` (unfilled slots are -1 / inf);
+    dropped outlier rows are never returned.
+
+    Passing the searcher built for the previous version of the gallery as
+    ``previous`` makes the rebuild incremental: students whose photo vectors
+    are byte-for-byte unchanged keep their prototypes and outlier mask, so an
+    enrollment only costs the students it touched.
+    """
+
+    def __init__(
+        self,
+        index: FaceIndex,
+        mode: str = "auto",
+        max_prototypes: int = 3,
+        spread: float = 0.2,
+        expand: int = 5,
+        outlier_distance: float = 0.4,
+        outlier_mads: float = 3.0,
+        seed: int = 0,
+        previous: Optional["PrototypeSearcher"] = None,
+    ):
+        if mode not in PROTOTYPE_MODES:
+            raise ValueError(f"Unknown prototype mode: {mode}; expected one of {', '.join(PROTOTYPE_MODES)}")
+        start = time.perf_counter()
+        self.index = index
+        self.mode = mode
+        self.max_prototypes = max(1, int(max_prototypes))
+        self.spread = spread
+        self.expand = max(1, int(expand))
+        self.outlier_distance = outlier_distance
+        self.outlier_mads = outlier_mads
+        self.seed = seed
+
+        names, owner = np.unique(index.identities.astype(str), return_inverse=True)
+        order = np.argsort(owner, kind="stable")
+        bounds = np.searchsorted(owner[order], np.arange(len(names) + 1))
+        self.students = names
+        # Inlier rows per student (ascending, so the stage-2 gather stays sequential)
+        self.student_rows: List[np.ndarray] = []
+        # Digest of each student's vectors and their inlier mask, for the next incremental rebuild
+        self.digests: List[bytes] = []
+        self.inlier_masks: List[np.ndarray] = []
+        prototypes: List[np.ndarray] = []
+        starts: List[int] = []
+        self.outliers_dropped = 0
+        self.reused = 0
+        reusable = self._reusable(previous)
+        total = 0
+        for student, name in enumerate(names):
+            rows = order[bounds[student]:bounds[student + 1]]
+            vectors = np.asarray(index.vectors[rows], dtype=np.float32)
+            digest = hashlib.blake2b(vectors.tobytes(), digest_size=16).digest()
+            earlier = reusable.get(name)
+            if earlier is not None and previous.digests[earlier] == digest:
+                keep = previous.inlier_masks[earlier]
+                student_prototypes = previous.prototypes[previous.starts[earlier]:previous.ends[earlier]]
+                self.reused += 1
+            else:
+                keep = self._inliers(vectors)
+                student_prototypes = self._prototypes(vectors[keep])
+            self.outliers_dropped += int(len(rows) - keep.sum())
+            self.student_rows.append(rows[keep])
+            self.digests.append(digest)
+            self.inlier_masks.append(keep)
+            starts.append(total)
+            prototypes.append(student_prototypes)
+            total += len(student_prototypes)
+        self.prototypes = np.concatenate(prototypes) if prototypes else np.zeros((0, index.dim), dtype=np.float32)
+        # Prototypes are stored student by student; these are each student's first prototype
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.append(self.starts, len(self.prototypes))[1:].astype(np.int64)
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    def _reusable(self, previous: Optional["PrototypeSearcher"]) -> Dict[str, int]:
+        """Student name -> position in ``previous``, when it was built with the same settings."""
+        if previous is None or previous.prototypes.shape[1:] != (self.index.dim,):
+            return {}
+        settings = ("mode", "max_prototypes", "spread", "outlier_distance", "outlier_mads", "seed")
+        if any(getattr(previous, name) != getattr(self, name) for name in settings):
+            return {}
+        return {str(name): position for position, name in enumerate(previous.students)}
+
+    def _inliers(self, vectors: np.ndarray) -> np.ndarray:
+        """Mask of rows close enough to the student's mean (everything for fewer than 3 photos)."""
+        if len(vectors) < 3:
+            return np.ones(len(vectors), dtype=bool)
+        distances = 1.0 - vectors @ l2_normalize(vectors.mean(axis=0))[0]
+        median = float(np.median(distances))
+        mad = 1.4826 * float(np.median(np.abs(distances - median)))
+        return distances <= max(self.outlier_distance, median + self.outlier_mads * mad)
+
+    def _prototypes(self, vectors: np.ndarray) -> np.ndarray:
+        centroids = l2_normalize(vectors.mean(axis=0))
+        if self.mode == "mean":
+            return centroids
+        for k in range(1, min(self.max_prototypes, len(vectors)) + 1):
+            if k > 1:
+                centroids = IVFSearcher._train(vectors, k, iterations=10, seed=self.seed)
+            if float(np.mean(1.0 - np.max(vectors @ centroids.T, axis=1))) <= self.spread:
+                break
+        return centroids
+
+    def search_batch(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        queries = l2_normalize(queries)
+        k = max(1, int(k))
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        if not len(self.prototypes):
+            return rows, distances
+
+        # Best prototype per student, for every query at once
+        student_sims = np.maximum.reduceat(queries @ self.prototypes.T, self.starts, axis=1)
+        take = min(self.expand, len(self.students))
+        shortlists = np.argpartition(-student_sims, take - 1, axis=1)[:, :take]
+        for position, (query, shortlist) in enumerate(zip(queries, shortlists)):
+            candidates = np.sort(np.concatenate([self.student_rows[student] for student in shortlist]))
+            if not len(candidates):
+                continue
+            sims = np.asarray(self.index.vectors[candidates], dtype=np.float32) @ query
+            count = min(k, len(candidates))
+            top = np.argpartition(-sims, count - 1)[:count] if count < len(candidates) else np.arange(len(candidates))
+            top = top[np.argsort(-sims[top], kind="stable")]
+            rows[position, :count] = candidates[top]
+            distances[position, :count] = 1.0 - sims[top]
+        return rows, distances
+
+    def stats(self) -> dict:
+        return {
+            "prototypes": self.mode,
+            "students": len(self.students),
+            "prototype_rows": len(self.prototypes),
+            "rows": len(self.index),
+            "outliers_dropped": self.outliers_dropped,
+            "reused_students": self.reused,
+            "expand": self.expand,
+            "build_ms": round(self.build_ms, 1),
+        }
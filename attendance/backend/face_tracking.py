@@ -0,0 +1,233 @@
+"""
+Per-device face tracks for kiosk cameras.
+
+A kiosk sends many nearly identical frames of the same student. Faces are
+associated across a device's frames by bounding-box IoU; while a track is
+young and its confidence has not decayed, its last match is reused instead of
+running the embedding model again. Unrecognized faces are never cached, so a
+student turning towards the camera is re-embedded on the next frame.
+
+Box overlap alone cannot tell two students apart when one steps into the
+spot the other just left, so a track is only reused while the face still
+looks like the crop it was embedded from (a 16x16 color thumbnail, compared
+by mean absolute difference), and a frame without any detected face ends all
+of the device's tracks.
+
+Device state is bounded: devices idle longer than ``device_ttl`` are dropped
+and at most ``max_devices`` are kept (least recently used evicted first).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+# A face's candidate list as produced by match_embeddings: [(person_name, distance), ...]
+Matches = List[Tuple[str, float]]
+
+# Side of the thumbnail used as a face's appearance signature
+SIGNATURE_SIDE = 16
+
+
+def bbox_iou(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Intersection over union of two {x, y, w, h} boxes."""
+    ax, ay, aw, ah = (float(a.get(key, 0)) for key in ('x', 'y', 'w', 'h'))
+    bx, by, bw, bh = (float(b.get(key, 0)) for key in ('x', 'y', 'w', 'h'))
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def appearance_signature(crop: np.ndarray) -> np.ndarray:
+    """Cheap appearance fingerprint of a face crop: a float32 16x16 thumbnail scaled to [0, 1]."""
+    thumb = cv2.resize(crop, (SIGNATURE_SIDE, SIGNATURE_SIDE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # DeepFace crops are already in [0, 1]; 8-bit images are scaled down to match
+    return thumb / 255.0 if crop.dtype == np.uint8 else thumb
+
+
+def appearance_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two signatures (0 identical, 1 opposite)."""
+    if a.shape != b.shape:
+        return 1.0
+    return float(np.mean(np.abs(a - b)))
+
+
+class Track:
+    """One face followed across a device's frames."""
+
+    __slots__ = ('bbox', 'signature', 'matches', 'confidence', 'context', 'embedded_at', 'last_seen', 'reuses')
+
+    def __init__(self, bbox: Dict[str, Any], signature: np.ndarray, matches: Matches, context: Hashable, now: float):
+        self.bbox = bbox
+        # Appearance when the match was computed; never updated on reuse, so drift cannot accumulate
+        self.signature = signature
+        self.matches = matches
+        self.confidence = min(1.0, max(0.0, 1.0 - min(distance for _, distance in matches)))
+        self.context = context
+        self.embedded_at = now
+        self.last_seen = now
+        self.reuses = 0
+
+
+class TrackRegistry:
+    """
+    Face tracks for every device, with LRU/TTL eviction and hit-rate counters.
+
+    ``context`` identifies what a cached match is valid for (index version,
+    threshold, roster); a track recorded under another context is never reused.
+    ``max_appearance_diff`` is the largest appearance_distance at which a face
+    still counts as the track's face.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.5,
+        max_appearance_diff: float = 0.08,
+        max_age: float = 2.0,
+        decay: float = 0.9,
+        min_confidence: float = 0.35,
+        max_devices: int = 256,
+        device_ttl: float = 300.0
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_appearance_diff = max_appearance_diff
+        self.max_age = max_age
+        self.decay = decay
+        self.min_confidence = min_confidence
+        self.max_devices = max(1, max_devices)
+        self.device_ttl = device_ttl
+        self._devices: "OrderedDict[str, Tuple[List[Track], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.appearance_mismatches = 0
+        self.resets = 0
+
+    def _evict(self, now: float) -> None:
+        while self._devices:
+            device_id, (_, last_used) = next(iter(self._devices.items()))
+            if len(self._devices) <= self.max_devices and now - last_used <= self.device_ttl:
+                break
+            del self._devices[device_id]
+            self.evictions += 1
+
+    def _usable(self, track: Track, context: Hashable, now: float) -> bool:
+        if track.context != context or now - track.embedded_at > self.max_age:
+            return False
+        return track.confidence * (self.decay ** (track.reuses + 1)) >= self.min_confidence
+
+    def forget(self, device_id: str) -> None:
+        """End every track of ``device_id`` (the camera saw no face, so whoever was there has left)."""
+        with self._lock:
+            if self._devices.pop(device_id, None) is not None:
+                self.resets += 1
+
+    def lookup(
+        self,
+        device_id: str,
+        boxes: Sequence[Dict[str, Any]],
+        signatures: Sequence[np.ndarray],
+        context: Hashable
+    ) -> List[Optional[Matches]]:
+        """
+        Cached matches for each detected face box, or None where it must be embedded.
+
+        Each track serves at most one face per call (highest IoU first), and only
+        when the face's appearance signature is close to the track's. A call with
+        no boxes ends the device's tracks.
+        """
+        if not boxes:
+            self.forget(device_id)
+            return []
+        now = time.monotonic()
+        results: List[Optional[Matches]] = [None] * len(boxes)
+        with self._lock:
+            entry = self._devices.get(device_id)
+            tracks = entry[0] if entry else []
+            pairs = sorted(
+                ((bbox_iou(box, track.bbox), position, track_idx)
+                 for position, box in enumerate(boxes)
+                 for track_idx, track in enumerate(tracks)),
+                reverse=True
+            )
+            used = set()
+            for iou, position, track_idx in pairs:
+                if iou < self.iou_threshold:
+                    break
+                if results[position] is not None or track_idx in used:
+                    continue
+                track = tracks[track_idx]
+                if not self._usable(track, context, now):
+                    continue
+                if appearance_distance(signatures[position], track.signature) > self.max_appearance_diff:
+                    self.appearance_mismatches += 1
+                    continue
+                used.add(track_idx)
+                track.bbox = boxes[position]
+                track.last_seen = now
+                track.reuses += 1
+                results[position] = track.matches
+
+            hits = sum(r is not None for r in results)
+            self.hits += hits
+            self.misses += len(boxes) - hits
+            if entry is not None:
+                self._devices[device_id] = (tracks, now)
+                self._devices.move_to_end(device_id)
+        return results
+
+    def record(
+        self,
+        device_id: str,
+        boxes: Sequence[Dict[str, Any]],
+        signatures: Sequence[np.ndarray],
+        matches: Sequence[Matches],
+        context: Hashable
+    ) -> None:
+        """Start (or restart) tracks for freshly embedded faces that matched someone."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._devices.get(device_id)
+            # Tracks not seen within max_age have left the frame
+            tracks = [t for t in (entry[0] if entry else []) if now - t.last_seen <= self.max_age]
+            for box, signature, face_matches in zip(boxes, signatures, matches):
+                tracks = [t for t in tracks if bbox_iou(box, t.bbox) < self.iou_threshold]
+                if face_matches:
+                    tracks.append(Track(box, signature, list(face_matches), context, now))
+            self._devices[device_id] = (tracks, now)
+            self._devices.move_to_end(device_id)
+            self._evict(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'devices': len(self._devices),
+                'tracks': sum(len(tracks) for tracks, _ in self._devices.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'appearance_mismatches': self.appearance_mismatches,
+                'resets': self.resets
+            }
+
+
+def combine_track_stats(stats: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum ``TrackRegistry.stats()`` of several processes (devices are pinned to one process each)."""
+    combined = {key: sum(entry[key] for entry in stats) for key in (
+        'devices', 'tracks', 'hits', 'misses', 'evictions', 'appearance_mismatches', 'resets'
+    )}
+    total = combined['hits'] + combined['misses']
+    combined['hit_rate'] = round(combined['hits'] / total, 4) if total else 0.0
+    combined['processes'] = len(stats)
+    return combined
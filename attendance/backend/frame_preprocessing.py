@@ -0,0 +1,171 @@
+"""
+Allocation-free frame preprocessing.
+
+The low-light path (grayscale, histogram equalization, CLAHE, back to 3
+channels) used to build a new CLAHE object and several full-frame arrays per
+call. ``PreprocessEngine`` keeps one CLAHE instance and one set of scratch
+buffers per thread and writes every OpenCV stage into them with ``dst=``, so a
+steady stream of same-sized frames allocates nothing.
+
+In adaptive mode the engine first measures luminance and contrast on a small
+thumbnail and picks a path per frame: pass-through for well-lit frames,
+CLAHE on the L channel of LAB (color preserved) for flat frames, and the full
+grayscale low-light path only for dark ones. Per-path counts show the mix.
+
+Buffers returned by ``enhance`` without an explicit ``out``, and the batch
+returned by ``resize_batch``, belong to the calling thread and are
+overwritten by its next call; callers that keep the result must pass their
+own ``out`` (or copy it).
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+# Stages in the order they run; any subset may be enabled
+STAGES = ('equalize', 'clahe')
+
+# Adaptive paths
+PASSTHROUGH = 'passthrough'
+CLAHE_COLOR = 'clahe_color'
+LOW_LIGHT = 'low_light'
+# Fixed-stage mode reports every frame under this path
+FIXED = 'fixed'
+
+
+def parse_stages(spec: str) -> Tuple[str, ...]:
+    """Parse a comma-separated stage list such as "equalize,clahe" ("" or "none" disables preprocessing)."""
+    requested = {part.strip().lower() for part in (spec or '').split(',') if part.strip()} - {'none'}
+    unknown = requested - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown preprocessing stage(s): {', '.join(sorted(unknown))}; expected {', '.join(STAGES)}")
+    return tuple(stage for stage in STAGES if stage in requested)
+
+
+class PreprocessEngine:
+    """Low-light enhancement and resizing into reusable per-thread buffers."""
+
+    def __init__(
+        self,
+        stages: Sequence[str] = STAGES,
+        clip_limit: float = 2.0,
+        tile_grid: Tuple[int, int] = (8, 8),
+        adaptive: bool = False,
+        low_light_mean: float = 70.0,
+        low_contrast_std: float = 35.0
+    ):
+        self.stages = tuple(stage for stage in STAGES if stage in set(stages))
+        self.clip_limit = clip_limit
+        self.tile_grid = tile_grid
+        self.adaptive = adaptive
+        self.low_light_mean = low_light_mean
+        self.low_contrast_std = low_contrast_std
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+        self.path_counts: Dict[str, int] = {}
+
+    def clahe(self):
+        """This thread's CLAHE instance (cv2.CLAHE is not safe to share across threads)."""
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=self.tile_grid)
+            self._local.clahe = clahe
+        return clahe
+
+    def buffer(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """This thread's scratch buffer ``name``, reallocated only when the frame shape changes."""
+        buffers: Optional[Dict[str, np.ndarray]] = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != shape:
+            buf = buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    def choose_path(self, frame_bgr: np.ndarray) -> str:
+        """Pick the adaptive path from mean and spread of a 64x48 grayscale thumbnail."""
+        thumb = cv2.resize(frame_bgr, (64, 48), interpolation=cv2.INTER_AREA)
+        mean, std = cv2.meanStdDev(cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY))
+        if float(mean[0][0]) < self.low_light_mean:
+            return LOW_LIGHT
+        if float(std[0][0]) < self.low_contrast_std:
+            return CLAHE_COLOR
+        return PASSTHROUGH
+
+    def enhance(self, frame_bgr: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Enhance a BGR frame and return a 3-channel result.
+
+        With no stages enabled (or the pass-through path) the frame is returned
+        unchanged (no copy). ``out`` may be ``frame_bgr`` itself to enhance in place.
+        """
+        return self.enhance_with_path(frame_bgr, out)[0]
+
+    def enhance_with_path(self, frame_bgr: np.ndarray, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, str]:
+        """``enhance`` that also returns the path taken, for per-request logging."""
+        if frame_bgr is None or frame_bgr.size == 0:
+            return frame_bgr, PASSTHROUGH
+        path = self.choose_path(frame_bgr) if self.adaptive else FIXED
+        with self._count_lock:
+            self.path_counts[path] = self.path_counts.get(path, 0) + 1
+
+        if path == CLAHE_COLOR:
+            return self._clahe_color(frame_bgr, out), path
+        if path == PASSTHROUGH or (path == FIXED and not self.stages):
+            return frame_bgr, path
+        # Low light always gets the full path, whatever the fixed stages are
+        return self._low_light(frame_bgr, out, STAGES if path == LOW_LIGHT else self.stages), path
+
+    def _clahe_color(self, frame_bgr: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+        """CLAHE on the L channel of LAB, so the colors the model was trained on survive."""
+        height, width = frame_bgr.shape[:2]
+        lab = self.buffer('lab', (height, width, 3))
+        lightness = self.buffer('lightness', (height, width))
+        enhanced = self.buffer('clahe', (height, width))
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2LAB, dst=lab)
+        cv2.extractChannel(lab, 0, dst=lightness)
+        self.clahe().apply(lightness, dst=enhanced)
+        cv2.insertChannel(enhanced, lab, 0)
+        if out is None:
+            out = self.buffer('out', (height, width, 3))
+        cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=out)
+        return out
+
+    def _low_light(self, frame_bgr: np.ndarray, out: Optional[np.ndarray], stages: Sequence[str]) -> np.ndarray:
+        height, width = frame_bgr.shape[:2]
+        gray = self.buffer('gray', (height, width))
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY, dst=gray)
+        if 'equalize' in stages:
+            cv2.equalizeHist(gray, dst=gray)
+        if 'clahe' in stages:
+            enhanced = self.buffer('clahe', (height, width))
+            self.clahe().apply(gray, dst=enhanced)
+            gray = enhanced
+
+        if out is None:
+            out = self.buffer('out', (height, width, 3))
+        cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
+        return out
+
+    def resize_batch(self, frames: Sequence[np.ndarray], width: int, height: int) -> np.ndarray:
+        """
+        Resize N frames straight into this thread's contiguous (N, height, width, 3) uint8 batch.
+
+        The buffer grows to the largest burst seen at this size and is reused, so
+        a thread resizing same-sized bursts allocates nothing.
+        """
+        batch = getattr(self._local, 'batch', None)
+        if batch is None or len(batch) < len(frames) or batch.shape[1:3] != (height, width):
+            batch = self._local.batch = np.empty((max(1, len(frames)), height, width, 3), dtype=np.uint8)
+        batch = batch[:len(frames)]
+        for position, frame in enumerate(frames):
+            cv2.resize(frame, (width, height), dst=batch[position], interpolation=cv2.INTER_AREA)
+        return batch
+
+    def stats(self) -> Dict[str, object]:
+        with self._count_lock:
+            counts = dict(self.path_counts)
+        return {'adaptive': self.adaptive, 'stages': list(self.stages), 'paths': counts}
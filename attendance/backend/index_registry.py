@@ -0,0 +1,171 @@
+"""
+Registry of resident galleries: one embedding index per dataset folder.
+
+Every endpoint accepts its own ``db_path``, so the service is effectively
+multi-tenant. Galleries are keyed by (absolute db_path, model, detector), so a
+model switch never serves vectors from another embedding space. Each gallery
+is loaded once on first use and shared by every request. When the combined
+size of the resident matrices exceeds the memory budget, the least recently
+used galleries are evicted (pinned ones never are).
+
+Each entry remembers a stamp of what it was loaded from (supplied by the
+caller, e.g. the dataset directory's mtime and the store's version pointer).
+``is_stale`` compares it with the current stamp at most once every
+``check_interval`` seconds per gallery, so the hot path stays a dict lookup
+and the occasional ``stat``.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from face_index import FaceIndex
+
+# (absolute db_path, model, detector)
+GalleryKey = Tuple[str, str, str]
+
+
+class Gallery:
+    """One resident index and what it was loaded from."""
+
+    __slots__ = ('index', 'stamp', 'loaded_at', 'last_used', 'checked_at', 'hits')
+
+    def __init__(self, index: FaceIndex, stamp: Hashable, now: float):
+        self.index = index
+        self.stamp = stamp
+        self.loaded_at = now
+        self.last_used = now
+        self.checked_at = now
+        self.hits = 0
+
+    @property
+    def nbytes(self) -> int:
+        return int(getattr(self.index.vectors, 'nbytes', 0))
+
+
+class IndexRegistry:
+    """Thread-safe LRU of galleries under a memory budget, with stamp-based refresh."""
+
+    def __init__(
+        self,
+        stamp_fn: Callable[[GalleryKey], Hashable],
+        memory_budget_bytes: int,
+        check_interval: float = 2.0,
+        pinned: Iterable[GalleryKey] = (),
+        on_evict: Optional[Callable[[GalleryKey], None]] = None
+    ):
+        self.stamp_fn = stamp_fn
+        self.memory_budget_bytes = max(0, memory_budget_bytes)
+        self.check_interval = check_interval
+        self.pinned = set(pinned)
+        self.on_evict = on_evict
+        self._galleries: "OrderedDict[GalleryKey, Gallery]" = OrderedDict()
+        # Last published version per gallery, kept across evictions so versions only grow
+        self._versions: Dict[GalleryKey, int] = {}
+        self._load_locks: Dict[GalleryKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def load_lock(self, key: GalleryKey) -> threading.Lock:
+        """Per-gallery lock so concurrent first requests load a gallery only once."""
+        with self._lock:
+            lock = self._load_locks.get(key)
+            if lock is None:
+                lock = self._load_locks[key] = threading.Lock()
+            return lock
+
+    def get(self, key: GalleryKey) -> Optional[FaceIndex]:
+        """The resident index for ``key`` (marking it recently used), or None."""
+        with self._lock:
+            gallery = self._galleries.get(key)
+            if gallery is None:
+                return None
+            self._galleries.move_to_end(key)
+            gallery.last_used = time.monotonic()
+            gallery.hits += 1
+            return gallery.index
+
+    def peek(self, key: GalleryKey) -> Optional[FaceIndex]:
+        """The resident index for ``key`` without touching its recency."""
+        gallery = self._galleries.get(key)
+        return gallery.index if gallery is not None else None
+
+    def is_stale(self, key: GalleryKey) -> bool:
+        """True when the gallery's source changed since it was loaded (checked at most every ``check_interval``)."""
+        now = time.monotonic()
+        with self._lock:
+            gallery = self._galleries.get(key)
+            if gallery is None or now - gallery.checked_at < self.check_interval:
+                return False
+            gallery.checked_at = now
+            stamp = gallery.stamp
+        return self.stamp_fn(key) != stamp
+
+    def publish(self, key: GalleryKey, index: FaceIndex) -> FaceIndex:
+        """
+        Make ``index`` the resident gallery for ``key`` and evict others over budget.
+
+        The version is bumped past any previously published one, so caches keyed
+        on it never confuse the new index with an older one.
+        """
+        stamp = self.stamp_fn(key)
+        evicted: List[GalleryKey] = []
+        with self._lock:
+            previous_version = self._versions.get(key)
+            if previous_version is not None and index.version <= previous_version:
+                index.version = previous_version + 1
+            self._versions[key] = index.version
+            if key in self._galleries:
+                self.refreshes += 1
+            else:
+                self.loads += 1
+            self._galleries[key] = Gallery(index, stamp, time.monotonic())
+            self._galleries.move_to_end(key)
+
+            total = sum(gallery.nbytes for gallery in self._galleries.values())
+            for candidate in list(self._galleries):
+                if total <= self.memory_budget_bytes:
+                    break
+                if candidate == key or candidate in self.pinned:
+                    continue
+                total -= self._galleries.pop(candidate).nbytes
+                evicted.append(candidate)
+            self.evictions += len(evicted)
+
+        for candidate in evicted:
+            if self.on_evict is not None:
+                self.on_evict(candidate)
+        return index
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            galleries = [
+                {
+                    'db_path': key[0],
+                    'model': key[1],
+                    'detector': key[2],
+                    'vectors': len(gallery.index),
+                    'dim': gallery.index.dim,
+                    'version': gallery.index.version,
+                    'bytes': gallery.nbytes,
+                    'pinned': key in self.pinned,
+                    'hits': gallery.hits,
+                    'age_sec': round(now - gallery.loaded_at, 1),
+                    'idle_sec': round(now - gallery.last_used, 1)
+                }
+                for key, gallery in reversed(self._galleries.items())
+            ]
+            return {
+                'resident': len(galleries),
+                'bytes': sum(g['bytes'] for g in galleries),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'loads': self.loads,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+                'galleries': galleries
+            }
@@ -0,0 +1,155 @@
+"""
+Lightweight in-process metrics for the recognition service.
+
+Histograms use fixed bucket bounds and a lock around two integer updates,
+so observing a value on the hot path costs a bisect and an increment.
+Gauges are callbacks evaluated only when metrics are scraped. A worker
+process ships its histograms to the parent with ``drain`` and ``merge``.
+``render_prometheus`` writes everything in the Prometheus text format.
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Millisecond buckets suited to queue waits and model stages
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Batch-size buckets for the embedding coalescer
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Cosine-distance buckets, dense around the usual thresholds
+DISTANCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.9, 1.0, 1.25)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics: ``le`` upper bounds plus +Inf)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += value
+
+    def drain(self) -> Tuple[List[int], float]:
+        """Per-bucket counts and sum observed since the last drain, then reset (for shipping to another process)."""
+        with self._lock:
+            counts, total = self._counts, self._sum
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+        return counts, total
+
+    def merge(self, counts: Sequence[int], total: float) -> None:
+        """Add observations drained from the same histogram in another process."""
+        if len(counts) != len(self._counts):
+            raise ValueError(f"Bucket mismatch merging into {self.name}")
+        with self._lock:
+            for position, count in enumerate(counts):
+                self._counts[position] += count
+            self._sum += total
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        buckets = {str(bound): cumulative[i] for i, bound in enumerate(self.buckets)}
+        buckets["+Inf"] = cumulative[-1]
+        return {"count": cumulative[-1], "sum": total, "buckets": buckets}
+
+
+class Counter:
+    """Monotonic counter, optionally split by the values of one label."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str = "", amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge:
+    """Point-in-time value read from ``fn`` at scrape time (None = not available)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Optional[float]]):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+
+    def value(self) -> Optional[float]:
+        try:
+            value = self.fn()
+        except Exception:
+            return None
+        return None if value is None else float(value)
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_prometheus(metrics: Iterable[Any]) -> str:
+    """Render histograms, counters and gauges in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in metrics:
+        if metric is None:
+            continue
+        if metric.kind == "gauge":
+            value = metric.value()
+            if value is None:
+                continue
+            lines += [f"# HELP {metric.name} {metric.help_text}", f"# TYPE {metric.name} gauge",
+                      f"{metric.name} {_format(value)}"]
+        elif metric.kind == "counter":
+            lines += [f"# HELP {metric.name} {metric.help_text}", f"# TYPE {metric.name} counter"]
+            for label_value, count in sorted(metric.snapshot().items()):
+                labels = f'{{{metric.label}="{label_value}"}}' if metric.label else ""
+                lines.append(f"{metric.name}{labels} {_format(count)}")
+        else:
+            snap = metric.snapshot()
+            lines += [f"# HELP {metric.name} {metric.help_text}", f"# TYPE {metric.name} histogram"]
+            for bound, count in snap["buckets"].items():
+                lines.append(f'{metric.name}_bucket{{le="{bound}"}} {count}')
+            lines += [f"{metric.name}_sum {_format(snap['sum'])}", f"{metric.name}_count {snap['count']}"]
+    return "\n".join(lines) + "\n"
+
+
+def process_memory_bytes() -> Optional[int]:
+    """Resident set size of this process, when the platform exposes it."""
+    try:
+        import psutil  # type: ignore
+        return int(psutil.Process().memory_info().rss)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
@@ -0,0 +1,160 @@
+"""
+Streaming recognition channel for kiosk cameras.
+
+A kiosk keeps one WebSocket open instead of POSTing every frame to /match.
+Binary messages are encoded frames (JPEG/PNG); text messages are JSON option
+updates such as ``{"threshold": 0.6}``. Every processed frame is answered with
+a JSON result carrying the frame's sequence number.
+
+Each connection processes at most one frame at a time. Frames that arrive
+while the previous one is still being recognized are dropped rather than
+queued, so result latency stays bounded by one recognition pass no matter how
+fast the device captures.
+
+Runs its own asyncio loop on a background thread (the WSGI server cannot
+upgrade connections), so it works the same under waitress and the Flask
+development server. Requires the optional ``websockets`` package.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from recognition_metrics import LATENCY_MS_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+def _request_path(connection) -> str:
+    """Request path of a connection (websockets >= 13 exposes it on ``request``)."""
+    request = getattr(connection, 'request', None)
+    return getattr(request, 'path', None) or getattr(connection, 'path', '/') or '/'
+
+
+class RecognitionStreamServer:
+    """
+    WebSocket server that recognizes frames as they stream in.
+
+    ``recognize_fn(frame_bytes, options)`` is called on a worker thread for
+    every frame that is not dropped and must return a JSON-serializable dict.
+    """
+
+    def __init__(
+        self,
+        recognize_fn: Callable[[bytes, Dict[str, Any]], Dict[str, Any]],
+        host: str,
+        port: int,
+        max_connections: int = 16,
+        max_frame_bytes: int = 4 * 1024 * 1024
+    ):
+        self.recognize_fn = recognize_fn
+        self.host = host
+        self.port = port
+        self.max_connections = max(1, max_connections)
+        self.max_frame_bytes = max_frame_bytes
+        # One recognition in flight per connection, so this never queues behind other kiosks
+        self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix='stream-recognize')
+        self._thread: Optional[threading.Thread] = None
+        self._count_lock = threading.Lock()
+        self.connections = 0
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.latency_ms = Histogram('df_stream_latency_ms', 'Streamed frame recognition latency (ms)', LATENCY_MS_BUCKETS)
+
+    def start(self) -> bool:
+        """Start serving on a daemon thread; False when ``websockets`` is not installed."""
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            logger.warning("websockets not installed; streaming recognition is disabled (pip install websockets)")
+            return False
+        self._thread = threading.Thread(target=self._serve_forever, name='recognition-stream', daemon=True)
+        self._thread.start()
+        return True
+
+    def _serve_forever(self) -> None:
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            logger.error(f"Streaming recognition server stopped: {e}")
+
+    async def _serve(self) -> None:
+        import websockets
+        async with websockets.serve(self._handle, self.host, self.port, max_size=self.max_frame_bytes):
+            logger.info(f"Streaming recognition listening on ws://{self.host}:{self.port}/stream")
+            await asyncio.Future()
+
+    def _count(self, field: str, delta: int = 1) -> None:
+        with self._count_lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    async def _handle(self, connection, path: Optional[str] = None) -> None:
+        if self.connections >= self.max_connections:
+            await connection.close(code=1013, reason='Too many streaming clients')
+            return
+        options: Dict[str, Any] = dict(parse_qsl(urlsplit(path or _request_path(connection)).query))
+        # One connection is one camera, so its frames share face tracks
+        options.setdefault('device_id', f"ws-{id(connection):x}")
+        self._count('connections')
+        pending: Optional[asyncio.Future] = None
+        received = 0
+        dropped = 0
+        try:
+            await connection.send(json.dumps({'type': 'ready', 'options': options}))
+            async for message in connection:
+                if isinstance(message, str):
+                    try:
+                        update = json.loads(message)
+                    except ValueError:
+                        update = None
+                    if isinstance(update, dict):
+                        options.update(update)
+                    continue
+
+                received += 1
+                self._count('frames_received')
+                if pending is not None and not pending.done():
+                    # Still busy with the previous frame: drop instead of queueing
+                    dropped += 1
+                    self._count('frames_dropped')
+                    continue
+                pending = asyncio.ensure_future(
+                    self._recognize(connection, received, message, dict(options), dropped)
+                )
+        except Exception as e:
+            logger.info(f"Streaming client disconnected: {e}")
+        finally:
+            self._count('connections', -1)
+            if pending is not None:
+                pending.cancel()
+
+    async def _recognize(self, connection, seq: int, frame_bytes: bytes, options: Dict[str, Any], dropped: int) -> None:
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, self.recognize_fn, frame_bytes, options)
+        except Exception as e:
+            logger.error(f"Streaming recognition failed: {e}")
+            result = {'success': False, 'status': 'error', 'message': 'Recognition processing failed'}
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.latency_ms.observe(latency_ms)
+        self._count('frames_processed')
+        result.update({'type': 'result', 'seq': seq, 'dropped': dropped, 'latency_ms': round(latency_ms, 1)})
+        await connection.send(json.dumps(result))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'port': self.port,
+            'connections': self.connections,
+            'frames_received': self.frames_received,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.frames_dropped,
+            'latency_ms': self.latency_ms.snapshot()
+        }
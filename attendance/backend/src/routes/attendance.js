@@ -75,9 +75,23 @@ router.post('/scan', upload.single('file'), async (req, res) => {
     }
     const result = await recognizeWithPython(frames);
     const nowIso = new Date().toISOString();
+    if (result.status === 'busy') {
+      if (result.retry_after !== undefined) res.set('Retry-After', String(Math.max(1, Math.ceil(result.retry_after))));
+      return res.json({
+        studentId: null,
+        name: null,
+        subject,
+        timestamp: nowIso,
+        status: 'busy',
+        message: result.message || 'Recognition service busy, retry shortly',
+        retryAfter: result.retry_after ?? null
+      });
+    }
     if (result.status !== 'success' || !result.student_id) {
+      // The quality gate reports a structured reason ("Frame rejected: no_face"); older replies only say it in the message
       const msg = String(result?.message || '').toLowerCase();
-      const status = msg.includes('no faces detected') || msg.includes('no face') ? 'no_face' : 'not recognized';
+      const noFace = result.reason === 'no_face' || msg.includes('no_face') || msg.includes('no face');
+      const status = noFace ? 'no_face' : 'not recognized';
       return res.json({
         studentId: null,
         name: null,
@@ -448,6 +462,17 @@ router.post('/checkin', upload.array('files', 10), async (req, res) => {
     const result = await processFramesConsensus(frames, 2, 0.48);
     console.log(`[DEBUG] /checkin result:`, result);
     
+    if (result.status === 'busy') {
+      console.warn(`[WARN] /checkin recognition busy: ${result.reason || result.message}`);
+      if (result.retry_after !== undefined) res.set('Retry-After', String(Math.max(1, Math.ceil(result.retry_after))));
+      return res.status(200).json({
+        success: false,
+        message: result.message || 'Recognition service busy, retry shortly',
+        status: 'busy',
+        retry_after: result.retry_after ?? null
+      });
+    }
+
     if (result.status !== 'success') {
       console.warn(`[WARN] /checkin no match: ${result.message}`);
       return res.status(200).json({ 
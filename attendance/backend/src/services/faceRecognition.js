@@ -14,6 +14,13 @@ const USE_PYTHON_FACE = process.env.USE_PYTHON_FACE === '1';
 const PY_FACE_URL = process.env.PY_FACE_URL || 'http://127.0.0.1:5000/match';
 // Explicit dataset path for the Python matcher (avoid relying on cwd)
 const PY_DB_PATH = process.env.DF_DB_PATH || path.join(__dirname, '..', '..', 'dataset');
+// Opt in to binary multipart uploads (skips base64 + JSON encoding of every frame)
+const PY_FACE_MULTIPART = process.env.PY_FACE_MULTIPART === '1';
+// Time budget per recognition (ms), sent as X-Deadline-Ms so the Python service
+// sheds a request it cannot start in time instead of answering after the student left
+const PY_FACE_DEADLINE_MS = Number(process.env.PY_FACE_DEADLINE_MS) || 8000;
+// How many times a "busy" answer is retried (after its Retry-After) while budget remains
+const PY_FACE_BUSY_RETRIES = Number(process.env.PY_FACE_BUSY_RETRIES ?? 1);
 
 // Lazy load face-api.js to avoid errors if not available
 let faceapi = null;
@@ -26,9 +33,41 @@ let modelsLoaded = false;
 let knownEncodings = [];
 let knownNames = [];
 
-async function postJsonDetailed(urlStr, bodyObj) {
+async function postJsonDetailed(urlStr, bodyObj, headers = {}) {
   const payload = JSON.stringify(bodyObj ?? {});
+  return postDetailed(urlStr, payload, 'application/json', headers);
+}
+
+// Send frames as multipart/form-data (one "images" part per frame) so the
+// Python service decodes raw JPEG bytes instead of base64 inside JSON.
+async function postMultipartDetailed(urlStr, framesBytes, fields = {}, headers = {}) {
+  const boundary = `----pyface${Date.now().toString(16)}${Math.random().toString(16).slice(2)}`;
+  const parts = [];
+  for (const [name, value] of Object.entries(fields)) {
+    if (value === undefined || value === null) continue;
+    parts.push(Buffer.from(
+      `--${boundary}\r\nContent-Disposition: form-data; name="${name}"\r\n\r\n${value}\r\n`
+    ));
+  }
+  framesBytes.forEach((frame, idx) => {
+    parts.push(Buffer.from(
+      `--${boundary}\r\nContent-Disposition: form-data; name="images"; filename="frame${idx}.jpg"\r\n` +
+      'Content-Type: image/jpeg\r\n\r\n'
+    ));
+    parts.push(Buffer.isBuffer(frame) ? frame : Buffer.from(frame));
+    parts.push(Buffer.from('\r\n'));
+  });
+  parts.push(Buffer.from(`--${boundary}--\r\n`));
+  return postDetailed(urlStr, Buffer.concat(parts), `multipart/form-data; boundary=${boundary}`, headers);
+}
+
+// Retry-After in seconds (delta-seconds form only; the Python service never sends a date)
+function parseRetryAfter(value) {
+  const seconds = Number(value);
+  return Number.isFinite(seconds) && seconds >= 0 ? seconds : undefined;
+}
 
+async function postDetailed(urlStr, payload, contentType, headers = {}) {
   // Prefer native fetch when available.
   if (typeof fetch === 'function') {
     const controller = new AbortController();
@@ -37,7 +76,7 @@ async function postJsonDetailed(urlStr, bodyObj) {
     try {
       const res = await fetch(urlStr, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { ...headers, 'Content-Type': contentType },
         body: payload,
         signal: controller.signal,
       });
@@ -53,7 +92,7 @@ async function postJsonDetailed(urlStr, bodyObj) {
           data = raw;
         }
       }
-      return { ok: res.ok, status: res.status, data, raw };
+      return { ok: res.ok, status: res.status, data, raw, retryAfter: parseRetryAfter(res.headers.get('retry-after')) };
     } catch (err) {
       clearTimeout(timeoutId);
       throw err;
@@ -72,7 +111,8 @@ async function postJsonDetailed(urlStr, bodyObj) {
         path: `${url.pathname}${url.search}`,
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
+          ...headers,
+          'Content-Type': contentType,
           'Content-Length': Buffer.byteLength(payload),
         },
         timeout: 70000, // 70 second timeout
@@ -89,7 +129,7 @@ async function postJsonDetailed(urlStr, bodyObj) {
           } catch {
             data = raw;
           }
-          resolve({ ok, status: res.statusCode || 0, data, raw });
+          resolve({ ok, status: res.statusCode || 0, data, raw, retryAfter: parseRetryAfter(res.headers['retry-after']) });
         });
       }
     );
@@ -105,23 +145,34 @@ async function postJsonDetailed(urlStr, bodyObj) {
 }
 
 async function callPythonRecognition(framesBytes) {
-  const images = framesBytes.map((b) => b.toString('base64'));
+  const images = PY_FACE_MULTIPART ? null : framesBytes.map((b) => b.toString('base64'));
+  const deadline = Date.now() + PY_FACE_DEADLINE_MS;
   const attemptOnce = async () => {
     const start = Date.now();
+    // Remaining budget, counted by the Python service from when it receives the request
+    const headers = { 'X-Deadline-Ms': String(Math.max(0, deadline - start)) };
     try {
-      console.log(`[INFO] Calling Python matcher: ${PY_FACE_URL} (db_path=${PY_DB_PATH})`);
-      const resp = await postJsonDetailed(PY_FACE_URL, {
-        images,
-        db_path: PY_DB_PATH,
-      });
+      console.log(`[INFO] Calling Python matcher: ${PY_FACE_URL} (db_path=${PY_DB_PATH}, multipart=${PY_FACE_MULTIPART})`);
+      const resp = PY_FACE_MULTIPART
+        ? await postMultipartDetailed(PY_FACE_URL, framesBytes, { db_path: PY_DB_PATH }, headers)
+        : await postJsonDetailed(PY_FACE_URL, {
+          images,
+          db_path: PY_DB_PATH,
+        }, headers);
       const durMs = Date.now() - start;
       console.log(`[INFO] Python matcher completed in ${durMs} ms (status=${resp?.status})`);
 
       // Python returns structured JSON even on non-2xx; preserve it.
       if (resp && typeof resp.data === 'object' && resp.data) {
+        if (resp.data.status === 'busy' && resp.data.retry_after === undefined) {
+          return { ...resp.data, retry_after: resp.retryAfter };
+        }
         return resp.data;
       }
 
+      if (resp.status === 503) {
+        return { status: 'busy', message: 'Face recognition busy, retry shortly', retry_after: resp.retryAfter };
+      }
       if (!resp.ok) {
         return { status: 'error', message: `python http ${resp.status}`, raw: resp.raw };
       }
@@ -133,24 +184,37 @@ async function callPythonRecognition(framesBytes) {
     }
   };
 
-  try {
-    return await attemptOnce();
-  } catch (err) {
-    // Simple one-time retry on transient errors
-    const msg = String(err?.message || '').toLowerCase();
-    if (err?.name === 'AbortError' || msg.includes('timeout') || msg.includes('econnreset') || msg.includes('reset')) {
-      console.log('[INFO] Retrying Python matcher once after transient error…');
-      await new Promise((r) => setTimeout(r, 500));
-      try {
-        return await attemptOnce();
-      } catch (err2) {
-        console.error('[ERROR] Python face service retry failed:', err2);
-        return { status: 'error', message: err2?.message || 'python service failed' };
+  const attemptWithRetry = async () => {
+    try {
+      return await attemptOnce();
+    } catch (err) {
+      // Simple one-time retry on transient errors
+      const msg = String(err?.message || '').toLowerCase();
+      if (err?.name === 'AbortError' || msg.includes('timeout') || msg.includes('econnreset') || msg.includes('reset')) {
+        console.log('[INFO] Retrying Python matcher once after transient error…');
+        await new Promise((r) => setTimeout(r, 500));
+        try {
+          return await attemptOnce();
+        } catch (err2) {
+          console.error('[ERROR] Python face service retry failed:', err2);
+          return { status: 'error', message: err2?.message || 'python service failed' };
+        }
       }
+      console.error('[ERROR] Python face service:', err);
+      return { status: 'error', message: err?.message || 'python service failed' };
     }
-    console.error('[ERROR] Python face service:', err);
-    return { status: 'error', message: err?.message || 'python service failed' };
+  };
+
+  let result = await attemptWithRetry();
+  // A shed request did no work: retry after the service's hint, but only while budget remains
+  for (let retry = 0; retry < PY_FACE_BUSY_RETRIES && result?.status === 'busy'; retry++) {
+    const waitMs = Math.max(0, Number(result.retry_after ?? 1)) * 1000;
+    if (Date.now() + waitMs >= deadline) break;
+    console.log(`[INFO] Python matcher busy (${result.reason || 'busy'}); retrying in ${waitMs} ms`);
+    await new Promise((r) => setTimeout(r, waitMs));
+    result = await attemptWithRetry();
   }
+  return result;
 }
 
 // Explicit Python recognition (used by the standalone biometric scan endpoint).
@@ -354,7 +418,21 @@ export async function processFramesConsensus(framesBytes, minFramesRequired = 2,
           is_suspicious: !!pyResult.is_suspicious
         };
       }
-      return { status: 'error', message: pyResult?.message || 'Face recognition not available (python)' };
+      if (pyResult?.status === 'busy') {
+        // Overloaded or still starting, not a failed recognition: the caller should retry
+        return {
+          status: 'busy',
+          message: pyResult.message || 'Face recognition busy, retry shortly',
+          reason: pyResult.reason,
+          retry_after: pyResult.retry_after
+        };
+      }
+      return {
+        status: 'error',
+        message: pyResult?.message || 'Face recognition not available (python)',
+        // Quality-gate reason code (no_face, too_dark, too_blurry, ...) for immediate kiosk feedback
+        reason: pyResult?.reason
+      };
     }
     
     if (!modelsLoaded || knownEncodings.length === 0) {
@@ -0,0 +1,330 @@
+"""
+Recognition benchmark and accuracy suite.
+
+Three modes, all printing one JSON document (compare it across commits):
+
+  embedding  Synthetic galleries built directly at the embedding layer: random
+             unit vectors per identity, jittered copies as gallery photos and
+             queries, plus impostor queries from unenrolled identities.
+             Measures index build time, per-query latency percentiles, batched
+             and concurrent throughput, top-1 accuracy and false accepts at the
+             threshold, for the exact, IVF, int8 and prototype backends
+             (use --per-identity > 2 to see what prototype compaction saves).
+
+  storage    Compact storage against a real embedding store: memory of the
+             int8 copy, search speedup over float32 (below 1 when slower),
+             recall and how many queries' top-1 identity at the threshold
+             changes. Queries are jittered gallery rows plus impostors.
+
+  http       End-to-end /match against a running service with a local image
+             set laid out like the dataset (<dir>/<student>/<image>); accuracy
+             is the share of images recognized as their folder name. Each
+             --repeat pass pads the uploads differently (after the image data,
+             so they decode the same) to keep the result cache from answering
+             them; the service's cache hits are reported either way.
+
+Examples:
+  python tools/benchmark_recognition.py embedding --sizes 100,10000,100000
+  python tools/benchmark_recognition.py storage --db-path dataset
+  python tools/benchmark_recognition.py http --images dataset --concurrency 4
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from face_index import (  # noqa: E402
+    STORAGE_MODES, FaceIndex, IVFSearcher, PrototypeSearcher, QuantizedSearcher, compare_storage, l2_normalize,
+    measure_recall
+)
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def percentiles(samples_ms) -> dict:
+    if not len(samples_ms):
+        return {}
+    values = np.percentile(np.asarray(samples_ms, dtype=np.float64), [50, 90, 95, 99])
+    return {"p50": round(values[0], 3), "p90": round(values[1], 3), "p95": round(values[2], 3),
+            "p99": round(values[3], 3), "max": round(float(np.max(samples_ms)), 3)}
+
+
+def jitter(centers: np.ndarray, amount: float, rng) -> np.ndarray:
+    """Unit vectors near ``centers``; ``amount`` is the noise norm relative to the unit center."""
+    noise = rng.standard_normal(centers.shape).astype(np.float32) * (amount / np.sqrt(centers.shape[1]))
+    return l2_normalize(centers + noise)
+
+
+def make_gallery(identities: int, per_identity: int, dim: int, amount: float, rng):
+    centers = l2_normalize(rng.standard_normal((identities, dim)).astype(np.float32))
+    owners = np.repeat(np.arange(identities), per_identity)
+    vectors = jitter(centers[owners], amount, rng)
+    return centers, FaceIndex(vectors, [f"student_{i}" for i in owners], normalized=True)
+
+
+def run_queries(search, queries: np.ndarray, k: int, concurrency: int, batch_size: int) -> dict:
+    """Latency per single query, batched throughput and concurrent single-query throughput."""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, distances = search(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append((rows[0], distances[0]))
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        search(queries[offset:offset + batch_size], k)
+    batched_qps = len(queries) / max(time.perf_counter() - start, 1e-9)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda q: search(q[np.newaxis, :], k), queries))
+    concurrent_qps = len(queries) / max(time.perf_counter() - start, 1e-9)
+
+    return {
+        "latency_ms": percentiles(latencies),
+        "batched_qps": round(batched_qps, 1),
+        "concurrent_qps": round(concurrent_qps, 1),
+        "results": results,
+    }
+
+
+def score(index: FaceIndex, results, expected, threshold: float) -> dict:
+    """Top-1 accuracy on genuine queries and false accepts on impostors (expected None)."""
+    correct = genuine = false_accepts = impostors = 0
+    for (rows, distances), truth in zip(results, expected):
+        accepted = len(rows) > 0 and rows[0] >= 0 and distances[0] <= threshold
+        name = str(index.identities[rows[0]]) if accepted else None
+        if truth is None:
+            impostors += 1
+            false_accepts += name is not None
+        else:
+            genuine += 1
+            correct += name == truth
+    return {
+        "top1_accuracy": round(correct / genuine, 4) if genuine else None,
+        "false_accept_rate": round(false_accepts / impostors, 4) if impostors else None,
+    }
+
+
+def bench_embedding(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    report = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        build_start = time.perf_counter()
+        centers, index = make_gallery(size, args.per_identity, args.dim, args.jitter, rng)
+        gallery_ms = (time.perf_counter() - build_start) * 1000
+
+        genuine_ids = rng.integers(0, size, args.queries)
+        impostor_count = int(args.queries * args.impostor_ratio)
+        impostors = l2_normalize(rng.standard_normal((impostor_count, args.dim)).astype(np.float32))
+        queries = np.concatenate([jitter(centers[genuine_ids], args.jitter, rng), jitter(impostors, args.jitter, rng)])
+        expected = [f"student_{i}" for i in genuine_ids] + [None] * impostor_count
+
+        entry = {"identities": size, "vectors": len(index), "gallery_build_ms": round(gallery_ms, 1), "backends": {}}
+        for backend in args.backends.split(","):
+            backend = backend.strip()
+            if backend == "exact":
+                search, build_ms, extra = index.search_batch, 0.0, {}
+            elif backend == "ivf":
+                searcher = IVFSearcher(index.vectors, n_lists=args.ivf_lists, n_probe=args.ivf_probe)
+                search, build_ms = searcher.search_batch, searcher.build_ms
+                extra = {**searcher.stats(), f"recall_at_{args.k}": round(measure_recall(index, searcher, queries, args.k), 4)}
+            elif backend in STORAGE_MODES:
+                searcher = QuantizedSearcher(index.vectors, backend, rerank=args.rerank)
+                search, build_ms = searcher.search_batch, searcher.build_ms
+                extra = {**searcher.stats(), f"recall_at_{args.k}": round(measure_recall(index, searcher, queries, args.k), 4)}
+            elif backend == "prototypes":
+                searcher = PrototypeSearcher(index, args.prototype_mode, expand=args.prototype_expand)
+                search, build_ms = searcher.search_batch, searcher.build_ms
+                extra = {**searcher.stats(), f"recall_at_{args.k}": round(measure_recall(index, searcher, queries, args.k), 4)}
+            else:
+                raise SystemExit(f"Unknown backend: {backend}")
+            measured = run_queries(search, queries, args.k, args.concurrency, args.batch_size)
+            entry["backends"][backend] = {
+                "build_ms": round(build_ms, 1),
+                **extra,
+                "latency_ms": measured["latency_ms"],
+                "batched_qps": measured["batched_qps"],
+                "concurrent_qps": measured["concurrent_qps"],
+                **score(index, measured["results"], expected, args.threshold),
+            }
+        report.append(entry)
+        print(f"[bench] {size} identities done", file=sys.stderr)
+    return {"galleries": report}
+
+
+def bench_storage(args) -> dict:
+    import deepface_scan
+
+    index = deepface_scan.open_stored_index(os.path.abspath(args.db_path))
+    if index is None or not len(index):
+        raise SystemExit(f"No embedding store for {args.db_path}; run tools/ingest_dataset.py first")
+    rng = np.random.default_rng(args.seed)
+    sample = np.sort(rng.choice(len(index), min(args.queries, len(index)), replace=False))
+    genuine = jitter(np.asarray(index.vectors[sample], dtype=np.float32), args.jitter, rng)
+    impostors = l2_normalize(rng.standard_normal((int(len(genuine) * args.impostor_ratio), index.dim)).astype(np.float32))
+    queries = np.concatenate([genuine, impostors])
+    return {
+        "store": deepface_scan.embedding_store.store_summary(deepface_scan.store_dir_for(os.path.abspath(args.db_path))),
+        "vectors": len(index),
+        "queries": len(queries),
+        "storage": compare_storage(index, queries, args.threshold, k=args.k, rerank=args.rerank),
+    }
+
+
+def list_images(image_dir: Path):
+    for person_dir in sorted(p for p in image_dir.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        for image in sorted(person_dir.iterdir()):
+            if image.suffix.lower() in IMAGE_EXTS:
+                yield person_dir.name, image
+
+
+def post_match(url: str, image: Path, threshold, padding: int = 0) -> dict:
+    """POST one image to /match; ``padding`` zero bytes after the image data make the upload unique."""
+    body = {"images": [base64.b64encode(image.read_bytes() + b"\0" * padding).decode("ascii")]}
+    if threshold is not None:
+        body["threshold"] = threshold
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=120) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as err:
+        return json.loads(err.read().decode("utf-8") or "{}")
+
+
+def result_cache_stats(match_url: str) -> dict:
+    """The service's result cache counters from /health (empty if unavailable)."""
+    health_url = match_url.rsplit("/", 1)[0] + "/health"
+    try:
+        with urllib.request.urlopen(health_url, timeout=30) as resp:
+            return json.loads(resp.read().decode("utf-8")).get("result_cache") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def bench_http(args) -> dict:
+    images = list(list_images(Path(args.images).resolve()))
+    if not images:
+        raise SystemExit(f"No images under {args.images}/<student>/")
+    # (truth, path, padding): repeat passes are padded unless they should hit the cache
+    images = [
+        (truth, path, 0 if args.cached_repeats else repeat)
+        for repeat in range(max(1, args.repeat)) for truth, path in images
+    ]
+
+    def one(item):
+        truth, path, padding = item
+        start = time.perf_counter()
+        try:
+            result = post_match(args.url, path, args.http_threshold, padding)
+        except Exception as err:
+            result = {"status": "error", "message": str(err)}
+        return truth, result, (time.perf_counter() - start) * 1000
+
+    cache_before = result_cache_stats(args.url)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(one, images))
+    elapsed = time.perf_counter() - start
+    cache_after = result_cache_stats(args.url)
+
+    statuses = {}
+    correct = 0
+    for truth, result, _ in outcomes:
+        status = result.get("status", "error")
+        statuses[status] = statuses.get(status, 0) + 1
+        correct += result.get("student_id") == truth
+    return {
+        "url": args.url,
+        "requests": len(outcomes),
+        "concurrency": args.concurrency,
+        "latency_ms": percentiles([ms for _, _, ms in outcomes]),
+        "throughput_rps": round(len(outcomes) / max(elapsed, 1e-9), 2),
+        "top1_accuracy": round(correct / len(outcomes), 4),
+        "statuses": statuses,
+        "repeats_cached": bool(args.cached_repeats),
+        "result_cache": {
+            counter: cache_after[counter] - cache_before[counter] for counter in ("hits", "misses")
+        } if "hits" in cache_before and "hits" in cache_after else None,
+    }
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    emb = sub.add_parser("embedding", parents=[common], help="Synthetic galleries at the embedding layer")
+    emb.add_argument("--sizes", default="100,10000", help="Comma-separated identity counts")
+    emb.add_argument("--per-identity", type=int, default=2, help="Gallery vectors per identity")
+    emb.add_argument("--dim", type=int, default=512)
+    emb.add_argument("--jitter", type=float, default=0.6, help="Noise norm of photos/queries around an identity")
+    emb.add_argument("--queries", type=int, default=1000)
+    emb.add_argument("--impostor-ratio", type=float, default=0.2, help="Unenrolled queries per genuine query")
+    emb.add_argument("--threshold", type=float, default=float(os.getenv("DF_COSINE_THRESHOLD", "0.68")))
+    emb.add_argument("--k", type=int, default=5)
+    emb.add_argument("--backends", default="exact,ivf", help="Any of exact,ivf,int8,prototypes")
+    emb.add_argument("--rerank", type=int, default=32, help="Rows re-scored exactly per query (int8)")
+    emb.add_argument("--prototype-mode", default="auto", choices=["mean", "auto"])
+    emb.add_argument("--prototype-expand", type=int, default=5, help="Students searched photo by photo per query")
+    emb.add_argument("--ivf-lists", type=int, default=0)
+    emb.add_argument("--ivf-probe", type=int, default=8)
+    emb.add_argument("--batch-size", type=int, default=64)
+    emb.add_argument("--concurrency", type=int, default=4)
+    emb.add_argument("--seed", type=int, default=0)
+
+    storage = sub.add_parser("storage", parents=[common], help="int8 storage against a real embedding store")
+    storage.add_argument("--db-path", default=os.getenv("DF_DB_PATH", str(ROOT / "dataset")))
+    storage.add_argument("--queries", type=int, default=1000)
+    storage.add_argument("--jitter", type=float, default=0.6)
+    storage.add_argument("--impostor-ratio", type=float, default=0.2)
+    storage.add_argument("--threshold", type=float, default=float(os.getenv("DF_COSINE_THRESHOLD", "0.68")))
+    storage.add_argument("--k", type=int, default=5)
+    storage.add_argument("--rerank", type=int, default=32)
+    storage.add_argument("--seed", type=int, default=0)
+
+    http = sub.add_parser("http", parents=[common], help="End-to-end /match against a running service")
+    http.add_argument("--url", default="http://127.0.0.1:5000/match")
+    http.add_argument("--images", default=str(ROOT / "dataset"), help="Directory laid out as <student>/<image>")
+    http.add_argument("--repeat", type=int, default=1, help="Passes over the image set")
+    http.add_argument("--cached-repeats", action="store_true",
+                      help="Send repeat passes byte-identical, so they measure the result cache")
+    http.add_argument("--concurrency", type=int, default=4)
+    http.add_argument("--threshold", dest="http_threshold", type=float, default=None)
+
+    args = parser.parse_args()
+    modes = {"embedding": bench_embedding, "storage": bench_storage, "http": bench_http}
+    results = modes[args.mode](args)
+    report = {"mode": args.mode, "commit": git_commit(), "timestamp": time.time(),
+              "params": {k: v for k, v in vars(args).items() if k != "output"}, **results}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
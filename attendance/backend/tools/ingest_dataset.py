@@ -0,0 +1,246 @@
+"""
+Offline dataset ingestion: embed dataset images in parallel and write the embedding store.
+
+Walks dataset/<student>/<image> (optionally importing flat known_faces/<Name>.jpg
+files first), hashes every image's content, and only embeds images that are
+new or changed since the last run. Byte-identical duplicates are skipped.
+Embedding runs in worker processes that each build the model once; the
+result is written directly as a new embedding store version, so the service
+never has to embed the dataset itself.
+
+A manifest next to the store remembers (size, mtime, sha1) per file, so a
+re-run only re-reads files whose size or mtime changed, and whether a face
+was found, so images without one are not embedded again until their content
+changes. No store version is written unless rows were added or dropped (the
+store's dataset fingerprint then stays as it was).
+
+Usage:
+    python tools/ingest_dataset.py [--db-path dataset] [--known-faces known_faces]
+                                   [--workers 4] [--chunk 16] [--force]
+
+A running service notices the new store version within DF_GALLERY_CHECK_SEC
+and maps it without re-embedding; POST /reload with {"remap": true} to switch
+immediately.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import embedding_store  # noqa: E402
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(store_dir: str) -> dict:
+    try:
+        with open(os.path.join(store_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(store_dir: str, files: dict) -> None:
+    os.makedirs(store_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"updated": time.time(), "files": files}, f)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST_FILE))
+
+
+def content_hash(path: str, manifest: dict, updated: dict) -> str:
+    """sha1 of ``path``, reusing the manifest entry when size and mtime are unchanged."""
+    st = os.stat(path)
+    entry = manifest.get(path)
+    if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        sha1 = entry["sha1"]
+    else:
+        sha1 = file_sha1(path)
+    updated[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": sha1}
+    if entry and entry.get("sha1") == sha1 and "face" in entry:
+        updated[path]["face"] = entry["face"]
+    return sha1
+
+
+def import_known_faces(known_dir: Path, db_path: str, known_hashes: set) -> int:
+    """Copy flat known_faces/<Name>.<ext> images into <db_path>/<Name>/ unless their content is already there."""
+    import deepface_scan
+
+    copied = 0
+    for image in sorted(known_dir.iterdir()) if known_dir.is_dir() else []:
+        if not image.is_file() or image.suffix.lower() not in embedding_store.IMAGE_EXTS:
+            continue
+        name = image.stem.capitalize()
+        if not deepface_scan.is_valid_student_name(name) or not any(c.isalpha() for c in name):
+            continue
+        sha1 = file_sha1(str(image))
+        if sha1 in known_hashes:
+            continue
+        person_dir = os.path.join(db_path, name)
+        os.makedirs(person_dir, exist_ok=True)
+        shutil.copy2(str(image), deepface_scan.next_image_path(person_dir, image.suffix.lower()))
+        known_hashes.add(sha1)
+        copied += 1
+    return copied
+
+
+def _init_worker() -> None:
+    import deepface_scan
+    deepface_scan.build_models()
+
+
+def embed_chunk(paths):
+    """Embed one chunk of image paths; returns (vectors, positions of paths that yielded a face)."""
+    import cv2
+    import deepface_scan
+
+    vectors, positions = deepface_scan.embed_enrollment_images([cv2.imread(p) for p in paths])
+    return np.asarray(vectors, dtype=np.float32), positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=os.getenv("DF_DB_PATH", str(ROOT / "dataset")))
+    parser.add_argument("--known-faces", help="Import flat <Name>.<ext> images from this directory first")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Embedding processes (0 = embed in this process)")
+    parser.add_argument("--chunk", type=int, default=16, help="Images per embedding batch")
+    parser.add_argument("--force", action="store_true", help="Re-embed every image")
+    args = parser.parse_args()
+
+    import deepface_scan
+
+    db_path = os.path.abspath(args.db_path)
+    store_dir = deepface_scan.store_dir_for(db_path)
+    manifest = load_manifest(store_dir)
+    updated = {}
+    start = time.perf_counter()
+
+    images = [(person, os.path.abspath(path)) for person, path in deepface_scan.list_dataset_images(db_path)]
+    hashes = [content_hash(path, manifest, updated) for _, path in images]
+    copied = 0
+    if args.known_faces:
+        copied = import_known_faces(Path(args.known_faces), db_path, set(hashes))
+        if copied:
+            images = [(person, os.path.abspath(path)) for person, path in deepface_scan.list_dataset_images(db_path)]
+            hashes = [content_hash(path, manifest, updated) for _, path in images]
+
+    stored = None if args.force else deepface_scan.open_stored_index(db_path)
+    stored_rows = {os.path.abspath(str(path)): row for row, path in enumerate(stored.paths)} if stored is not None else {}
+
+    keep_rows, keep_identities, keep_paths = [], [], []
+    to_embed = []  # (identity, path)
+    seen = {}
+    duplicates = 0
+    known_no_face = 0
+    for (person, path), sha1 in zip(images, hashes):
+        if sha1 in seen:
+            duplicates += 1
+            if seen[sha1][0] != person:
+                print(f"[WARN] {path} duplicates {seen[sha1][1]} (another student); skipped", file=sys.stderr)
+            continue
+        seen[sha1] = (person, path)
+        previous = manifest.get(path)
+        if path in stored_rows and previous and previous.get("sha1") == sha1:
+            keep_rows.append(stored_rows[path])
+            keep_identities.append(person)
+            keep_paths.append(path)
+        elif not args.force and previous and previous.get("sha1") == sha1 and previous.get("face") is False:
+            known_no_face += 1
+        else:
+            to_embed.append((person, path))
+    removed = len(stored_rows) - len(keep_rows)
+
+    print(f"[ingest] {len(images)} image(s): {len(keep_rows)} unchanged, {duplicates} duplicate(s), "
+          f"{known_no_face} without a face, {len(to_embed)} to embed, {removed} stored row(s) dropped", file=sys.stderr)
+
+    new_vectors, new_identities, new_paths = [], [], []
+    no_face = 0
+    embed_start = time.perf_counter()
+    chunks = [to_embed[i:i + args.chunk] for i in range(0, len(to_embed), args.chunk)]
+
+    def collect(chunk, vectors, positions):
+        nonlocal no_face
+        if len(positions):
+            new_vectors.append(vectors)
+        new_identities.extend(chunk[p][0] for p in positions)
+        new_paths.extend(chunk[p][1] for p in positions)
+        no_face += len(chunk) - len(positions)
+        found = set(positions)
+        for position, (_, path) in enumerate(chunk):
+            updated[path]["face"] = position in found
+        done = len(new_paths) + no_face
+        rate = done / max(time.perf_counter() - embed_start, 1e-9)
+        print(f"[ingest] embedded {done}/{len(to_embed)} ({rate:.1f} img/s)", file=sys.stderr)
+
+    if chunks and args.workers > 0:
+        import multiprocessing
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            futures = {pool.submit(embed_chunk, [p for _, p in chunk]): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                collect(futures[future], *future.result())
+    else:
+        for chunk in chunks:
+            collect(chunk, *embed_chunk([p for _, p in chunk]))
+    embed_sec = time.perf_counter() - embed_start
+
+    changed = bool(new_paths) or removed > 0 or stored is None
+    if changed:
+        parts = []
+        if keep_rows:
+            parts.append(np.asarray(stored.vectors[np.asarray(keep_rows)], dtype=np.float32))
+        parts += new_vectors
+        dim = parts[0].shape[1] if parts else 0
+        vectors = np.concatenate(parts, axis=0) if parts else np.zeros((0, dim), dtype=np.float32)
+        embedding_store.write_store(
+            store_dir,
+            vectors,
+            keep_identities + new_identities,
+            keep_paths + new_paths,
+            model=deepface_scan.MODEL_NAME,
+            detector=deepface_scan.DETECTOR_BACKEND,
+            fingerprint=embedding_store.dataset_fingerprint(db_path),
+        )
+    save_manifest(store_dir, updated)
+
+    summary = {
+        "db_path": db_path,
+        "store": embedding_store.store_summary(store_dir),
+        "scanned": len(images),
+        "imported_known_faces": copied,
+        "unchanged": len(keep_rows),
+        "duplicates": duplicates,
+        "embedded": len(new_paths),
+        "no_face": no_face,
+        "known_no_face": known_no_face,
+        "dropped": removed,
+        "embed_seconds": round(embed_sec, 2),
+        "images_per_second": round(len(to_embed) / embed_sec, 2) if embed_sec > 0 and to_embed else None,
+        "total_seconds": round(time.perf_counter() - start, 2),
+        "store_written": changed,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()